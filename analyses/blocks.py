@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+# modules from the std-library
+import os
+import re
+import marshal  # for the serialization of the blocks
+from array import array  # for the compact columns of the blocks
+
+
+# #################################################
+# external modules
+
+ # python-lxml module
+from lxml import etree
+
+
+# #################################################
+# config:
+__blocksfileextension = ".blocks"  # blocks of <file>.xml are kept in <file>.xml.blocks
+__blocksversion = 1                # increase on each change of the representation
+
+
+# #################################################
+# constants:
+
+# namespace-constant for src2srcml
+__cppnscpp = 'http://www.srcML.org/srcML/cpp'
+__cpprens = re.compile('{(.+)}(.+)')
+
+# conditionals - necessary for parsing the right tags
+__conditionals = ['if', 'ifdef', 'ifndef']
+__conditionals_elif = ['elif']
+__conditionals_else = ['else']
+__conditionals_endif = ['endif']
+__conditionals_all = __conditionals + __conditionals_elif + \
+                     __conditionals_else
+
+# the kinds of directives that start a block (kind ids index into this list)
+kinds = __conditionals_all
+
+
+##################################################
+# class ConditionalBlocks
+
+class ConditionalBlocks:
+    ''' The conditional blocks of a srcML file in parallel arrays, indexed by block
+    in document order. A block is a branch of an #if/#ifdef/#ifndef, #elif, or #else
+    directive that ends at the next branch or the #endif on the same level:
+        kind      - the directive (index into kinds)
+        start     - the line of the directive
+        end       - the line of the next branch or #endif (-1, if there is none)
+        depth     - the nesting depth (1 for top-level blocks)
+        parent    - the enclosing block (-1 for top-level blocks)
+        group     - the first block (#if) of the #if/#elif/#else chain of the block
+        signature - the expression of the directive (index into signatures)
+        path      - the tags enclosing the directive (index into paths)
+        lines     - the number of lines of the block (without its directive)
+    If the conditionals are unbalanced, the blocks up to the mismatch are kept
+    and balanced is False.'''
+
+    columns = ['kind', 'start', 'end', 'depth', 'parent', 'group', 'signature', 'path', 'lines']
+
+    def __init__(self):
+        for column in ConditionalBlocks.columns:
+            setattr(self, column, array('i'))
+        self.signatures = []  # interned expressions of the directives
+        self.paths = []       # interned tag paths
+        self.balanced = True
+
+    def __len__(self):
+        return len(self.kind)
+
+    def getKind(self, block):
+        return kinds[self.kind[block]]
+
+    def getSignature(self, block):
+        return self.signatures[self.signature[block]]
+
+    def getPath(self, block):
+        return self.paths[self.path[block]]
+
+
+##################################################
+# extraction
+
+
+def _getMacroSignature(ifdefnode):
+    """This function gets the signature of an ifdef or corresponding macro
+    out of the xml-element and its descendants (see the analyses)."""
+    # get either the expr or the name tag,
+    # which is always the second descendant
+    nexpr = []
+    res = ''
+    _, tag = __cpprens.match(ifdefnode.tag).groups()
+
+    if (tag in ['if', 'elif', 'ifdef', 'ifndef']):
+        nexpr = [itex for itex in ifdefnode.iterdescendants()]
+        if (len(nexpr) == 1):
+            res = nexpr[0].tail
+        else:
+            nexpr = nexpr[1]
+            res = ''.join([token for token in nexpr.itertext()])
+    return res
+
+
+def _buildBlocks(directives):
+    """This function returns the conditional blocks (see ConditionalBlocks)
+    for the given directives of a srcML file, given in document order as
+    (tag, line, expression, path of enclosing tags). The directives are
+    consumed up to the first mismatch only."""
+    blocks = ConditionalBlocks()
+    signatures = {}  # interned expressions: {<expression>: <id>}
+    paths = {}       # interned tag paths: {<path>: <id>}
+    stack = []       # the open #if/#elif/#else chains, each as list of blocks
+
+    def _intern(table, values, value):
+        if (value not in table):
+            table[value] = len(values)
+            values.append(value)
+        return table[value]
+
+    def _endBlock(block, line):
+        blocks.end[block] = line
+        blocks.lines[block] = line - blocks.start[block] - 1
+
+    for (tag, line, signature, path) in directives:
+
+        # finish the current branch or chain
+        if (tag not in __conditionals):
+            if (not stack):
+                blocks.balanced = False
+                break
+            _endBlock(stack[-1][-1], line)
+            if (tag in __conditionals_endif):
+                stack.pop()
+                continue
+
+        block = len(blocks)
+        if (tag in __conditionals):
+            parent = stack[-1][-1] if stack else -1
+            group = block
+            stack.append([block])
+        else:
+            parent = blocks.parent[stack[-1][-1]]
+            group = stack[-1][0]
+            stack[-1].append(block)
+
+        blocks.kind.append(kinds.index(tag))
+        blocks.start.append(line)
+        blocks.end.append(-1)
+        blocks.depth.append(len(stack))
+        blocks.parent.append(parent)
+        blocks.group.append(group)
+        blocks.signature.append(_intern(signatures, blocks.signatures, signature))
+        blocks.path.append(_intern(paths, blocks.paths, path))
+        blocks.lines.append(-1)
+
+    if (stack):
+        blocks.balanced = False
+
+    return blocks
+
+
+def extractBlocks(root):
+    """This function returns the conditional blocks (see ConditionalBlocks)
+    of the srcML tree with the given root. The directives are found by lxml
+    itself in a single pass over the tree."""
+    def _directives():
+        tags = ['{%s}%s' % (__cppnscpp, tag) for tag in __conditionals_all + __conditionals_endif]
+        for elem in root.iter(*tags):
+            _, tag = __cpprens.match(elem.tag).groups()
+            path = '/'.join(reversed([ancestor.tag.rpartition('}')[2]
+                                      for ancestor in elem.iterancestors()]))
+            yield (tag, elem.sourceline, _getMacroSignature(elem) or '', path)
+
+    return _buildBlocks(_directives())
+
+
+def extractBlocksFromFile(file):
+    """This function returns the conditional blocks of the given srcML file
+    as extractBlocks does, but without building its tree: the file is read
+    with iterparse and each element is dropped after its end tag (the
+    elements of a directive after the end tag of the directive), so that
+    the memory depends on the nesting depth of the file only. It returns
+    None, if the file cannot be parsed."""
+    def _directives():
+        tags = set(['{%s}%s' % (__cppnscpp, tag) for tag in __conditionals_all + __conditionals_endif])
+        path = []        # the tags enclosing the current element
+        indirective = 0  # number of open directives around the current element
+
+        for (event, elem) in etree.iterparse(file, events=("start", "end")):
+            if (event == "start"):
+                path.append(elem.tag.rpartition('}')[2])
+                if (elem.tag in tags):
+                    indirective += 1
+                continue
+
+            path.pop()
+            if (elem.tag in tags):
+                indirective -= 1
+                _, tag = __cpprens.match(elem.tag).groups()
+                yield (tag, elem.sourceline, _getMacroSignature(elem) or '', '/'.join(path))
+
+            # the expression of a directive is read at its end tag
+            if (indirective):
+                continue
+
+            # drop the element and its preceding siblings
+            elem.clear()
+            while (elem.getprevious() is not None):
+                del elem.getparent()[0]
+
+    try:
+        return _buildBlocks(_directives())
+    except etree.XMLSyntaxError:
+        return None
+
+
+##################################################
+# files without conditionals
+
+# the start tags of the conditionals in the text of a srcML file
+__conditionaltags = re.compile(r'<cpp:(?:%s)[\s/>]' % '|'.join(__conditionals_all + __conditionals_endif))
+
+
+def hasConditionals(root):
+    """This function checks whether the srcML tree with the given root
+    contains any conditional (#if, #ifdef, ..., #endif). The search is
+    done by lxml itself and, thus, much faster than walking the tree."""
+    tags = ['{%s}%s' % (__cppnscpp, tag) for tag in __conditionals_all + __conditionals_endif]
+    return next(root.iter(*tags), None) is not None
+
+
+def _getLastStartTag(data):
+    """This function returns the position of the last start tag in the
+    given XML text, i.e., of the last element in document order."""
+    pos = len(data)
+    while (True):
+        pos = data.rfind('<', 0, pos)
+        if (pos == -1 or data[pos + 1:pos + 2] not in ('/', '?', '!')):
+            return pos
+
+
+def _getDefines(data):
+    """This function returns the text of all #define directives
+    (cpp:define elements) in the given text of a srcML file."""
+    defines = []
+    end = 0
+    while (True):
+        start = data.find('<cpp:define', end)
+        if (start == -1):
+            return defines
+        end = data.find('</cpp:define>', start)
+        if (end == -1):
+            return defines
+        end += len('</cpp:define>')
+        if (data[start + len('<cpp:define')] in '> \t\r\n'):
+            defines.append(data[start:end])
+
+
+def readSkeleton(file):
+    """This function returns the skeleton of the given srcML file, if
+    the file contains no conditionals, or None otherwise (or if the file
+    cannot be scanned, e.g., if it is not formatted as srcML writes it).
+    The file is scanned as text, its tree is not built: the skeleton is the root of the file with its #define
+    directives only and, as the last element, an empty element on the
+    line of the last element of the file. This is all that the
+    analyses use of a file without conditionals (the features, the
+    defines, and the LOC), so that they give the same results for it."""
+    with open(file, 'rb') as fd:
+        data = fd.read()
+
+    if (__conditionaltags.search(data)):
+        return None
+
+    # only plain elements and text are scanned: comments, CDATA sections, document types, and
+    # processing instructions (besides the XML declaration) may hide or fake tags (srcML has none)
+    if ('<!' in data or data.count('<?') > (1 if data.startswith('<?xml') else 0)):
+        return None
+
+    # the root must be the only unit and bind the cpp namespace (if at all) to the prefix cpp
+    root = re.search(r'<(?![?!])[^>]*>', data)
+    if (root is None or root.group().endswith('/>') or not data.rstrip().endswith('</unit>')
+            or data.count('<unit') != 1
+            or data.count(__cppnscpp) != root.group().count('xmlns:cpp="%s"' % __cppnscpp)):
+        return None
+
+    # the #define directives keep their text (see _parseAndAddDefine of the analyses);
+    # the last element is moved to its line by line breaks, so that lxml counts its line
+    last = _getLastStartTag(data)
+    skeleton = data[root.start():root.end()] + ''.join(_getDefines(data))
+    if (last != root.start()):
+        breaks = data.count('\n', 0, last) - skeleton.count('\n')
+        if (breaks < 0):
+            return None
+        skeleton += '\n' * breaks + '<skeleton/>'
+    skeleton += '</unit>'
+
+    try:
+        return etree.fromstring(skeleton)
+    except etree.XMLSyntaxError:
+        return None
+
+
+##################################################
+# serialization
+
+
+def getBlocksFile(file):
+    """This function returns the path of the file that keeps the blocks
+    of the given srcML file."""
+    return file + __blocksfileextension
+
+
+def writeBlocks(file, blocks):
+    """This function writes the blocks of the given srcML file next to
+    it, together with the size and modification time of the srcML file."""
+    stat = os.stat(file)
+    data = (__blocksversion, stat.st_size, stat.st_mtime, blocks.balanced,
+            [getattr(blocks, column).tostring() for column in ConditionalBlocks.columns],
+            blocks.signatures, blocks.paths)
+
+    # write to a temporary file first, so that readers never see partial blocks
+    tmpfile = getBlocksFile(file) + ".tmp" + str(os.getpid())
+    try:
+        with open(tmpfile, 'wb') as fd:
+            marshal.dump(data, fd)
+        os.rename(tmpfile, getBlocksFile(file))
+    except (IOError, OSError):  # e.g., a read-only folder; the blocks are extracted again next time
+        if (os.path.exists(tmpfile)):
+            os.remove(tmpfile)
+
+
+def readBlocks(file):
+    """This function returns the blocks of the given srcML file or None,
+    if they have not been written yet or the srcML file has changed since."""
+    try:
+        with open(getBlocksFile(file), 'rb') as fd:
+            data = marshal.load(fd)
+        stat = os.stat(file)
+        if (data[:3] != (__blocksversion, stat.st_size, stat.st_mtime)):
+            return None
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+
+    blocks = ConditionalBlocks()
+    (_, _, _, blocks.balanced, columns, blocks.signatures, blocks.paths) = data
+    for (column, values) in zip(ConditionalBlocks.columns, columns):
+        getattr(blocks, column).fromstring(values)
+    return blocks
@@ -46,6 +46,8 @@ sys.path.append(os.path.abspath(__lib_subfolder))  # lib subfolder
 from enum import Enum
  # python-lxml module
 from lxml import etree
+# conditional blocks of srcML files
+from blocks import hasConditionals
  # statistics module
 from statlib import pstat
 # pyparsing module
@@ -293,9 +295,15 @@ def _prologCSV(folder):
 def _countNestedIfdefs(root):
     """This function counts the number of nested ifdefs (conditionals)
     within the source-file."""
+    if (not hasConditionals(root)):
+        return (0, 0, 0)
+
     cncur = 0
     cnlist = []
-    elements = [it for it in root.iterdescendants()]
+    # only the conditionals are needed, which are found by lxml itself
+    # (without creating an object for each node of the tree)
+    elements = root.iter(*['{%s}%s' % (__cppnscpp, tag)
+                           for tag in __conditionals + __conditionals_endif])
 
     for elem in elements:
         ns, tag = __cpprens.match(elem.tag).groups()
@@ -475,6 +483,13 @@ def _getFeatures(root):
     parend = False          # parse-endif-flag
     _ = 0                   # else and elif depth
 
+    # fast path: a file without conditionals has no features, only its
+    # defines are collected (in document order, as in the loop below)
+    if (not hasConditionals(root)):
+        for elem in root.iter(*['{%s}%s' % (__cppnscpp, tag) for tag in __macro_define]):
+            _parseAndAddDefine(elem)
+        return (features, featuresgrinner, featuresgrouter)
+
     # iterate over all tags separately <start>- and <end>-tag
     for event, elem in etree.iterwalk(root, events=("start", "end")):
         ns, tag = __cpprens.match(elem.tag).groups()
@@ -994,22 +1009,64 @@ def resetModule() :
     __defsetf = dict()      # macro-objects per file
 
 
-def apply(folder):
-    """This function applies the analysis to all xml-files in that
-    directory and take the results and joins them together. Results
-    are getting written into the fdcsv-file."""
-    # overall status variables
+def getFiles(folder):
+    """This function returns the xml-files of the folder in the
+    order in which they are analyzed."""
+    return returnFileNames(folder, ['.xml'])
+
+
+def parseFile(file):
+    """This function returns the root of the parsed xml-file or
+    None, if the file cannot be parsed."""
+    try:
+        return etree.parse(file).getroot()
+    except etree.XMLSyntaxError:
+        return None
+
+
+def analyzeFile(file, root, options=None):
+    """This function analyzes a single xml-file, given by the root
+    of its tree (None, if the file cannot be parsed). It returns the
+    features of the file (with their parsed signatures) or None, if
+    the file cannot be parsed (a file with an ifdef-endif mismatch is
+    counted as parsed, but contributes no features). The result
+    depends on this file only, so that the files can be analyzed in
+    any order (or process)."""
+    global __curfile
     resetModule()
+    __curfile = file
+
+    if root is None:
+        print("ERROR: cannot parse (%s). Skipping this file." %
+            file)
+        return None
 
+    try:
+        (features, _, featuresgrouter) = _getFeatures(root)
+    except IfdefEndifMismatchError:
+        print("ERROR: ifdef-endif mismatch in file (%s)" %
+            file)
+        return []
+
+    # parse the signatures of the features
+    fsigs = []
+    for (sig, (depth, code)) in features.iteritems():
+        (mal, psig) = _parseFeatureSignature(sig)
+        fsigs.append((sig, mal, psig, depth, code))
+    return fsigs
+
+
+def mergeResults(folder, results, options=None):
+    """This function takes the results of all files, given as list
+    of (file, result of analyzeFile), and joins them together.
+    Results are getting written into the output file."""
     sigmap = {}                # {<converted sig>: [<equivalent sigs>]}
     afeatures = {}            # identified features; {<sig>: ([flag], depth, [code])}
 
-    def _mergeFeatures(ffeatures):
+    def _mergeFeatures(fsigs):
         """This function merges the, with the parameter given
-        dictionary (ffeatures) to the afeatures (overall-features)."""
-        for (sig, (depth, code)) in ffeatures.iteritems():
-            (mal, psig) = _parseFeatureSignature(sig)
-
+        features (fsigs) to the afeatures (overall-features)."""
+        for (sig, mal, psig, depth, code) in fsigs:
             try:
                 sigmatch = _checkForEquivalentSig(sigmap.keys(), psig)
                 (tmpflag, tmpdepth, tmpcode) = \
@@ -1025,38 +1082,16 @@ def apply(folder):
                 afeatures[sig] = (mal, depth, list(code))
                 sigmap[psig] = [sig]
 
-    # outputfile
-    # fd, fdcsv = _prologCSV(folder)
+    ftotal = len(results)
 
-    global __curfile
-    fcount = 0
-    files = returnFileNames(folder, ['.xml'])
-    fstats = [None]*len(__statsorder)
-    ftotal = len(files)
-
-    # get statistics for all files; write results into csv
-    # and merge the features
-    for file in files:
-        __curfile = file
-        fcount += 1
-        try:
-            tree = etree.parse(file)
-        except etree.XMLSyntaxError:
-            print("ERROR: cannot parse (%s). Skipping this file." %
-                os.path.join(folder, file))
+    # merge the features of all files
+    for (fcount, (file, fsigs)) in enumerate(results, 1):
+        if fsigs is None:
             continue
 
         print('INFO: parsing file (%5d) of (%5d) -- (%s).' %
             (fcount, ftotal, os.path.join(folder, file)))
-
-        root = tree.getroot()
-        try:
-            (features, _, featuresgrouter) = _getFeatures(root)
-        except IfdefEndifMismatchError:
-            print("ERROR: ifdef-endif mismatch in file (%s)" %
-                (os.path.join(folder, file)))
-            continue
-        _mergeFeatures(features)
+        _mergeFeatures(fsigs)
 
     # filter annotations that do not have any c-code
     # filter annotations with less than 2 features
@@ -1085,6 +1120,14 @@ def apply(folder):
     fd.close()
 
 
+def apply(folder, options=None):
+    """This function applies the analysis to all xml-files in that
+    directory and take the results and joins them together. Results
+    are getting written into the output file."""
+    results = [(file, analyzeFile(file, parseFile(file), options)) for file in getFiles(folder)]
+    mergeResults(folder, results, options)
+
+
 # ##################################################
 # add command line options
 
@@ -76,10 +76,22 @@ class DisciplinedAnnotations:
     outputfile = "cppstats_discipline.csv"
     ##################################################
 
-    def __init__(self, folder, options):
+    # the counters of the analysis (summed up over all files)
+    counters = ['overallblocks', 'disciplined', 'undisciplinedknown', 'undisciplinedunknown',
+                'compilationunit', 'functiontype', 'siblings', 'wrapperif', 'wrapperfor',
+                'wrapperwhile', 'conditionalcase', 'conditionalelif', 'parameter', 'expression', 'loc']
+
+    def __init__(self, folder, options, check=True):
+        '''Checks all files of the folder; with check=False, only the counters are initialized
+        (e.g., for checking single files, see analyzeFile).'''
 
         self.opts = options
-        self.opts.dir = os.path.abspath(folder)
+        if folder:
+            self.opts.dir = os.path.abspath(folder)
+
+        self.__initCounters__()
+        if not check:
+            return
 
         print self.opts.dir
 
@@ -87,6 +99,9 @@ class DisciplinedAnnotations:
             oparser.print_help()
             sys.exit(-1)
 
+        self.checkFiles()
+
+    def __initCounters__(self):
         self.overallblocks = 0
         self.disciplined = 0
         self.undisciplinedknown = 0
@@ -102,13 +117,23 @@ class DisciplinedAnnotations:
         self.parameter = 0
         self.expression = 0
         self.loc = 0
-        self.checkFiles()
+
+    def addCounters(self, other):
+        '''adds the counters of other (e.g., the ones of a single file) to the counters of this analysis'''
+        for counter in DisciplinedAnnotations.counters:
+            setattr(self, counter, getattr(self, counter) + getattr(other, counter))
 
     def __getIfdefAnnotations__(self, root):
         '''This method returns all nodes of the xml which are ifdef
         annotations in the source code.'''
         treeifdefs = list()
 
+        # fast path: no conditionals at all (the search is done by lxml itself)
+        tags = ['{%s}%s' % (DisciplinedAnnotations.__cppnscpp, tag)
+                for tag in DisciplinedAnnotations.__conditionals]
+        if next(root.iter(*tags), None) is None:
+            return treeifdefs
+
         for _, elem in etree.iterwalk(root):
             ns, tag = DisciplinedAnnotations.__cpprens.match(elem.tag).\
                     groups()
@@ -610,16 +635,18 @@ class DisciplinedAnnotations:
     def checkFile(self, file):
         try:
             tree = etree.parse(file)
-            f = open(file, 'r')
         except etree.XMLSyntaxError:
             print('ERROR: file (%s) is not valid. Skipping it.' % file)
             return
 
+        self.checkTree(file, tree.getroot())
+
+    def checkTree(self, file, root):
         # get LOC
-        self.loc += len(f.readlines())-2;
+        with open(file, 'r') as f:
+            self.loc += len(f.readlines())-2;
 
-        # get root of the xml and iterate over it
-        root = tree.getroot()
+        # iterate over the root of the xml
         treeifdefs = self.__getIfdefAnnotations__(root)
         try:
             self.__checkDiscipline__(treeifdefs, file)
@@ -628,10 +655,13 @@ class DisciplinedAnnotations:
             return
 
     def checkFiles(self):
-        xmlfiles = returnFileNames(self.opts.dir, ['.xml'])
+        xmlfiles = getFiles(self.opts.dir)
         for xmlfile in  xmlfiles:
             print('[INFO] checking file %s' % xmlfile)
             self.checkFile(xmlfile)
+        self.writeResults()
+
+    def writeResults(self):
         projectpath = os.path.dirname(self.opts.dir)
         projectname = os.path.basename(projectpath)
         fd = open(
@@ -673,6 +703,51 @@ class DisciplinedAnnotations:
                 +";"+str(self.overallblocks)+"\n")
 
 
+# ##################################################
+# analysis of single files
+
+def getFiles(folder):
+    '''returns the xml files of the folder in the order in which they are checked'''
+    return returnFileNames(folder, ['.xml'])
+
+
+def resetModule():
+    '''the analysis keeps its state in DisciplinedAnnotations, so there is nothing to reset here'''
+    pass
+
+
+def analyzeFile(file, root, options):
+    '''checks the single xml file, given by the root of its tree (None, if it cannot be parsed);
+    returns the counters for the file (as DisciplinedAnnotations) or None, if the file is skipped'''
+    print('[INFO] checking file %s' % file)
+    if root is None:
+        print('ERROR: file (%s) is not valid. Skipping it.' % file)
+        return None
+
+    annotations = DisciplinedAnnotations(None, options, check=False)
+    annotations.checkTree(file, root)
+
+    # the result holds the counters only, not the options (it is pickled, e.g., into the cache)
+    annotations.opts = None
+    return annotations
+
+
+def mergeResults(folder, results, options):
+    '''sums up the counters of all files, given as list of (file, result of analyzeFile),
+    and writes the results file'''
+    annotations = DisciplinedAnnotations(folder, options, check=False)
+    print annotations.opts.dir
+    for (file, result) in results:
+        if result is not None:
+            annotations.addCounters(result)
+    annotations.writeResults()
+
+
+def apply(folder, options):
+    '''checks all xml files in the folder and writes the results file'''
+    DisciplinedAnnotations(folder, options)
+
+
 # ##################################################
 # add command line options
 
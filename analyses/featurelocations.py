@@ -29,6 +29,7 @@ import re
 import sys
 import xmlrpclib
 from argparse import ArgumentParser, RawTextHelpFormatter
+from collections import OrderedDict
 
 
 # #################################################
@@ -45,6 +46,8 @@ sys.path.append(os.path.abspath(__lib_subfolder))  # lib subfolder
 from enum import Enum
  # python-lxml module
 from lxml import etree
+# conditional blocks of srcML files
+from blocks import hasConditionals
 # pyparsing module
 import pyparsing as pypa
 pypa.ParserElement.enablePackrat() # speed up parsing
@@ -445,6 +448,9 @@ def _getFeatures(root, featlocations):
 
     featuresgrinner: All tags from the feature elements (see above).
     featuresgrouter: All tags from the elements arround the feature.
+
+    The feature locations are added to featlocations, an OrderedDict
+    that is used as ordered set of the locations.
     """
 
     def _wrapGrOuterUp(fouter, featuresgrouter, eelem):
@@ -507,6 +513,13 @@ def _getFeatures(root, featlocations):
     parend = False  # parse-endif-flag
     _ = 0  # else and elif depth
 
+    # fast path: a file without conditionals has no features, only its
+    # defines are collected (in document order, as in the loop below)
+    if (not hasConditionals(root)):
+        for elem in root.iter(*['{%s}%s' % (_cppnscpp, tag) for tag in __macro_define]):
+            _parseAndAddDefine(elem)
+        return (features, featuresgrinner, featuresgrouter)
+
     # iterate over all tags separately <start>- and <end>-tag
     for event, elem in etree.iterwalk(root, events=("start", "end")):
         ns, tag = __cpprens.match(elem.tag).groups()
@@ -584,7 +597,7 @@ def _getFeatures(root, featlocations):
             for (asig, aselem, aeelem) in featuresgrouter:
                 floc = FeatureLocation(__curfile, aselem.sourceline - 1, aeelem.sourceline - 1,
                                        aselem.tag, asig)
-                featlocations.add(floc)
+                featlocations.setdefault(floc)
 
             while (condinhist[-1][0] != 'if'):
                 condinhist = condinhist[:-1]
@@ -610,6 +623,50 @@ def _getFeatures(root, featlocations):
     return (features, featuresgrinner, featuresgrouter)
 
 
+def _getFeaturesFromBlocks(blocks, featlocations):
+    """This function returns the features in the source-file as
+    _getFeatures does, but from the conditional blocks of the file
+    (see blocks.py). Only the signatures of the features are
+    determined: {<feature signature>: None}.
+
+    The feature locations are added to featlocations (in the same
+    order as in _getFeatures); for unbalanced conditionals, these are
+    the locations of the #if/#elif/#else chains closed before the
+    mismatch."""
+    condinhists = [None] * len(blocks)  # history of conditional inclusions for each block
+    fsigs = [None] * len(blocks)        # feature signature of each block
+    branches = OrderedDict()            # the blocks of each #if/#elif/#else chain
+
+    for block in xrange(len(blocks)):
+        group = blocks.group[block]
+        if (group == block):
+            parent = blocks.parent[block]
+            condinhist = condinhists[parent] if (parent >= 0) else []
+        else:
+            condinhist = condinhists[branches[group][-1]]
+
+        condinhist = condinhist + [(blocks.getKind(block), blocks.getSignature(block))]
+        condinhists[block] = condinhist
+        fsigs[block] = _getFeatureSignature(condinhist)
+        branches.setdefault(group, []).append(block)
+
+    # features are wrapped up at the end of each block
+    features = {}
+    for block in sorted(xrange(len(blocks)), key=lambda b: blocks.end[b]):
+        if (blocks.end[block] != -1):
+            features[fsigs[block]] = None
+
+    # feature locations are added at the #endif of each chain
+    closed = [group for group in branches.keys() if blocks.end[branches[group][-1]] != -1]
+    for group in sorted(closed, key=lambda g: blocks.end[branches[g][-1]]):
+        for block in branches[group]:
+            floc = FeatureLocation(__curfile, blocks.start[block] - 1, blocks.end[block] - 1,
+                                   blocks.getKind(block), fsigs[block])
+            featlocations.setdefault(floc)
+
+    return features
+
+
 def _getFeaturesAtLocations(flocations, defines):
     """TODO"""
 
@@ -649,11 +706,100 @@ def resetModule() :
     __defsetf = dict()      # macro-objects per file
 
 
-def apply(folder, options):
-    """This function applies the analysis to all xml-files in that
-    directory and take the results and joins them together. Results
-    are getting written into the fdcsv-file."""
-    # overall status variables
+def _getFileState():
+    """This function returns the module state that the current file
+    has contributed (its defines)."""
+    return __defsetf.get(__curfile)
+
+
+def _addFileState(file, state):
+    """This function adds the module state that a file has contributed
+    (see _getFileState) to the current module state."""
+    if state is not None:
+        __defset.update(state)
+        __defsetf[file] = state
+
+
+def getFiles(folder):
+    """This function returns the xml-files of the folder in the
+    order in which they are analyzed."""
+    files = returnFileNames(folder, ['.xml'])
+    files.sort()
+    return files
+
+
+def parseFile(file):
+    """This function returns the root of the parsed xml-file or
+    None, if the file cannot be parsed."""
+    try:
+        return etree.parse(file).getroot()
+    except etree.XMLSyntaxError:
+        return None
+
+
+def analyzeFile(file, root, options):
+    """This function analyzes a single xml-file, given by the root
+    of its tree (None, if the file cannot be parsed). It returns the
+    partial result of the file, i.e., the feature locations of the file
+    and the list of its features or None, if the file has to be skipped,
+    and the module state that the file contributed. (The locations found
+    before an ifdef-endif mismatch are kept without a list of features.)
+    The partial result depends on this file only, so that the files can
+    be analyzed in any order (or process) and merged afterwards."""
+    global __curfile
+    resetModule()
+    __curfile = file
+
+    if root is None:
+        print("ERROR: cannot parse (%s). Skipping this file." % file)
+        return (None, _getFileState())
+
+    flocations = OrderedDict()
+    try:
+        (features, _, _) = _getFeatures(root, flocations)
+    except IfdefEndifMismatchError:
+        print("ERROR: ifdef-endif mismatch in file (%s)" % file)
+        return ((flocations.keys(), None), _getFileState())
+
+    return ((flocations.keys(), _getListOfFeatures(features)), _getFileState())
+
+
+def analyzeBlocks(file, blocks, options):
+    """This function analyzes a single xml-file as analyzeFile does,
+    but from the conditional blocks of the file (see blocks.py) instead
+    of its tree, so that the file does not need to be parsed."""
+    global __curfile
+    resetModule()
+    __curfile = file
+
+    flocations = OrderedDict()
+    features = _getFeaturesFromBlocks(blocks, flocations)
+    if (not blocks.balanced):
+        print("ERROR: ifdef-endif mismatch in file (%s)" % file)
+        return ((flocations.keys(), None), _getFileState())
+
+    return ((flocations.keys(), _getListOfFeatures(features)), _getFileState())
+
+
+def _getListOfFeatures(features):
+    """This function parses the signatures of the given features of
+    the current file and returns the list of all configuration
+    constants used in them (as string)."""
+    # parse features and get all defined configuration constants
+    for sig in features.iterkeys():
+        psig = _parseFeatureSignatureAndRewrite(sig)
+
+    # features for this file
+    featureslist = list(__defsetf[__curfile]) \
+        if __defsetf.has_key(__curfile) else '' # list of features within the current file
+    return ';'.join(sorted(featureslist)) # sort and join
+
+
+def mergeResults(folder, results, options):
+    """This function takes the results of all files, given as list
+    of (file, result of analyzeFile), and joins them together in
+    the given order. Results are getting written into the fdcsv-file."""
+    # the module state is rebuilt from the contributions of the files
     resetModule()
 
     featlocations = set()  # list of feature locations of class FeatureLocation
@@ -667,43 +813,28 @@ def apply(folder, options):
     loffhandle, loffwriter = _prologCSV(os.path.join(folder, os.pardir), __listoffeaturesfile, loffheadings)
 
     # preparations for file-loop
-    global __curfile
-    files = returnFileNames(folder, ['.xml'])
-    files.sort()
     fcount = 0
-    ftotal = len(files)
-
-    #TODO rewrite comment! get statistics for all files; write results into csv
-    # and merge the features
-    for file in files:
-        __curfile = file
+    ftotal = len(results)
 
-        try:
-            tree = etree.parse(file)
-        except etree.XMLSyntaxError:
-            print("ERROR: cannot parse (%s). Skipping this file." % os.path.join(folder, file))
+    # collect the feature locations of all files
+    # and write the list of features of each file
+    for (file, (result, state)) in results:
+        _addFileState(file, state)
+        if result is None:
             continue
+        (flocations, listoffeaturesstring) = result
 
-        root = tree.getroot()
-        try:
-            (features, _, _) = _getFeatures(root, featlocations)
-        except IfdefEndifMismatchError:
-            print("ERROR: ifdef-endif mismatch in file (%s)" % (os.path.join(folder, file)))
+        for floc in flocations:
+            featlocations.add(floc)
+        if listoffeaturesstring is None:
             continue
 
-        # parse features and get all defined configuration constants
-        for (sig, (depth, code)) in features.iteritems():
-            psig = _parseFeatureSignatureAndRewrite(sig)
-
         # file successfully parsed
         fcount += 1
         print('INFO: parsing file (%5d) of (%5d) -- (%s).' % (fcount, ftotal, os.path.join(folder, file)))
 
         # print features for this file to list-of-features file
-        featureslist = list(__defsetf[__curfile]) \
-            if __defsetf.has_key(__curfile) else '' # list of features within the current file
-        listoffeaturesstring = ';'.join(sorted(featureslist)) # sort and join
-        loffwriter.writerow([__curfile, listoffeaturesstring]) # write row to file
+        loffwriter.writerow([file, listoffeaturesstring]) # write row to file
 
 
     # collect feature locations and consisting used features
@@ -732,6 +863,14 @@ def apply(folder, options):
     loffhandle.close() # __listoffeaturesfile
 
 
+def apply(folder, options):
+    """This function applies the analysis to all xml-files in that
+    directory and take the results and joins them together. Results
+    are getting written into the fdcsv-file."""
+    results = [(file, analyzeFile(file, parseFile(file), options)) for file in getFiles(folder)]
+    mergeResults(folder, results, options)
+
+
 
 # ##################################################
 # add command line options
@@ -46,6 +46,8 @@ sys.path.append(os.path.abspath(__lib_subfolder))  # lib subfolder
 from enum import Enum
  # python-lxml module
 from lxml import etree
+# conditional blocks of srcML files
+from blocks import hasConditionals
  # statistics module
 from statlib import pstat
 # pyparsing module
@@ -450,9 +452,15 @@ __nestedIfdefsLevels = []
 def _countNestedIfdefs(root):
     """This function counts the number of nested ifdefs (conditionals)
     within the source-file."""
+    if (not hasConditionals(root)):
+        return (0, 0, 0)
+
     cncur = 0
     cnlist = []
-    elements = [it for it in root.iterdescendants()]
+    # only the conditionals are needed, which are found by lxml itself
+    # (without creating an object for each node of the tree)
+    elements = root.iter(*['{%s}%s' % (__cppnscpp, tag)
+                           for tag in __conditionals + __conditionals_endif])
 
     for elem in elements:
         ns, tag = __cpprens.match(elem.tag).groups()
@@ -633,6 +641,13 @@ def _getFeatures(root, options):
     parend = False            # parse-endif-flag
     _ = 0                    # else and elif depth
 
+    # fast path: a file without conditionals has no features, only its
+    # defines are collected (in document order, as in the loop below)
+    if (not hasConditionals(root)):
+        for elem in root.iter(*['{%s}%s' % (__cppnscpp, tag) for tag in __macro_define]):
+            _parseAndAddDefine(elem)
+        return (features, featuresgrinner, featuresgrouter)
+
     # iterate over all tags separately <start>- and <end>-tag
     for event, elem in etree.iterwalk(root, events=("start", "end")):
         ns, tag = __cpprens.match(elem.tag).groups()
@@ -1162,22 +1177,122 @@ def resetModule() :
     __nestedIfdefsLevels = []
 
 
-def apply(folder, options):
-    """This function applies the analysis to all xml-files in that
-    directory and take the results and joins them together. Results
-    are getting written into the fdcsv-file."""
-    # overall status variables
+def _getFileState():
+    """This function returns the module state that the current file
+    has contributed (defines, macro functions, and nesting levels)."""
+    return (__defsetf.get(__curfile), __macrofuncs, __nestedIfdefsLevels)
+
+
+def _addFileState(file, state):
+    """This function adds the module state that a file has contributed
+    (see _getFileState) to the current module state."""
+    (fdefines, fmacrofuncs, fnestedIfdefsLevels) = state
+    if fdefines is not None:
+        __defset.update(fdefines)
+        __defsetf[file] = fdefines
+    __macrofuncs.update(fmacrofuncs)
+    __nestedIfdefsLevels.extend(fnestedIfdefsLevels)
+
+
+def getFiles(folder):
+    """This function returns the xml-files of the folder in the
+    order in which they are analyzed."""
+    files = returnFileNames(folder, ['.xml'])
+    files.sort()
+    return files
+
+
+def parseFile(file):
+    """This function returns the root of the parsed xml-file or
+    None, if the file cannot be parsed."""
+    try:
+        return etree.parse(file).getroot()
+    except etree.XMLSyntaxError:
+        return None
+
+
+def analyzeFile(file, root, options):
+    """This function analyzes a single xml-file, given by the root
+    of its tree (None, if the file cannot be parsed). It returns the
+    partial result of the file, i.e., the statistics for the file and
+    its features (with their parsed signatures) or None, if the file
+    has to be skipped, and the module state that the file contributed.
+    The partial result depends on this file only, so that the files
+    can be analyzed in any order (or process) and merged afterwards."""
+    global __curfile
+    resetModule()
+    __curfile = file
+
+    if root is None:
+        print("ERROR: cannot parse (%s). Skipping this file." % file)
+        return (None, _getFileState())
+
+    try:
+        (features, _, featuresgrouter) = _getFeatures(root, options)
+    except IfdefEndifMismatchError:
+        print("ERROR: ifdef-endif mismatch in file (%s)" % file)
+        return (None, _getFileState())
+
+    # parse the signatures of the features (this collects the defines of the file, too)
+    fsigs = [(sig, _parseFeatureSignatureAndRewrite(sig), depth, code)
+             for (sig, (depth, code)) in features.iteritems()]
+
+    fstats = [None]*len(__statsorder)
+
+    # granularity stats
+    grouter = _getOuterGranularity(featuresgrouter)
+    (gotopbgr, gofunbgr, gostrbrl, gostrbrg,
+    goinnbgr, goexpbgr, gostmbgr, gopambgr, goerror) = \
+            _getOuterGranularityStats(grouter)
+    fstats[__statsorder.GRANGL.value] = gotopbgr
+    fstats[__statsorder.GRANFL.value] = gofunbgr+gostrbrl+gostrbrg
+    fstats[__statsorder.GRANBL.value] = goinnbgr
+    fstats[__statsorder.GRANEL.value] = goexpbgr
+    fstats[__statsorder.GRANSL.value] = gostmbgr
+    fstats[__statsorder.GRANML.value] = gopambgr
+    fstats[__statsorder.GRANERR.value] = goerror
+
+    # general stats
+    (ndmax, andavg, andstdev) = _countNestedIfdefs(root)
+    fstats[__statsorder.ANDAVG.value] = andavg
+    fstats[__statsorder.ANDSTDEV.value] = andstdev
+    fstats[__statsorder.NDMAX.value] = ndmax
+    # the last descendant (in document order) is reached by following the last children
+    last = root
+    while (len(last)): last = last[-1]
+
+    if (last is not root): floc = last.sourceline
+    else: floc = 0
+
+    fstats[__statsorder.LOC.value] = floc
+
+    # feature-amount (the number of feature constants depends on the
+    # macro functions of all files so far and is computed when merging)
+    (_, _, lof, _, _, _, _) = \
+            _getFeatureStats(features)
+    fstats[__statsorder.LOF.value] = lof
+
+    # scattering and tangling
+    # not useful to compute the scattering per file, since a feature names
+    # may be defined later
+
+    return ((fstats, fsigs), _getFileState())
+
+
+def mergeResults(folder, results, options):
+    """This function takes the results of all files, given as list
+    of (file, result of analyzeFile), and joins them together in
+    the given order. Results are getting written into the fdcsv-file."""
+    # the module state is rebuilt from the contributions of the files
     resetModule()
 
     sigmap = {}                # {<converted sig>: [<equivalent sigs>]}
     afeatures = {}            # identified features; {<sig>: (depth, [code])}
 
-    def _mergeFeatures(ffeatures):
+    def _mergeFeatures(fsigs):
         """This function merges the, with the parameter given
-        dictionary (ffeatures) to the afeatures (overall-features)."""
-        for (sig, (depth, code)) in ffeatures.iteritems():
-            psig = _parseFeatureSignatureAndRewrite(sig)
-
+        features (fsigs) to the afeatures (overall-features)."""
+        for (sig, psig, depth, code) in fsigs:
             try:
                 sigmatch = _checkForEquivalentSig(sigmap.keys(), psig)
                 (tmpdepth, tmpcode) = afeatures[sigmap[sigmatch][0]]
@@ -1198,50 +1313,29 @@ def apply(folder, options):
     fd, fdcsv = _prologCSV(os.path.join(folder, os.pardir), __outputfile, __statsorder.__members__.keys())
     # fdfeat = open(os.path.join(folder, __outputfexp), 'w')
 
-    global __curfile
     fcount = 0
-    files = returnFileNames(folder, ['.xml'])
-    files.sort()
-    fstats = [None]*len(__statsorder)
-    ftotal = len(files)
+    ftotal = len(results)
 
-    # get statistics for all files; write results into csv
+    # write the statistics of all files into csv
     # and merge the features
-    for file in files:
-        __curfile = file
-
-        try:
-            tree = etree.parse(file)
-        except etree.XMLSyntaxError:
-            print("ERROR: cannot parse (%s). Skipping this file." % os.path.join(folder, file))
+    for (file, (result, state)) in results:
+        _addFileState(file, state)
+        if result is None:
             continue
+        (fstats, fsigs) = result
 
-        root = tree.getroot()
-        try:
-            (features, _, featuresgrouter) = _getFeatures(root, options)
-        except IfdefEndifMismatchError:
-            print("ERROR: ifdef-endif mismatch in file (%s)" % (os.path.join(folder, file)))
-            continue
+        _mergeFeatures(fsigs)
 
-        _mergeFeatures(features)
+        if __defsetf.has_key(file):
+            fstats[__statsorder.NOFC.value] = \
+                    _getNumOfDefines(__defsetf[file])
+        else:
+            fstats[__statsorder.NOFC.value] = 0
 
         # file successfully parsed
         fcount += 1
         print('INFO: parsing file (%5d) of (%5d) -- (%s).' % (fcount, ftotal, os.path.join(folder, file)))
 
-        # granularity stats
-        grouter = _getOuterGranularity(featuresgrouter)
-        (gotopbgr, gofunbgr, gostrbrl, gostrbrg,
-        goinnbgr, goexpbgr, gostmbgr, gopambgr, goerror) = \
-                _getOuterGranularityStats(grouter)
-        fstats[__statsorder.GRANGL.value] = gotopbgr
-        fstats[__statsorder.GRANFL.value] = gofunbgr+gostrbrl+gostrbrg
-        fstats[__statsorder.GRANBL.value] = goinnbgr
-        fstats[__statsorder.GRANEL.value] = goexpbgr
-        fstats[__statsorder.GRANSL.value] = gostmbgr
-        fstats[__statsorder.GRANML.value] = gopambgr
-        fstats[__statsorder.GRANERR.value] = goerror
-
         #adjust file name if wanted
         if options.filenamesRelative : # relative file name (root is project folder (not included in path))
             file = os.path.relpath(file, folder)
@@ -1251,32 +1345,7 @@ def apply(folder, options):
         if options.filenames == options.FILENAME_SOURCE : # source file name
             file = file.replace(".xml", "").replace("/_cppstats/", "/source/", 1)
 
-        # general stats
         fstats[__statsorder.FILENAME.value] = file
-        (ndmax, andavg, andstdev) = _countNestedIfdefs(root)
-        fstats[__statsorder.ANDAVG.value] = andavg
-        fstats[__statsorder.ANDSTDEV.value] = andstdev
-        fstats[__statsorder.NDMAX.value] = ndmax
-        tmp = [it for it in root.iterdescendants()]
-
-        if (len(tmp)): floc = tmp[-1].sourceline
-        else: floc = 0
-
-        fstats[__statsorder.LOC.value] = floc
-
-        # feature-amount
-        (_, _, lof, _, _, _, _) = \
-                _getFeatureStats(features)
-        if __defsetf.has_key(__curfile):
-            fstats[__statsorder.NOFC.value] = \
-                    _getNumOfDefines(__defsetf[__curfile])
-        else:
-            fstats[__statsorder.NOFC.value] = 0
-        fstats[__statsorder.LOF.value] = lof
-
-        # scattering and tangling
-        # not useful to compute the scattering per file, since a feature names
-        # may be defined later
 
         fdcsv.writerow(fstats)
 
@@ -1387,6 +1456,14 @@ def apply(folder, options):
     fd.close()
 
 
+def apply(folder, options):
+    """This function applies the analysis to all xml-files in that
+    directory and take the results and joins them together. Results
+    are getting written into the fdcsv-file."""
+    results = [(file, analyzeFile(file, parseFile(file), options)) for file in getFiles(folder)]
+    mergeResults(folder, results, options)
+
+
 # ##################################################
 # add command line options
 
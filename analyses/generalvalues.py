@@ -44,6 +44,8 @@ sys.path.append(os.path.abspath(__lib_subfolder))  # lib subfolder
 
 # python-lxml module
 from lxml import etree
+# conditional blocks of srcML files
+from blocks import hasConditionals
 # statistics module
 from statlib import pstat
 # pyparsing module
@@ -84,7 +86,7 @@ __macrofuncs = {}       # functional macros like: "GLIBVERSION(2,3,4)",
                         # used as "GLIBVERSION(x,y,z) 100*x+10*y+z"
 __curfile = ''          # current processed xml-file
 __defset = set()        # macro-objects
-__defsetf = dict()      # macro-objects per file
+__defsetf = dict()      # macro-objects per file (in order of occurrence)
 
 ##################################################
 
@@ -154,10 +156,14 @@ def _collectDefines(d):
     but not #define GLIBCVER(x,y,z) ...
     """
     __defset.add(d[0])
+    # the defines of a file are kept in the order of their first
+    # occurrence, so that merging the files in order (see _addFileState)
+    # adds them to __defset in the same order as a sequential run
     if __defsetf.has_key(__curfile):
-        __defsetf[__curfile].add(d[0])
+        if d[0] not in __defsetf[__curfile]:
+            __defsetf[__curfile].append(d[0])
     else:
-        __defsetf[__curfile] = set([d[0]])
+        __defsetf[__curfile] = [d[0]]
     return d
 
 
@@ -473,6 +479,13 @@ def _getFeatures(root, options):
     elses = []
     ifdef_number = 0
 
+    # fast path: a file without conditionals has no features, only its
+    # defines are collected (in document order, as in the loop below)
+    if (not hasConditionals(root)):
+        for elem in root.iter(*['{%s}%s' % (__cppnscpp, tag) for tag in __macro_define]):
+            _parseAndAddDefine(elem)
+        return (features, featuresgrinner, featuresgrouter, elses)
+
     # iterate over all tags separately <start>- and <end>-tag
     for event, elem in etree.iterwalk(root, events=("start", "end")):
         ns, tag = __cpprens.match(elem.tag).groups()
@@ -586,12 +599,18 @@ def _getNestingDepths(root):
      1) the nesting depth of each #ifdef block (nested or not nested, one value for #if/#elif/#else branches)
         __nestedIfdefsLevels = [int]
      2) the nesting depth of each top-level (non-nested) branch (#if/#elif/#else) separately
-        __nestingDepthsOfBranches = [(file path, xml element, feature signature, maximum nesting of this element)]
+        __nestingDepthsOfBranches = [(file path, line of xml element, feature signature, maximum nesting of this element)]
     """
 
     global __curfile, __nestedIfdefsLevels, __nestingDepthsOfBranches
 
-    elements = [it for it in root.iterdescendants()]
+    if (not hasConditionals(root)):
+        return
+
+    # only the conditionals are needed, which are found by lxml itself
+    # (without creating an object for each node of the tree)
+    elements = root.iter(*['{%s}%s' % (__cppnscpp, tag)
+                           for tag in __conditionals_all + __conditionals_endif])
 
     cncur = 0
     cnmax = -1
@@ -599,7 +618,7 @@ def _getNestingDepths(root):
 
     # [] of integers
     cnlist = []
-    # [(file path, xml element, feature signature, maximum nesting of this element)]
+    # [(file path, line of xml element, feature signature, maximum nesting of this element)]
     sighist = []
 
     for elem in elements:
@@ -616,8 +635,8 @@ def _getNestingDepths(root):
             if cncur == 0:
 
                 # insert max-nesting value to top-level element
-                (xfile, xelem, xsig, xdepth) = sigblockhist[-1]
-                sigblockhist[-1] = (xfile, xelem, xsig, cnmax)
+                (xfile, xline, xsig, xdepth) = sigblockhist[-1]
+                sigblockhist[-1] = (xfile, xline, xsig, cnmax)
 
                 # reset value, since branch is finished
                 cnmax = -1
@@ -647,11 +666,11 @@ def _getNestingDepths(root):
                     #FIXME how to do this if rewriting is enabled?!
 
                     newsig = ['!(' + xsig + ')' for (_, _, xsig, _) in sigblockhist]
-                    sigblockhist.append((__curfile, elem, " && ".join(newsig), -1))
+                    sigblockhist.append((__curfile, elem.sourceline, " && ".join(newsig), -1))
 
                 else:
 
-                    sigblockhist.append((__curfile, elem, _getMacroSignature(elem), -1))
+                    sigblockhist.append((__curfile, elem.sourceline, _getMacroSignature(elem), -1))
 
             # calculate current max of this branch
             cnmax = max(cnmax, cncur)
@@ -722,28 +741,97 @@ def resetModule() :
     __macrofuncs = {}       # functional macros like: "GLIBVERSION(2,3,4)",
                             # used as "GLIBVERSION(x,y,z) 100*x+10*y+z"
     __defset = set()        # macro-objects
-    __defsetf = dict()      # macro-objects per file
+    __defsetf = dict()      # macro-objects per file (in order of occurrence)
     __nestedIfdefsLevels = []
     __nestingDepthsOfBranches = []
 
 
-def apply(folder, options):
+def _getFileState():
+    """This function returns the module state that the current file
+    has contributed (defines and nesting depths)."""
+    return (__defsetf.get(__curfile), __nestedIfdefsLevels, __nestingDepthsOfBranches)
 
-    """This function applies the analysis to all xml-files in that
-    directory and take the results and joins them together. Results
-    are getting written into the fdcsv-file."""
-    # overall status variables
+
+def _addFileState(file, state):
+    """This function adds the module state that a file has contributed
+    (see _getFileState) to the current module state."""
+    (fdefines, fnestedIfdefsLevels, fnestingDepthsOfBranches) = state
+    if fdefines is not None:
+        __defset.update(fdefines)
+        __defsetf[file] = fdefines
+    __nestedIfdefsLevels.extend(fnestedIfdefsLevels)
+    __nestingDepthsOfBranches.extend(fnestingDepthsOfBranches)
+
+
+def getFiles(folder):
+    """This function returns the xml-files of the folder in the
+    order in which they are analyzed."""
+    files = returnFileNames(folder, ['.xml'])
+    files.sort()
+    return files
+
+
+def parseFile(file):
+    """This function returns the root of the parsed xml-file or
+    None, if the file cannot be parsed."""
+    try:
+        return etree.parse(file).getroot()
+    except etree.XMLSyntaxError:
+        return None
+
+
+def analyzeFile(file, root, options):
+    """This function analyzes a single xml-file, given by the root
+    of its tree (None, if the file cannot be parsed). It returns the
+    partial result of the file, i.e., the features of the file (with
+    their parsed signatures) or None, if the file has to be skipped,
+    and the module state that the file contributed. The partial result
+    depends on this file only, so that the files can be analyzed in any
+    order (or process) and merged afterwards."""
+    global __curfile
+    resetModule()
+    __curfile = file
+
+    if root is None:
+        print("ERROR: cannot parse (%s). Skipping this file." % file)
+        return (None, _getFileState())
+
+    try:
+        (features, _, featuresgrouter, elses) = _getFeatures(root, options)
+    except IfdefEndifMismatchError:
+        print("ERROR: ifdef-endif mismatch in file (%s)" % file)
+        return (None, _getFileState())
+
+    # remove #else branches from list of features as there is no existing signature in the source code!
+    if not options.rewriteifdefs:
+        features = OrderedDict((sig, value)
+                               for sig, value in features.iteritems()
+                               if not sig.startswith(_elsePrefix))
+
+    # parse the signatures of the features (this collects the defines of the file, too)
+    fsigs = [(sig, _parseFeatureSignatureAndRewrite(sig), depth, code)
+             for (sig, (depth, code)) in features.iteritems()]
+
+    # calculate nesting depths (per block and per branch)
+    _getNestingDepths(root)
+
+    return (fsigs, _getFileState())
+
+
+def mergeResults(folder, results, options):
+    """This function takes the results of all files, given as list
+    of (file, result of analyzeFile), and joins them together in
+    the given order. Results are getting written into several csv-files."""
+    # the module state is rebuilt from the contributions of the files
     resetModule()
 
     sigmap = {}                # {<converted sig>: [<equivalent sigs>]}
     afeatures = {}            # identified features; {<sig>: (depth, [code])}
 
-    def _mergeFeatures(ffeatures):
+    def _mergeFeatures(fsigs):
         """This function merges the, with the parameter given
-        dictionary (ffeatures) to the afeatures (overall-features)."""
-        for (sig, (depth, code)) in ffeatures.iteritems():
-            psig = _parseFeatureSignatureAndRewrite(sig)
-
+        features (fsigs) to the afeatures (overall-features)."""
+        for (sig, psig, depth, code) in fsigs:
             try:
                 sigmatch = _checkForEquivalentSig(sigmap.keys(), psig)
                 (tmpdepth, tmpcode) = afeatures[sigmap[sigmatch][0]]
@@ -761,41 +849,17 @@ def apply(folder, options):
                 sigmap[psig] = [sig]
 
 
-    global __curfile
     fcount = 0
-    files = returnFileNames(folder, ['.xml'])
-    files.sort()
-    ftotal = len(files)
+    ftotal = len(results)
 
-    # get statistics for all files
-    # and merge the features
-    for file in files:
-        __curfile = file
-
-        try:
-            tree = etree.parse(file)
-        except etree.XMLSyntaxError:
-            print("ERROR: cannot parse (%s). Skipping this file." % os.path.join(folder, file))
-            continue
-
-        root = tree.getroot()
-        try:
-            (features, _, featuresgrouter, elses) = _getFeatures(root, options)
-        except IfdefEndifMismatchError:
-            print("ERROR: ifdef-endif mismatch in file (%s)" % (os.path.join(folder, file)))
+    # merge the features of all files
+    for (file, (fsigs, state)) in results:
+        _addFileState(file, state)
+        if fsigs is None:
             continue
 
-        # remove #else branches from list of features as there is no existing signature in the source code!
-        if not options.rewriteifdefs:
-            features = OrderedDict((sig, value)
-                                   for sig, value in features.iteritems()
-                                   if not sig.startswith(_elsePrefix))
-
         # merge features of file in the global list of features
-        _mergeFeatures(features)
-
-        # calculate nesting depths (per block and per branch)
-        _getNestingDepths(root)
+        _mergeFeatures(fsigs)
 
         # file successfully parsed
         fcount += 1
@@ -853,7 +917,7 @@ def apply(folder, options):
     td.close()
 
     nd, ndcsv = _prologCSV(os.path.join(folder, os.pardir), "nesting_degrees_toplevel_branches.csv", ["file", "signature", "ND"], delimiter=",") # , "linenumber"
-    for (file, elem, sig, depth) in __nestingDepthsOfBranches:
+    for (file, line, sig, depth) in __nestingDepthsOfBranches:
 
         #adjust file name if wanted
         if options.filenamesRelative : # relative file name (root is project folder (not included in path))
@@ -865,10 +929,18 @@ def apply(folder, options):
             file = file.replace(".xml", "").replace("/_cppstats/", "/source/", 1)
 
         # print information to file
-        ndcsv.writerow([file, sig, depth]) # , elem.sourceline - 1
+        ndcsv.writerow([file, sig, depth]) # , line - 1
     nd.close()
 
 
+def apply(folder, options):
+    """This function applies the analysis to all xml-files in that
+    directory and take the results and joins them together. Results
+    are getting written into several csv-files."""
+    results = [(file, analyzeFile(file, parseFile(file), options)) for file in getFiles(folder)]
+    mergeResults(folder, results, options)
+
+
 # ##################################################
 # add command line options
 
@@ -900,7 +972,7 @@ def addCommandLineOptions(optionparser) :
 # path of the main output file
 
 def getResultsFile():
-    return __outputfile
+    return __metricvaluesfile
 
 
 ##################################################
@@ -31,24 +31,47 @@ import sys
 import shutil  # for copying files and folders
 import errno  # for error/exception handling
 import threading  # for parallelism
+import multiprocessing  # for parallelism
 import subprocess  # for calling other commands
 import re  # for regular expressions
+import tempfile  # for temporary folders
+import copy  # for renaming the files of cached results
+import json  # for the manifest of prepared files
+import hashlib  # for the implementation of an analysis in cache keys
+import cPickle as pickle  # for cached results
+from StringIO import StringIO  # for the messages of the analyses of single files
 from abc import ABCMeta, abstractmethod  # abstract classes
 from argparse import ArgumentParser, RawTextHelpFormatter  # for parameters to this script
 from collections import OrderedDict  # for ordered dictionaries
 
+
+# #################################################
+# external modules
+
+# python-lxml module
+from lxml import etree
+
+
 # #################################################
 # imports from subfolders
 
 import cppstats, cli
+from parallel import applyToFolders
+from cache import PreparationCache
+from archives import isArchive, getProjectFolder
+from revisions import isRevision, getRevisionFolder, getCacheFolder
+from preparation import AbstractPreparationThread
 
 # import different kinds of analyses
 from analyses import general, generalvalues, discipline, featurelocations, derivative, interaction
+from analyses import blocks  # conditional blocks of srcML files
 
 
 # #################################################
 # global constants
 
+# version of the format of cached results (see _analyzeFileForKinds)
+_resultsformat = 2
 
 
 # #################################################
@@ -81,6 +104,36 @@ def notify(message):
         # notice.show()
 
 
+def getMemoryTempDir():
+    '''returns a memory-backed folder for temporary files, if available (otherwise None, i.e., the default)'''
+    if (os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK)):
+        return "/dev/shm"
+    return None
+
+
+def _getImportedModules(module):
+    '''returns the given module and all modules of cppstats it imports (directly or indirectly,
+    also via "from ... import ..."), sorted by name; modules outside of cppstats are left out'''
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    modules = {}
+    pending = [module]
+    while pending:
+        current = pending.pop()
+        filename = getattr(current, "__file__", None)
+        if (filename is None or not os.path.abspath(filename).startswith(root + os.sep)
+                or current.__name__ in modules):
+            continue
+        modules[current.__name__] = current
+
+        for value in vars(current).values():
+            if (type(value) is type(sys)):
+                pending.append(value)
+            elif (getattr(value, "__module__", None) in sys.modules):
+                pending.append(sys.modules[value.__module__])
+
+    return [modules[name] for name in sorted(modules)]
+
+
 # #################################################
 # abstract analysis thread
 
@@ -92,7 +145,21 @@ class AbstractAnalysisThread(object):
         self.options = options
         self.notrunnable = False
 
+        # cache for the results of single files, keyed by the content of their source files
+        # (e.g., all revisions of a repository share the results of their unchanged files)
+        self.cache = None
+        cachesize = getattr(self.options, "cachesize", 2048) * 1024 * 1024
+        if (getattr(self.options, "cachedir", None)):
+            self.cache = PreparationCache(os.path.abspath(self.options.cachedir), cachesize)
+        elif (inputfolder and isRevision(inputfolder)):
+            self.cache = PreparationCache(getCacheFolder(inputfolder), cachesize)
+
         if (inputfolder):
+            if (isArchive(inputfolder)):  # the preparation results of archives are in the project folder
+                inputfolder = getProjectFolder(inputfolder)
+            elif (isRevision(inputfolder)):  # ... and the ones of git revisions in the revision folder
+                inputfolder = getRevisionFolder(inputfolder)
+
             self.file = None
             self.folder = os.path.join(inputfolder, self.getPreparationFolder())
             self.project = os.path.basename(self.folder)
@@ -154,6 +221,28 @@ class AbstractAnalysisThread(object):
 
         self.teardown()
 
+    def analyzeSource(self, srcml, filename):
+        '''Analyzes the given srcML document of a (virtual) file with the given name and
+        returns the contents of the main results file. The analyses work on folders, so the
+        document is analyzed in a temporary folder in memory, if possible.'''
+        tmpfolder = tempfile.mkdtemp(suffix=self.getPreparationFolder(), dir=getMemoryTempDir())
+        try:
+            folder = os.path.join(tmpfolder, self.getPreparationFolder())
+            os.makedirs(folder)
+
+            currentFile = os.path.join(folder, os.path.basename(filename))
+            if (not currentFile.endswith(".xml")):
+                currentFile += ".xml"
+            with open(currentFile, 'wb') as fd:
+                fd.write(srcml)
+
+            self.analyze(folder)
+
+            with open(os.path.join(tmpfolder, self.getResultsFile()), 'rb') as fd:
+                return fd.read()
+        finally:
+            shutil.rmtree(tmpfolder)
+
     @classmethod
     @abstractmethod
     def getName(cls):
@@ -174,10 +263,53 @@ class AbstractAnalysisThread(object):
     def addCommandLineOptions(cls, optionParser):
         pass
 
+    @classmethod
     @abstractmethod
-    def analyze(self):
+    def getModule(cls):
+        '''returns the analysis module (see package analyses)'''
         pass
 
+    def analyze(self, folder):
+        fileresults = analyzeFiles([self], folder)
+        mergeFileResults(self, folder, fileresults, 0)
+
+    def getCacheSignature(self):
+        '''returns everything besides the source file itself that determines the results of
+        single files: the kind of analysis, its implementation (including all modules of cppstats
+        it imports), the version of cppstats, and its options'''
+        implementation = hashlib.sha1()
+        for module in _getImportedModules(self.getModule()):
+            with open(os.path.splitext(module.__file__)[0] + ".py", 'rb') as fd:
+                implementation.update(fd.read())
+
+        parser = ArgumentParser()
+        self.addCommandLineOptions(parser)
+        dests = sorted(set(action.dest for action in parser._actions) - set(["help"]))
+
+        return [self.getName(), cppstats.version(), implementation.hexdigest(), str(_resultsformat)] + \
+               ["{}={!r}".format(dest, getattr(self.options, dest, None)) for dest in dests]
+
+    def getCacheKeys(self, folder):
+        '''returns the cache keys of the results of the srcML files in the given preparation folder
+        as dictionary {file: key}; the keys are derived from the content hashes of the source files
+        in the manifest of the preparation (files without a manifest entry are not cached)'''
+        if (self.cache is None):
+            return {}
+
+        try:
+            with open(os.path.join(folder, AbstractPreparationThread.manifestfile), 'r') as fd:
+                manifest = json.load(fd)
+        except (IOError, ValueError):  # no (or a broken) manifest
+            return {}
+
+        signature = self.getCacheSignature() + manifest["signature"]
+        keys = {}
+        for entry in manifest["files"].itervalues():
+            for output in entry["outputs"]:
+                if (output.endswith(".xml")):
+                    keys[os.path.join(folder, output)] = self.cache.getContentKey(entry["sha1"], "analysis", *signature)
+        return keys
+
 
 # #################################################
 # analysis-thread implementations
@@ -201,8 +333,9 @@ class GeneralAnalysisThread(AbstractAnalysisThread):
         group = optionParser.add_argument_group(title.upper())
         general.addCommandLineOptions(group)
 
-    def analyze(self, folder):
-        general.apply(folder, self.options)
+    @classmethod
+    def getModule(cls):
+        return general
 
 
 class GeneralValuesAnalysisThread(AbstractAnalysisThread):
@@ -224,8 +357,9 @@ class GeneralValuesAnalysisThread(AbstractAnalysisThread):
         group = optionParser.add_argument_group(title.upper())
         generalvalues.addCommandLineOptions(group)
 
-    def analyze(self, folder):
-        generalvalues.apply(folder, self.options)
+    @classmethod
+    def getModule(cls):
+        return generalvalues
 
 
 class DisciplineAnalysisThread(AbstractAnalysisThread):
@@ -247,8 +381,9 @@ class DisciplineAnalysisThread(AbstractAnalysisThread):
         group = optionParser.add_argument_group(title.upper())
         discipline.addCommandLineOptions(group)
 
-    def analyze(self, folder):
-        discipline.DisciplinedAnnotations(folder, self.options)
+    @classmethod
+    def getModule(cls):
+        return discipline
 
 
 class FeatureLocationsAnalysisThread(AbstractAnalysisThread):
@@ -270,8 +405,9 @@ class FeatureLocationsAnalysisThread(AbstractAnalysisThread):
         group = optionParser.add_argument_group(title.upper())
         featurelocations.addCommandLineOptions(group)
 
-    def analyze(self, folder):
-        featurelocations.apply(folder, self.options)
+    @classmethod
+    def getModule(cls):
+        return featurelocations
 
 
 class DerivativeAnalysisThread(AbstractAnalysisThread):
@@ -293,8 +429,9 @@ class DerivativeAnalysisThread(AbstractAnalysisThread):
         group = optionParser.add_argument_group(title.upper())
         derivative.addCommandLineOptions(group)
 
-    def analyze(self, folder):
-        derivative.apply(folder)
+    @classmethod
+    def getModule(cls):
+        return derivative
 
 
 class InteractionAnalysisThread(AbstractAnalysisThread):
@@ -316,8 +453,208 @@ class InteractionAnalysisThread(AbstractAnalysisThread):
         group = optionParser.add_argument_group(title.upper())
         interaction.addCommandLineOptions(group)
 
-    def analyze(self, folder):
-        interaction.apply(folder, self.options)
+    @classmethod
+    def getModule(cls):
+        return interaction
+
+
+# #################################################
+# analyses sharing a preparation folder
+
+def parseFile(file):
+    '''returns the root of the parsed srcML file or None, if the file cannot be parsed'''
+    try:
+        return etree.parse(file).getroot()
+    except etree.XMLSyntaxError:
+        return None
+
+
+def _replaceFile(result, old, new):
+    '''returns a copy of the given partial result of a file (see _analyzeFileForKinds) in which
+    the file name old (e.g., of feature locations) is replaced by new'''
+    if (isinstance(result, basestring)):
+        return new if (result == old) else result
+
+    if (type(result) in (tuple, list, set, frozenset)):
+        return type(result)(_replaceFile(item, old, new) for item in result)
+
+    if (isinstance(result, dict)):
+        replaced = copy.copy(result)
+        replaced.clear()
+        for (key, value) in result.iteritems():
+            replaced[_replaceFile(key, old, new)] = _replaceFile(value, old, new)
+        return replaced
+
+    # objects of the analyses, e.g., featurelocations.FeatureLocation (old-style classes have no
+    # type of their own, their instances are of type 'instance')
+    cls = getattr(result, "__class__", type(result))
+    if (cls.__module__.startswith("analyses.") and hasattr(result, "__dict__")):
+        replaced = copy.copy(result)
+        replaced.__dict__ = _replaceFile(result.__dict__, old, new)
+        return replaced
+
+    return result
+
+
+def _analyzeFileForKinds(job):
+    '''Analyzes a single srcML file with the given kinds of analyses (also the entry point for the
+    worker processes of analyzeFiles) and returns the partial results of the file for all of them,
+    each together with the messages the analysis printed (see _captureOutput).
+    The results are taken from the cache, if the same source file has been analyzed before (e.g.,
+    in another revision, see AbstractAnalysisThread.getCacheKeys), and added to it otherwise.'''
+    kinds, file, options, keys, cache = job
+
+    results = [None] * len(kinds)
+    missing = []  # indexes of the kinds without cached results
+    for (index, key) in enumerate(keys):
+        cached = cache.get(key) if (key is not None) else None
+        if (cached is None):
+            missing.append(index)
+            continue
+
+        # the result may come from the same file in another folder (e.g., of another revision)
+        (cachedfile, messages, result) = pickle.loads(cached)
+        if (cachedfile != file):
+            (messages, result) = (messages.replace(cachedfile, file), _replaceFile(result, cachedfile, file))
+        results[index] = (messages, result)
+
+    if (missing):
+        for (index, result) in zip(missing, _analyzeFile([kinds[index] for index in missing], file, options)):
+            results[index] = result
+            if (keys[index] is not None):
+                cache.put(keys[index], pickle.dumps((file,) + result, pickle.HIGHEST_PROTOCOL))
+
+    return results
+
+
+def _captureOutput(function, *args):
+    '''calls function(*args) and returns the messages it printed together with its result'''
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        result = function(*args)
+        return (sys.stdout.getvalue(), result)
+    finally:
+        sys.stdout = stdout
+
+
+def _analyzeFile(kinds, file, options):
+    '''Analyzes a single srcML file with the given kinds of analyses and returns the partial
+    results of the file for all of them. If all analyses can work on the conditional blocks of the
+    file (see analyses.blocks), the tree of the file is not built at all: the blocks are read, if
+    they are up to date, or else streamed from the file (in memory bounded by its nesting depth) and
+    written next to it for the next time. Otherwise, the blocks are extracted from the parsed file,
+    if any analysis can use them later. A file without conditionals is not parsed at all, but only
+    scanned for the few elements that the analyses use of such a file (see blocks.readSkeleton).'''
+    modules = [getKinds()[kind].getModule() for kind in kinds]
+    useblocks = [hasattr(module, "analyzeBlocks") for module in modules]
+
+    fileblocks = blocks.readBlocks(file) if any(useblocks) else None
+    if (all(useblocks)):
+        if (fileblocks is None):
+            fileblocks = blocks.extractBlocksFromFile(file)
+            if (fileblocks is None):
+                return [_captureOutput(module.analyzeFile, file, None, options) for module in modules]
+            blocks.writeBlocks(file, fileblocks)
+        return [_captureOutput(module.analyzeBlocks, file, fileblocks, options) for module in modules]
+
+    root = blocks.readSkeleton(file)
+    if (root is None):
+        root = parseFile(file)
+    if (root is not None and any(useblocks) and fileblocks is None):
+        blocks.writeBlocks(file, blocks.extractBlocks(root))
+    return [_captureOutput(module.analyzeFile, file, root, options) for module in modules]
+
+
+def analyzeFiles(threads, folder):
+    '''Analyzes all srcML files of the folder with the analyses of the given threads,
+    which read the same preparation folder, and returns the partial results of the files as
+    dictionary {file: [(messages, result) for each thread]}. Each file is parsed at most once and
+    its tree is passed to all analyses (see _analyzeFileForKinds), unless its results are cached;
+    the partial results of the files depend on the single file only, so that they can be computed
+    in parallel (--jobs) and are merged afterwards (see mergeFileResults).'''
+    modules = [thread.getModule() for thread in threads]
+    options = threads[0].options
+    kinds = [thread.getName() for thread in threads]
+
+    # the results of single files are cached by the content of their source files (if enabled)
+    cache = threads[0].cache
+    keys = [thread.getCacheKeys(folder) for thread in threads]
+
+    # analyze the files in the order of the first analysis
+    files = modules[0].getFiles(folder)
+    filejobs = [(kinds, file, options, [threadkeys.get(file) for threadkeys in keys], cache) for file in files]
+    jobs = min(options.jobs, len(files))
+    if (jobs > 1):
+        pool = multiprocessing.Pool(jobs)
+        try:
+            fileresults = pool.map(_analyzeFileForKinds, filejobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        fileresults = map(_analyzeFileForKinds, filejobs)
+
+    if (cache is not None):
+        cache.evict()
+
+    return dict(zip(files, fileresults))
+
+
+class _FileResults(list):
+    '''This class is the list of (file, result) that is passed to the mergeResults function of an
+    analysis. While the analysis merges the files, the messages of each file (see _captureOutput)
+    are printed right after the file has been merged, so that the log of the analysis is in the
+    same order as in a sequential run, even if the results were computed in parallel or cached.'''
+
+    def __init__(self, results, messages):
+        list.__init__(self, results)
+        self.messages = messages
+
+    def __iter__(self):
+        for (item, messages) in zip(list.__iter__(self), self.messages):
+            yield item
+            sys.stdout.write(messages)
+
+
+def mergeFileResults(thread, folder, fileresults, index):
+    '''Merges the partial results of the files (see analyzeFiles) for the analysis of the
+    given thread (the index-th thread of analyzeFiles) in the order of the analysis, which gives
+    the same results and log as a sequential run.'''
+    module = thread.getModule()
+    files = module.getFiles(folder)
+    (messages, results) = zip(*[fileresults[file][index] for file in files]) if files else ((), ())
+    module.mergeResults(folder, _FileResults(zip(files, results), messages), thread.options)
+
+
+class AnalysisGroup(object):
+    '''This class runs several analyses that read the same preparation folder at once:
+    the files are analyzed by all of them together, when the first analysis is run (see
+    analyzeFiles), but each analysis merges and logs its results when it is run itself, so that
+    the analyses can be run in any order and each log is the same as in a sequential run.'''
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.fileresults = None
+        self.pending = len(threads)
+
+    def run(self, thread):
+        if (thread.notrunnable):
+            print "ERROR: No single file or input list of projects given!"
+            return
+
+        thread.startup()
+
+        if (self.fileresults is None):
+            self.fileresults = analyzeFiles(self.threads, thread.folder)
+        mergeFileResults(thread, thread.folder, self.fileresults, self.threads.index(thread))
+
+        # the results of the files are not needed anymore after the last analysis
+        self.pending -= 1
+        if (self.pending == 0):
+            self.fileresults = None
+
+        thread.teardown()
 
 
 # #################################################
@@ -355,6 +692,23 @@ def applyFile(kind, inputfile, options):
     thread.run()
 
 
+def applyStream(kind, instream, outstream, options):
+    '''Analyzes the srcML document read from instream and writes the analysis results to outstream.
+    All log output is redirected to stderr, so that outstream can be stdout.'''
+    srcml = instream.read()
+    filename = cli.getStreamFileName(instream, options)
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        thread = getKinds()[kind](options)
+        results = thread.analyzeSource(srcml, filename)
+    finally:
+        sys.stdout = stdout
+
+    outstream.write(results)
+
+
 def getFoldersFromInputListFile(inputlist):
     ''' This method reads the given inputfile line-wise and returns the read lines without line breaks.'''
 
@@ -363,6 +717,8 @@ def getFoldersFromInputListFile(inputlist):
     file.close()  # close file
 
     folders = filter(lambda f: not f.startswith("#"), folders)  # remove commented lines
+    folders = [getProjectFolder(f) if isArchive(f) else f for f in folders]  # archives are prepared into project folders
+    folders = [getRevisionFolder(f) if isRevision(f) else f for f in folders]  # ... and git revisions into revision folders
     folders = filter(os.path.isdir, folders)  # remove all non-directories
     folders = map(os.path.normpath, folders) # normalize paths for easier transformations
 
@@ -371,26 +727,58 @@ def getFoldersFromInputListFile(inputlist):
     return folders
 
 
-def applyFolders(kind, inputlist, options):
+def applyFolder(kind, folder, options):
     kinds = getKinds()
 
+    # get proper analysis thread and call it
+    threadClass = kinds[kind]
+    thread = threadClass(options, inputfolder=folder)
+    thread.run()
+
+
+def applyFolderAll(folder, options, kinds=None):
+    '''Applies the given analysis kinds (default: all) to the folder; the analyses that
+    read the same preparation folder parse each file only once (see AnalysisGroup).'''
+    allkinds = getKinds()
+    if (kinds is None):
+        kinds = allkinds.keys()
+
+    # group the analyses by their preparation folder
+    threads = [allkinds[kind](options, inputfolder=folder) for kind in kinds]
+    groups = OrderedDict()
+    for thread in threads:
+        groups.setdefault(thread.getPreparationFolder(), []).append(thread)
+    groups = dict((preparation, AnalysisGroup(group)) for (preparation, group) in groups.iteritems()
+                  if len(group) > 1)
+
+    # run the analyses in the given order
+    for thread in threads:
+        if (thread.getPreparationFolder() in groups):
+            groups[thread.getPreparationFolder()].run(thread)
+        else:
+            thread.run()
+
+
+def applyFolders(kind, inputlist, options):
+    '''Applies the analysis kind to all folders of the input list.
+    Returns the number of folders that failed.'''
+
     # get the list of projects/folders to process
     folders = getFoldersFromInputListFile(inputlist)
 
-    # for each folder:
-    for folder in folders:
-        # start preparations for this single folder
+    # start analysis for each single folder
+    return applyToFolders(lambda folder: applyFolder(kind, folder, options), folders, options.projectjobs)
 
-        # get proper preparation thread and call it
-        threadClass = kinds[kind]
-        thread = threadClass(options, inputfolder=folder)
-        thread.run()
 
+def applyFoldersAll(inputlist, options, kinds=None):
+    '''Applies the given analysis kinds (default: all) to all folders of the input list.
+    Returns the number of folders that failed.'''
 
-def applyFoldersAll(inputlist, options):
-    kinds = getKinds()
-    for kind in kinds.keys():
-        applyFolders(kind, inputlist, options)
+    # get the list of projects/folders to process
+    folders = getFoldersFromInputListFile(inputlist)
+
+    # start analyses for each single folder
+    return applyToFolders(lambda folder: applyFolderAll(folder, options, kinds), folders, options.projectjobs)
 
 
 def main():
@@ -404,7 +792,13 @@ def main():
     # #################################################
     # main
 
-    if (options.inputfile):
+    if (options.inputfile and "-" in options.inputfile):
+
+        # --file with stdin and/or stdout
+        with cli.openStreams(options.inputfile) as (instream, outstream):
+            applyStream(options.kind, instream, outstream, options)
+
+    elif (options.inputfile):
 
         # split --file argument
         options.infile = os.path.normpath(os.path.abspath(options.inputfile[0]))  # IN
@@ -426,10 +820,14 @@ def main():
             print "ERROR: input file '{}' cannot be found!".format(options.inputlist)
             sys.exit(1)
 
-        if (options.allkinds):
-            applyFoldersAll(options.inputlist, options)
+        if (len(options.kinds) > 1):
+            failed = applyFoldersAll(options.inputlist, options, options.kinds)
         else:
-            applyFolders(options.kind, options.inputlist, options)
+            failed = applyFolders(options.kind, options.inputlist, options)
+
+        if (failed):
+            print "ERROR: {} project(s) failed!".format(failed)
+            sys.exit(1)
 
     else:
         print "This should not happen! No input file or list of projects given!"
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import time  # for the modification times of zip members
+import tarfile  # for tar archives
+import zipfile  # for zip archives
+import subprocess  # for decompressing xz archives
+
+
+# #################################################
+# projects in archives
+
+# archive extensions, the longest first (e.g., "project-1.0.tar.gz" -> project folder "project-1.0")
+_archiveExtensions = (".tar.gz", ".tar.bz2", ".tar.xz", ".tgz", ".tbz2", ".txz", ".tar", ".zip")
+
+
+def isArchive(path):
+    '''returns True if the given path denotes a supported archive (by its extension)'''
+    return path.lower().endswith(_archiveExtensions)
+
+
+def getProjectFolder(archive):
+    '''returns the project folder for the given archive, i.e., the archive path without its extension;
+    the preparation and analysis results are stored there'''
+    for extension in _archiveExtensions:
+        if archive.lower().endswith(extension):
+            return archive[:-len(extension)]
+    return archive
+
+
+class ArchiveMember(object):
+    '''This class holds a file that is read from an archive. It stands in for the path of an
+    original file during the preparation, so that the archive never needs to be extracted.'''
+
+    def __init__(self, archive, name, mtime, size, content):
+        self.archive = archive
+        self.name = name
+        self.mtime = mtime
+        self.size = size
+        self.content = content
+
+    def __str__(self):
+        return os.path.join(self.archive, self.name)
+
+
+def _readTarArchive(archive, accept):
+    # tar archives are read as a stream, i.e., sequentially and in a single pass;
+    # xz is not supported by tarfile in Python 2, so the xz tool decompresses the stream
+    process = None
+    if archive.lower().endswith((".tar.xz", ".txz")):
+        process = subprocess.Popen(["xz", "--decompress", "--stdout", archive], stdout=subprocess.PIPE)
+        tar = tarfile.open(fileobj=process.stdout, mode="r|")
+    else:
+        tar = tarfile.open(archive, mode="r|*")
+
+    try:
+        for info in tar:
+            if info.isfile() and accept(info.name):
+                content = tar.extractfile(info).read()
+                yield ArchiveMember(archive, info.name, info.mtime, info.size, content)
+    finally:
+        tar.close()
+        if process:
+            process.stdout.close()
+            process.wait()
+
+
+def _readZipArchive(archive, accept):
+    with zipfile.ZipFile(archive, 'r') as fd:
+        for info in fd.infolist():
+            if not info.filename.endswith("/") and accept(info.filename):
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                yield ArchiveMember(archive, info.filename, mtime, info.file_size, fd.read(info))
+
+
+def readArchive(archive, accept):
+    '''yields an ArchiveMember for each regular file in the given archive whose name is accepted
+    by the function accept; only the contents of accepted files are read'''
+    if archive.lower().endswith(".zip"):
+        return _readZipArchive(archive, accept)
+    return _readTarArchive(archive, accept)
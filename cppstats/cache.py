@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import re  # for the names of entries
+import shutil  # for copying files and folders
+import errno  # for error/exception handling
+import hashlib  # for content hashes
+import tempfile  # for temporary files
+from contextlib import contextmanager  # for writing entries
+
+
+# #################################################
+# content-addressed cache
+
+class PreparationCache(object):
+    '''This class caches the artifacts of preparing a single file (e.g., the prepared
+    source file and its srcML file) under a key that is derived from the content of the
+    source file and everything else that influences the preparation result.
+
+    Entries are stored as <folder>/<key[:2]>/<key>.<n>, where n is the index of the
+    artifact; they are written to <folder>/tmp/ first and moved into place when complete. Besides artifacts, an entry can hold some content directly (e.g., the
+    analysis result of a prepared file, see get and put). The cache is bounded by maxsize
+    bytes; when exceeded, the least recently used entries are evicted.'''
+
+    # names of the subfolders and files of complete entries
+    __entryfolder = re.compile(r'^[0-9a-f]{2}$')
+    __entryfile = re.compile(r'^([0-9a-f]{40})\.\d+$')
+
+    def __init__(self, folder, maxsize):
+        self.folder = folder
+        self.maxsize = maxsize
+        self.tmpfolder = os.path.join(self.folder, "tmp")
+
+        if not os.path.isdir(self.tmpfolder):
+            try:
+                os.makedirs(self.tmpfolder)
+            except OSError as e:
+                if e.errno != errno.EEXIST:  # created concurrently
+                    raise
+
+    def getContentKey(self, content, *parts):
+        '''returns the cache key for the given source content and further key parts'''
+        key = hashlib.sha1()
+        key.update(content)
+        for part in parts:
+            key.update("\0" + str(part))
+        return key.hexdigest()
+
+    def __getEntry(self, key, index):
+        return os.path.join(self.folder, key[:2], key + "." + str(index))
+
+    def restore(self, key, artifacts):
+        '''copies the cached artifacts for key to the given paths;
+        returns False if the cache holds no complete entry for key'''
+        entries = [self.__getEntry(key, i) for i in range(len(artifacts))]
+        if not all(os.path.isfile(entry) for entry in entries):
+            return False
+
+        for (entry, artifact) in zip(entries, artifacts):
+            # copy instead of linking, so that later in-place writes cannot corrupt the cache
+            shutil.copyfile(entry, artifact)
+            os.utime(entry, None)  # mark as recently used
+        return True
+
+    def store(self, key, artifacts):
+        '''adds the given artifacts to the cache under key'''
+        for (i, artifact) in enumerate(artifacts):
+            with self.__writeEntry(key, i) as fd:
+                with open(artifact, 'rb') as source:
+                    shutil.copyfileobj(source, fd)
+
+    def get(self, key):
+        '''returns the content that has been cached for key (see put), or None'''
+        entry = self.__getEntry(key, 0)
+        try:
+            with open(entry, 'rb') as fd:
+                content = fd.read()
+            os.utime(entry, None)  # mark as recently used
+        except (IOError, OSError):  # not cached (or evicted concurrently)
+            return None
+        return content
+
+    def put(self, key, content):
+        '''adds the given content to the cache under key'''
+        with self.__writeEntry(key, 0) as fd:
+            fd.write(content)
+
+    @contextmanager
+    def __writeEntry(self, key, index):
+        entry = self.__getEntry(key, index)
+        if not os.path.isdir(os.path.dirname(entry)):
+            try:
+                os.makedirs(os.path.dirname(entry))
+            except OSError as e:
+                if e.errno != errno.EEXIST:  # created concurrently
+                    raise
+
+        # write to a temporary file first, so that readers never see partial entries
+        # (and eviction does not remove the entries of concurrent writers)
+        fd, tmp = tempfile.mkstemp(dir=self.tmpfolder)
+        try:
+            with os.fdopen(fd, 'wb') as tmpfd:
+                yield tmpfd
+            os.rename(tmp, entry)
+        except:
+            os.remove(tmp)
+            raise
+
+    def evict(self):
+        '''removes the least recently used entries until the cache fits into maxsize bytes;
+        only complete entries are considered, not the temporary files of ongoing writes'''
+        entries = {}  # key -> (last use, size, [paths])
+        for subfolder in filter(self.__entryfolder.match, os.listdir(self.folder)):
+            root = os.path.join(self.folder, subfolder)
+            try:
+                filenames = os.listdir(root)
+            except OSError:
+                continue
+            for filename in filenames:
+                match = self.__entryfile.match(filename)
+                if not match:
+                    continue
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                key = match.group(1)
+                used, size, paths = entries.get(key, (0, 0, []))
+                entries[key] = (max(used, stat.st_mtime), size + stat.st_size, paths + [path])
+
+        total = sum(size for (_, size, _) in entries.values())
+        for (_, size, paths) in sorted(entries.values()):
+            if total <= self.maxsize:
+                break
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+            total -= size
@@ -24,8 +24,10 @@
 # #################################################
 # imports from the std-library
 
+import os
 import sys
 from argparse import ArgumentParser, RawTextHelpFormatter, _VersionAction  # for parameters to this script
+from contextlib import contextmanager  # for the streams of --file
 
 # #################################################
 # imports from subfolders
@@ -53,6 +55,7 @@ class steps(Enum):
     ALL = 0
     PREPARATION = 1
     ANALYSIS = 2
+    SERVE = 3  # preparation and analysis on request (see cppstats.server)
 
 
 # #################################################
@@ -96,7 +99,7 @@ def getOptions(kinds, step=steps.ALL):
       * checking of constraints
 
     :arg kinds : the list of preperation/analysis kinds, dependent on the step parameter
-    :arg step : the variant of cppstats to execute: one of cli.steps (ALL, PREPARATION, ANALYSIS)
+    :arg step : the variant of cppstats to execute: one of cli.steps (ALL, PREPARATION, ANALYSIS, SERVE)
     :rtype : the resulting options
     """
 
@@ -110,44 +113,105 @@ def getOptions(kinds, step=steps.ALL):
 
     # kinds
     kindgroup = parser.add_mutually_exclusive_group(required=False)
-    kindgroup.add_argument("--kind", choices=kinds.keys(), dest="kind",
-                           default=kinds.keys()[0], metavar="<K>",
-                           help="the preparation to be performed [default: %(default)s]")
+    kindgroup.add_argument("--kind", type=str, dest="kind",
+                           default=kinds.keys()[0], metavar="<K>[,<K>...]",
+                           help="the preparation/analysis to be performed; several kinds can be given\n"
+                                "as comma-separated list (e.g., general,generalvalues) [default: %(default)s]")
     kindgroup.add_argument("-a", "--all", action="store_true", dest="allkinds", default=False,
                            help="perform all available kinds of preparation/analysis [default: %(default)s]")
 
 
-    # ADD INPUT TYPE (list or file)
-
-    # input 1
-    inputgroup = parser.add_mutually_exclusive_group(required=False)  # TODO check if True is possible some time...
-    inputgroup.add_argument("--list", type=str, dest="inputlist", metavar="LIST",
-                            nargs="?", default=__inputlist_default, const=__inputlist_default,
-                            help="a file that contains the list of input projects/folders [default: %(default)s]")
-    # input 2
-    if step == steps.ALL:
-        inputgroup.add_argument("--file", type=str, dest="inputfile", nargs=2, metavar=("IN", "OUT"),
-                                help="a source file IN that is prepared and analyzed, the analysis results are written to OUT"
-                                     "\n(--list is the default)")
-    elif step == steps.PREPARATION:
-        inputgroup.add_argument("--file", type=str, dest="inputfile", nargs=2, metavar=("IN", "OUT"),
-                                help="a source file IN that is prepared, the preparation result is written to OUT"
-                                     "\n(--list is the default)")
-    elif step == steps.ANALYSIS:
-        inputgroup.add_argument("--file", type=str, dest="inputfile", nargs=2, metavar=("IN", "OUT"),
-                                help="a srcML file IN that is analyzed, the analysis results are written to OUT"
-                                     "\n(--list is the default)")
+    # ADD INPUT TYPE (list or file; the daemon gets its inputs with the requests)
+
+    if step == steps.SERVE:
+        servergroup = parser.add_mutually_exclusive_group(required=True)
+        servergroup.add_argument("--socket", type=str, dest="socket", metavar="PATH",
+                                 help="serve requests on the Unix socket PATH (one JSON object per line)")
+        servergroup.add_argument("--port", type=int, dest="port", metavar="PORT",
+                                 help="serve requests via HTTP on localhost:PORT (JSON objects via POST)")
+        parser.set_defaults(inputlist=None, inputfile=None)
+
+    else:
+        # input 1
+        inputgroup = parser.add_mutually_exclusive_group(required=False)  # TODO check if True is possible some time...
+        inputgroup.add_argument("--list", type=str, dest="inputlist", metavar="LIST",
+                                nargs="?", default=__inputlist_default, const=__inputlist_default,
+                                help="a file that contains the list of input projects/folders (or archives, or git revisions as REPOSITORY@REVISION) [default: %(default)s]")
+        # input 2
+        if step == steps.ALL:
+            inputgroup.add_argument("--file", type=str, dest="inputfile", nargs=2, metavar=("IN", "OUT"),
+                                    help="a source file IN that is prepared and analyzed, the analysis results are written to OUT"
+                                         "\n(--list is the default)")
+        elif step == steps.PREPARATION:
+            inputgroup.add_argument("--file", type=str, dest="inputfile", nargs=2, metavar=("IN", "OUT"),
+                                    help="a source file IN that is prepared, the preparation result is written to OUT"
+                                         "\n(--list is the default)")
+        elif step == steps.ANALYSIS:
+            inputgroup.add_argument("--file", type=str, dest="inputfile", nargs=2, metavar=("IN", "OUT"),
+                                    help="a srcML file IN that is analyzed, the analysis results are written to OUT"
+                                         "\n(--list is the default)")
+
+    # streams for --file
+    parser.add_argument("--stdin-filename", type=str, dest="stdinfilename", default="stdin.c", metavar="NAME",
+                        help="the file name to assume for a source read from stdin with '--file - OUT'\n"
+                             "(IN and OUT can be '-' for stdin and stdout; everything is then kept in memory)\n"
+                             "[default: %(default)s]")
+
+
+    # projects in parallel
+    parser.add_argument("--project-jobs", type=int, dest="projectjobs", default=1, metavar="N",
+                        help="number of projects from LIST to process in parallel [default: %(default)s]")
+
+    # files in parallel
+    parser.add_argument("--jobs", type=int, dest="jobs", default=1, metavar="N",
+                        help="number of files to prepare/analyze in parallel [default: %(default)s]")
 
 
     # ADD VARIOUS STEP-DEPENDENT ARGUMENTS
 
     # no backup files
-    if step == steps.ALL or step == steps.PREPARATION:
+    if step == steps.ALL or step == steps.PREPARATION or step == steps.SERVE:
         parser.add_argument("--nobak", action="store_true", dest="nobak", default=False,
-                            help="do not backup files during preparation [default: %(default)s]")
+                            help="do not keep the history of preparation stages of files\n"
+                                 "(<file>.bak.zip, see cppstats.history) [default: %(default)s]")
+        parser.add_argument("--srcml-comments", "--srcmlcomments", action="store_true", dest="srcmlcomments", default=False,
+                            help="delete comments via srcML and deleteComments.xsl instead of\n"
+                                 "the built-in lexer (two more processes per file) [default: %(default)s]")
+        parser.add_argument("--unbalanced", choices=["prepare", "flag", "skip"], dest="unbalanced", default="flag",
+                            help="what to do with files whose conditionals (#if/#endif) are unbalanced, which\n"
+                                 "the analyses discard anyway: prepare them without a check, prepare them\n"
+                                 "with a warning, or skip them before the expensive preparation\n"
+                                 "[default: %(default)s]")
+        parser.add_argument("--srcml-batch", "--srcmlbatch", type=int, dest="srcmlbatch", default=100, metavar="N",
+                            help="number of files transformed to srcML by a single srcml process\n"
+                                 "(1 = one process per file) [default: %(default)s]")
+        parser.add_argument("--tool-jobs", type=int, dest="tooljobs", default=0, metavar="N",
+                            help="maximum number of external tool processes (srcml, astyle) running\n"
+                                 "at the same time in all projects; with more --jobs than N, the worker\n"
+                                 "processes overlap the tools with the other stages (0 = no limit)\n"
+                                 "[default: %(default)s]")
+        parser.add_argument("--tool-timeout", type=str, dest="tooltimeouts", action="append", default=None,
+                            metavar="[TOOL=]SECONDS",
+                            help="kill an external tool (e.g., srcml=60) or all external tools after SECONDS;\n"
+                                 "the file is skipped and listed in timeouts.txt of the preparation folder\n"
+                                 "(can be given several times) [default: no timeout]")
+        parser.add_argument("--tool-retries", type=int, dest="toolretries", default=0, metavar="N",
+                            help="number of retries after a timeout [default: %(default)s]")
+        parser.add_argument("--tool-retry-factor", type=float, dest="toolretryfactor", default=2.0, metavar="F",
+                            help="factor for the timeout of each retry [default: %(default)s]")
+        parser.add_argument("--cache-dir", type=str, dest="cachedir", default=None, metavar="DIR",
+                            help="cache prepared files and the analysis results of single files in DIR\n"
+                                 "and reuse them for unchanged source files\n"
+                                 "[default: REPOSITORY.cppstats-cache for git revisions, no cache otherwise]")
+        parser.add_argument("--cache-size", type=int, dest="cachesize", default=2048, metavar="MB",
+                            help="maximum size of the cache in megabytes [default: %(default)s]")
+        parser.add_argument("--timings", type=int, dest="timings", nargs="?", default=0, const=10, metavar="N",
+                            help="write the time of each preparation stage to timings.json in the preparation\n"
+                                 "folder: totals, percentiles, and the N slowest files per stage\n"
+                                 "[default: no report; N: %(const)s]")
 
     # add general CLI options applying for all or several analyses
-    if step == steps.ALL or step == steps.ANALYSIS:
+    if step == steps.ALL or step == steps.ANALYSIS or step == steps.SERVE:
         # constants for the choices of '--filenames' are added in method 'addConstants'
         parser.add_argument("--filenames", choices=[0, 1], dest="filenames", default=0,
                             help="determines the file paths to print [default: %(default)s]\n"
@@ -159,7 +223,7 @@ def getOptions(kinds, step=steps.ALL):
 
     # ADD POSSIBLE PREPARATION/ANALYSIS KINDS AND THEIR COMMAND-LINE ARGUMENTS
 
-    if step == steps.ALL:
+    if step == steps.ALL or step == steps.SERVE:
         parser.add_argument_group("Possible Kinds of Analyses <K>".upper(), ", ".join(kinds.keys()))
 
         # add options for each analysis kind
@@ -184,6 +248,16 @@ def getOptions(kinds, step=steps.ALL):
     options = parser.parse_args()
 
 
+    # SPLIT KINDS (a comma-separated list of kinds is allowed)
+
+    options.kinds = kinds.keys() if options.allkinds else options.kind.split(",")
+    for kind in options.kinds:
+        if (kind not in kinds):
+            parser.error("argument --kind: invalid choice: '{}' (choose from {})".format(
+                kind, ", ".join(kinds.keys())))
+    options.kind = options.kinds[0]
+
+
     # ADD CONSTANTS TO OPTIONS
 
     addConstants(options)
@@ -199,6 +273,40 @@ def getOptions(kinds, step=steps.ALL):
     return options
 
 
+@contextmanager
+def openStreams(inputfile):
+    '''yields the input and output stream for the --file arguments IN and OUT,
+    where '-' denotes stdin and stdout, respectively; afterwards, the files are closed
+    and stdout is flushed, and an output file is removed if the block fails'''
+    infile, outfile = inputfile
+
+    instream = sys.stdin if infile == "-" else open(infile, 'rb')
+    try:
+        outstream = sys.stdout if outfile == "-" else open(outfile, 'wb')
+        try:
+            yield instream, outstream
+        except BaseException:  # also on sys.exit, e.g., for a skipped input
+            if (outstream is not sys.stdout):
+                outstream.close()
+                os.remove(outfile)
+            raise
+        finally:
+            if (outstream is sys.stdout):
+                outstream.flush()
+            else:
+                outstream.close()
+    finally:
+        if (instream is not sys.stdin):
+            instream.close()
+
+
+def getStreamFileName(instream, options):
+    '''returns the file name of the given input stream (--stdin-filename for stdin)'''
+    if (instream is sys.stdin):
+        return options.stdinfilename
+    return instream.name
+
+
 def addConstants(options):
     # add option constants
     # --filenames
@@ -206,8 +314,55 @@ def addConstants(options):
     options.FILENAME_SOURCE = 1
 
 
+def parseToolTimeouts(arguments):
+    '''returns a dictionary tool -> timeout in seconds (key None for all tools) for the --tool-timeout arguments'''
+    timeouts = {}
+    for argument in arguments:
+        tool, _, seconds = argument.rpartition("=")
+        try:
+            timeouts[tool or None] = float(seconds)
+        except ValueError:
+            print "The timeout '{}' is not of the form [TOOL=]SECONDS!".format(argument)
+            sys.exit(1)
+        if (timeouts[tool or None] <= 0):
+            print "The timeout '{}' must be positive!".format(argument)
+            sys.exit(1)
+    return timeouts
+
+
 def checkConstraints(options):
     # constraints
     if (options.allkinds == True and options.inputfile):
         print "Using all kinds of preparation for a single input and output file is weird!"
         sys.exit(1)
+
+    if (len(options.kinds) > 1 and options.inputfile):
+        print "Using several kinds of preparation/analysis for a single input and output file is weird!"
+        sys.exit(1)
+
+    if (options.projectjobs < 1):
+        print "The number of parallel projects must be at least 1!"
+        sys.exit(1)
+
+    if ("jobs" in options and options.jobs < 1):
+        print "The number of parallel jobs must be at least 1!"
+        sys.exit(1)
+
+    if ("tooljobs" in options and options.tooljobs < 0):
+        print "The number of external tool processes must not be negative!"
+        sys.exit(1)
+
+    if ("tooltimeouts" in options):
+        options.tooltimeouts = parseToolTimeouts(options.tooltimeouts or [])
+
+    if ("toolretries" in options and options.toolretries < 0):
+        print "The number of retries must not be negative!"
+        sys.exit(1)
+
+    if ("timings" in options and options.timings < 0):
+        print "The number of slowest files for --timings must not be negative!"
+        sys.exit(1)
+
+    if ("srcmlbatch" in options and options.srcmlbatch < 1):
+        print "The srcML batch size must be at least 1!"
+        sys.exit(1)
@@ -43,7 +43,8 @@ import tempfile # for temporary files
 # imports from subfolders
 
 # import different kinds of analyses
-import cli, preparation, analysis
+import cli, preparation, analysis, server
+from parallel import applyToFolders
 
 
 # #################################################
@@ -77,6 +78,10 @@ if (len(__kinds) == 0) :
 __kinds = OrderedDict(__kinds)
 
 
+def getKinds():
+    return __kinds
+
+
 # #################################################
 # main method
 
@@ -85,42 +90,105 @@ def applyFile(kind, infile, outfile, options):
 
     tmpfile = tempfile.mkstemp(suffix=".xml")[1] # temporary srcML file
 
-    # preparation
-    options.infile = infile
-    options.outfile = tmpfile
-    preparation.applyFile(kind, options.infile, options)
-
-    # analysis
-    options.infile = tmpfile
-    options.outfile = outfile
-    analysis.applyFile(kind, options.infile, options)
+    try:
+        # preparation (exits, if the file cannot be prepared)
+        options.infile = infile
+        options.outfile = tmpfile
+        preparation.applyFile(kind, options.infile, options)
+
+        # analysis
+        options.infile = tmpfile
+        options.outfile = outfile
+        analysis.applyFile(kind, options.infile, options)
+
+    finally:
+        # delete temp file
+        os.remove(tmpfile)
+
+def applySource(kind, source, filename, options):
+    # preparation and analysis in memory, returns the contents of the main results file
+    preparationKind, analysisKind = __kinds.get(kind)
+
+    srcml = preparation.getKinds()[preparationKind](options).prepareSource(source, filename)
+    return analysis.getKinds()[analysisKind](options).analyzeSource(srcml, filename)
+
+def applyStream(kind, instream, outstream, options):
+    # preparation and analysis in memory, the log output goes to stderr
+    source = instream.read()
+    filename = cli.getStreamFileName(instream, options)
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        results = applySource(kind, source, filename, options)
+    except preparation.checkConditionals.UnbalancedConditionalsError as e: # --unbalanced skip
+        print "ERROR: file '{}' skipped due to unbalanced conditionals ({})".format(filename, e)
+        sys.exit(1)
+    finally:
+        sys.stdout = stdout
 
-    # delete temp file
-    os.remove(tmpfile)
+    outstream.write(results)
 
-def applyFolders(option_kind, inputlist, options):
+def applyFolder(option_kind, folder, options):
     kind = __kinds.get(option_kind)
     preparationKind = kind[0]
     analysisKind = kind[1]
 
-    preparation.applyFolders(preparationKind, inputlist, options)
-    analysis.applyFolders(analysisKind, inputlist, options)
+    preparation.applyFolder(preparationKind, folder, options)
+    analysis.applyFolder(analysisKind, folder, options)
+
+def applyFolderAll(folder, options, kinds=None):
+    # each distinct preparation is performed only once (sharing common stages),
+    # then all analyses are run on the prepared folders (sharing the parsing of each file)
+    if (kinds is None):
+        kinds = __kinds.keys()
+
+    preparationKinds = []
+    for kind in kinds:
+        preparationKind = __kinds[kind][0]
+        if preparationKind not in preparationKinds:
+            preparationKinds.append(preparationKind)
+
+    preparation.applyFolderAll(folder, options, preparationKinds)
+    analysis.applyFolderAll(folder, options, [__kinds[kind][1] for kind in kinds])
+
+def applyFolders(option_kind, inputlist, options):
+    folders = preparation.getFoldersFromInputListFile(inputlist)
+    return applyToFolders(lambda folder: applyFolder(option_kind, folder, options), folders, options.projectjobs)
 
-def applyFoldersAll(inputlist, options):
-    for kind in __kinds.keys():
-        applyFolders(kind, inputlist, options)
+def applyFoldersAll(inputlist, options, kinds=None):
+    folders = preparation.getFoldersFromInputListFile(inputlist)
+    return applyToFolders(lambda folder: applyFolderAll(folder, options, kinds), folders, options.projectjobs)
 
 
 def main():
+    # #################################################
+    # analysis daemon ('cppstats serve ...')
+
+    if (sys.argv[1:2] == ["serve"]):
+        del sys.argv[1]
+        options = cli.getOptions(__kinds, step = cli.steps.SERVE)
+        server.serve(options)
+        return
+
     # #################################################
     # options parsing
 
     options = cli.getOptions(__kinds, step = cli.steps.ALL)
 
+    # limit the external tool processes of all projects together
+    preparation.configureTools(options)
+
     # #################################################
     # main
 
-    if (options.inputfile):
+    if (options.inputfile and "-" in options.inputfile):
+
+        # --file with stdin and/or stdout
+        with cli.openStreams(options.inputfile) as (instream, outstream):
+            applyStream(options.kind, instream, outstream, options)
+
+    elif (options.inputfile):
 
         # split --file argument
         options.infile = os.path.normpath(os.path.abspath(options.inputfile[0])) # IN
@@ -142,10 +210,14 @@ def main():
             print "ERROR: input file '{}' cannot be found!".format(options.inputlist)
             sys.exit(1)
 
-        if (options.allkinds):
-            applyFoldersAll(options.inputlist, options)
+        if (len(options.kinds) > 1):
+            failed = applyFoldersAll(options.inputlist, options, options.kinds)
         else:
-            applyFolders(options.kind, options.inputlist, options)
+            failed = applyFolders(options.kind, options.inputlist, options)
+
+        if (failed):
+            print "ERROR: {} project(s) failed!".format(failed)
+            sys.exit(1)
 
     else:
         print "This should not happen! No input file or list of projects given!"
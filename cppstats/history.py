@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import sys
+import hashlib  # for content hashes
+import zipfile  # for the compressed history archives
+
+
+# #################################################
+# stage history of prepared files
+
+class StageHistory(object):
+    '''This class stores the intermediate results of the preparation stages of a single file
+    (formerly kept as full copies <file>.bak0, <file>.bak1, ...) in one compressed archive
+    <file>.bak.zip, which is written once after all stages have been applied.
+
+    The archive contains an index with one line "<number>\\t<stage>\\t<sha1>" per snapshot,
+    where the snapshot with number N is the content of the file before the stage; the
+    contents are stored once per distinct content, so stages that do not change the file
+    cost nothing.'''
+
+    suffix = ".bak.zip"
+    indexfile = "index"
+
+    def __init__(self, file):
+        self.file = file
+        self.archive = file + self.suffix
+        self.snapshots = []  # [(number, stage, sha1)]
+        self.contents = {}  # sha1 -> content
+
+    def add(self, stage, content):
+        '''adds a snapshot of content that has been taken before applying stage'''
+        digest = hashlib.sha1(content).hexdigest()
+        self.snapshots.append((len(self.snapshots), stage, digest))
+        self.contents[digest] = content
+
+    def write(self):
+        if (not self.snapshots):
+            return
+
+        # write to a temporary file first, so that an interrupted run leaves no broken archive
+        with zipfile.ZipFile(self.archive + ".tmp", 'w', zipfile.ZIP_DEFLATED) as archive:
+            index = "".join("{}\t{}\t{}\n".format(*snapshot) for snapshot in self.snapshots)
+            archive.writestr(self.indexfile, index)
+            for (digest, content) in self.contents.iteritems():
+                archive.writestr(digest, content)
+        os.rename(self.archive + ".tmp", self.archive)
+
+
+def readSnapshots(archive):
+    '''returns the list of (number, stage) of all snapshots in the given history archive'''
+    with zipfile.ZipFile(archive, 'r') as fd:
+        index = fd.read(StageHistory.indexfile)
+
+    return [(int(number), stage) for (number, stage, _) in
+            (line.split("\t") for line in index.splitlines())]
+
+
+def extractSnapshot(archive, snapshot):
+    '''returns the content of the given snapshot (number or stage name) from the given history archive'''
+    with zipfile.ZipFile(archive, 'r') as fd:
+        for line in fd.read(StageHistory.indexfile).splitlines():
+            number, stage, digest = line.split("\t")
+            if (str(snapshot) in (number, stage)):
+                return fd.read(digest)
+
+    raise KeyError("no snapshot '{}' in '{}'".format(snapshot, archive))
+
+
+# #################################################
+# main method
+
+
+def usage():
+    print "usage: " + sys.argv[0] + " <file>" + StageHistory.suffix + " [<number>|<stage>]"
+    print "lists the snapshots of the preparation stages of a file, or prints the content"
+    print "of the given snapshot (the content of the file before that stage)"
+
+
+def main():
+    if (len(sys.argv) not in (2, 3)):
+        usage()
+        sys.exit(1)
+
+    archive = sys.argv[1]
+    if (not os.path.isfile(archive)):
+        print "ERROR: history archive '{}' cannot be found!".format(archive)
+        sys.exit(1)
+
+    if (len(sys.argv) == 2):
+        for (number, stage) in readSnapshots(archive):
+            print "{}\t{}".format(number, stage)
+        return
+
+    try:
+        sys.stdout.write(extractSnapshot(archive, sys.argv[2]))
+    except KeyError as e:
+        print "ERROR: {}".format(e.args[0])
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import sys
+import time  # for polling running projects
+import tempfile  # for the per-project logs
+import traceback  # for reporting failed projects
+import multiprocessing  # for parallelism
+
+
+# #################################################
+# concurrent processing of projects
+
+def _applyToFolder(function, folder):
+    '''calls function(folder) and returns True if no exception occurred'''
+    try:
+        function(folder)
+        return True
+    except Exception:
+        traceback.print_exc()
+        print "ERROR: processing of project '{}' failed!".format(folder)
+        return False
+
+
+def _applyToFolderWithLog(function, folder, logfile):
+    '''entry point of a project process: all output (including the output of
+    external tools) is redirected to logfile'''
+    sys.stdout.flush()
+    sys.stderr.flush()
+    with open(logfile, 'w') as log:
+        os.dup2(log.fileno(), sys.stdout.fileno())
+        os.dup2(log.fileno(), sys.stderr.fileno())
+
+    success = _applyToFolder(function, folder)
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    sys.exit(0 if success else 1)
+
+
+def applyToFolders(function, folders, jobs=1):
+    '''Calls function(folder) for each folder. If more than one job is requested, up to
+    jobs projects are processed concurrently in separate processes; the output of each
+    project is printed as a whole as soon as the project is finished.
+    Returns the number of projects that failed.'''
+
+    if (jobs <= 1):
+        return [_applyToFolder(function, folder) for folder in folders].count(False)
+
+    failed = 0
+    pending = list(folders)
+    running = []  # [(process, logfile)]
+
+    while (pending or running):
+        # start new projects
+        while (pending and len(running) < jobs):
+            folder = pending.pop(0)
+            fd, logfile = tempfile.mkstemp(prefix="cppstats-", suffix=".log")
+            os.close(fd)
+
+            # processes are not daemonic, so that they can use worker pools themselves
+            process = multiprocessing.Process(target=_applyToFolderWithLog, args=(function, folder, logfile))
+            process.start()
+            running.append((process, logfile))
+
+        # print the logs of finished projects
+        finished = [(process, logfile) for (process, logfile) in running if not process.is_alive()]
+        for (process, logfile) in finished:
+            process.join()
+            running.remove((process, logfile))
+
+            with open(logfile, 'r') as log:
+                sys.stdout.write(log.read())
+            sys.stdout.flush()
+            os.remove(logfile)
+
+            if (process.exitcode != 0):
+                failed += 1
+
+        if (not finished):
+            time.sleep(0.1)
+
+    return failed
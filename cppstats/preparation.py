@@ -32,8 +32,25 @@ import shutil  # for copying files and folders
 import errno  # for error/exception handling
 import subprocess  # for calling other commands
 import re  # for regular expressions
+import multiprocessing  # for parallelism
+import hashlib  # for content hashes
+import json  # for the manifest of prepared files
+import glob  # for finding backup files of older versions
+import tempfile  # for temporary files and folders
+import threading  # for timeouts of external tools
+import signal  # for killing external tools
+import time  # for timing the preparation stages
+import itertools  # for streaming the files to prepare
 from abc import ABCMeta, abstractmethod  # abstract classes
 from collections import OrderedDict
+from contextlib import contextmanager  # for limiting external tool processes
+
+
+# #################################################
+# external modules
+
+# python-lxml module
+from lxml import etree
 
 
 # #################################################
@@ -49,11 +66,19 @@ def getPreparationScript(filename):
 # imports from subfolders
 
 import cli
+from cache import PreparationCache
+from history import StageHistory
+from timings import StageTimings
+from parallel import applyToFolders
+from archives import isArchive, getProjectFolder, readArchive, ArchiveMember
+from revisions import isRevision, getRevisionFolder, getCacheFolder, readRevision, GitBlob
+from analyses.blocks import getBlocksFile
 
 # for rewriting of #ifdefs to "if defined(..)"
 # for turning multiline macros to oneliners
 # for deletion of include guards in H files
-from preparations import rewriteIfdefs, rewriteMultilineMacros, deleteIncludeGuards
+# for deletion of comments
+from preparations import rewriteIfdefs, rewriteMultilineMacros, deleteIncludeGuards, deleteComments, checkConditionals
 
 from lib import cpplib
 
@@ -66,6 +91,9 @@ _filepattern = _filepattern_c + _filepattern_h
 
 _cvs_pattern = (".git", ".cvs", ".svn")
 
+# namespace of srcML units
+_srcmlns = "http://www.srcML.org/srcML/src"
+
 
 # #################################################
 # helper functions
@@ -93,35 +121,214 @@ def filterForFiles(dirpath, contents, pattern=_filepattern):
     return filesToIgnore + foldersToIgnore
 
 
-def runBashCommand(command, shell=False, stdin=None, stdout=None):
+def isSourceFile(relative):
+    '''returns True if the given relative path (e.g., of an archive member) denotes a C or H file
+    that is not located in a version-control folder'''
+    parts = relative.replace("\\", "/").split("/")
+    return relative.endswith(_filepattern) and not any(part in _cvs_pattern for part in parts[:-1])
+
+
+def readSource(source):
+    '''returns the content of the given original file (a path or an ArchiveMember)'''
+    if (isinstance(source, (ArchiveMember, GitBlob))):
+        return source.content
+    with open(source, 'rb') as fd:
+        return fd.read()
+
+
+def getSourceDigest(source):
+    '''returns the content hash of the given original file; this is the git blob hash, so that
+    files from git revisions need not be read (and equal files share their cache entries)'''
+    if (isinstance(source, GitBlob)):
+        return source.sha
+    content = readSource(source)
+    return hashlib.sha1("blob {}\0".format(len(content)) + content).hexdigest()
+
+
+class ExternalToolError(Exception):
+    '''This exception is raised if an external tool (e.g., srcml or astyle) fails.'''
+
+    def __init__(self, command, returncode, stderr):
+        self.command = command
+        self.returncode = returncode
+        self.stderr = stderr
+
+        message = "'{}' returned {}".format(" ".join(command), returncode)
+        if (stderr and stderr.strip()):
+            message += ": " + " ".join(stderr.split())
+        Exception.__init__(self, message)
+
+
+class ExternalToolTimeout(ExternalToolError):
+    '''This exception is raised if an external tool is killed because it exceeded its timeout.'''
+
+    def __init__(self, command, timeout):
+        self.command = command
+        self.returncode = None
+        self.stderr = None
+        self.timeout = timeout
+
+        Exception.__init__(self, "'{}' killed after {} seconds".format(" ".join(command), timeout))
+
+
+__toolSlots = None  # semaphore for the running external tool processes
+__toolTimeouts = {}  # tool name (None for all other tools) -> timeout in seconds
+__toolRetries = 0  # number of retries after a timeout
+__toolRetryFactor = 1.0  # factor for the timeout of each retry
+
+def configureTools(options):
+    '''configures the execution of external tools in this process and in the worker processes
+    started afterwards: the number of tool processes running at the same time (--tool-jobs),
+    their timeouts (--tool-timeout), and the retries after a timeout (--tool-retries);
+    the limit of tool processes is created only once, so main configures the tools before
+    the project processes (--project-jobs) are forked and all projects share the limit'''
+    global __toolSlots, __toolTimeouts, __toolRetries, __toolRetryFactor
+    if (options.tooljobs and __toolSlots is None):
+        __toolSlots = multiprocessing.BoundedSemaphore(options.tooljobs)
+    __toolTimeouts = options.tooltimeouts
+    __toolRetries = options.toolretries
+    __toolRetryFactor = options.toolretryfactor
+
+
+def _initWorker(toolSettings):
+    '''initializer of the worker processes: share the settings of external tools'''
+    global __toolSlots, __toolTimeouts, __toolRetries, __toolRetryFactor
+    __toolSlots, __toolTimeouts, __toolRetries, __toolRetryFactor = toolSettings
+
+    # a terminated worker unwinds (see _timeout), so that it does not leave running tools behind
+    signal.signal(signal.SIGTERM, _terminateWorker)
+
+
+def _terminateWorker(signum, frame):
+    raise SystemExit(1)
+
+
+def _getToolSettings():
+    return (__toolSlots, __toolTimeouts, __toolRetries, __toolRetryFactor)
+
+
+def getToolTimeout(command):
+    '''returns the timeout in seconds for the given command (None = no timeout)'''
+    tool = os.path.basename(command[0])
+    return __toolTimeouts.get(tool, __toolTimeouts.get(None))
+
+
+@contextmanager
+def _toolSlot():
+    '''waits until another external tool process may be started'''
+    if (__toolSlots is None):
+        yield
+        return
+
+    __toolSlots.acquire()
+    try:
+        yield
+    finally:
+        __toolSlots.release()
+
+
+def formatError(e):
+    return "{}: {}".format(type(e).__name__, e)
+
+
+def _startProcess(command, **kwargs):
+    '''starts the given command in a new process group, so that it can be killed with all its children'''
+    return subprocess.Popen(command, preexec_fn=os.setsid, **kwargs)
+
+
+def _killProcess(process):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:  # already terminated
+        pass
+
+
+def _killProcessOnTimeout(process, killed):
+    killed.set()
+    _killProcess(process)
+
+
+@contextmanager
+def _timeout(process, timeout):
+    '''kills the given process if it runs longer than timeout seconds (None = no timeout);
+    yields an event that is set if the process has been killed (see _timedOut).
+    The process is killed, too, if the block is left with an exception (e.g., on Ctrl-C or if
+    the worker is terminated), because its process group would be orphaned otherwise.'''
+    killed = threading.Event()
+    timer = None
+    if (timeout):
+        timer = threading.Timer(timeout, _killProcessOnTimeout, [process, killed])
+        timer.start()
+
+    try:
+        yield killed
+    except BaseException:
+        _killProcess(process)
+        process.wait()
+        raise
+    finally:
+        if (timer):
+            timer.cancel()
+
+
+def _timedOut(process, killed):
+    '''returns True if the given (finished) process has been killed because of its timeout;
+    the timer may fire after the process exited, but before it is cancelled'''
+    return killed.is_set() and process.returncode == -signal.SIGKILL
+
+
+def runBashCommand(command, shell=False, stdin=None, stdout=None, input=None):
+    '''runs the given command and returns its output (if stdout is subprocess.PIPE);
+    raises an ExternalToolError if the command fails or an ExternalToolTimeout if the
+    command exceeds its timeout (after all retries)'''
     # split command if not a list/tuple is given already
     if type(command) is str:
         command = command.split()
 
-    process = subprocess.Popen(command, shell=shell, stdin=stdin, stdout=stdout, stderr=stdout)
-    out, err = process.communicate()  # TODO do something with the output
-    process.wait()
+    timeout = getToolTimeout(command)
+    for retry in range(__toolRetries + 1):
+        if (retry and hasattr(stdout, "truncate")):  # discard the output of the killed process
+            stdout.seek(0)
+            stdout.truncate()
+
+        with _toolSlot():
+            process = _startProcess(command, shell=shell, stdin=stdin, stdout=stdout, stderr=subprocess.PIPE)
+            with _timeout(process, timeout) as killed:
+                out, err = process.communicate(input)
+
+        if (not _timedOut(process, killed)):
+            break
 
-    # FIXME do something with return value of process.wait()!
-    # if ret is not 0:
-    #     print "#### " + " ".join(command) + " returned " + str(ret)
+        if (retry == __toolRetries):
+            raise ExternalToolTimeout(command, timeout)
+        timeout *= __toolRetryFactor
 
+    if process.returncode != 0:
+        raise ExternalToolError(command, process.returncode, err)
 
-def replaceMultiplePatterns(replacements, infile, outfile):
-    with open(infile, "rb") as source:
-        with open(outfile, "w") as target:
-            data = source.read()
-            for pattern, replacement in replacements.iteritems():
-                data = re.sub(pattern, replacement, data, flags=re.MULTILINE)
-            target.write(data)
+    return out
 
 
-def stripEmptyLinesFromFile(infile, outfile):
-    with open(infile, "rb") as source:
-        with open(outfile, "w") as target:
-            for line in source:
-                if line.strip():
-                    target.write(line)
+def splitLines(source):
+    '''splits the given source into lines, keeping the line breaks (like iterating over a file)'''
+    lines = source.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def replaceMultiplePatterns(replacements, source):
+    for pattern, replacement in replacements.iteritems():
+        source = re.sub(pattern, replacement, source, flags=re.MULTILINE)
+    return source
+
+
+def stripEmptyLines(lines):
+    for line in lines:
+        if line.strip():
+            yield line
 
 
 def silentlyRemoveFile(filename):
@@ -132,15 +339,201 @@ def silentlyRemoveFile(filename):
             raise  # re-raise exception if a different error occured
 
 
+__toolVersions = {}
+
+def getToolVersion(tool):
+    '''returns the version string of the given external tool; it is determined once per process'''
+    if tool not in __toolVersions:
+        try:
+            __toolVersions[tool] = runBashCommand([tool, "--version"], stdout=subprocess.PIPE).strip()
+        except (OSError, ExternalToolError):  # tool is not available
+            __toolVersions[tool] = ""
+    return __toolVersions[tool]
+
+
+def pipeBashCommand(command, input):
+    '''runs the given command with input on stdin and returns its stdout'''
+    return runBashCommand(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, input=input)
+
+
 def src2srcml(src, srcml):
     __s2sml = "srcml"
-    runBashCommand([__s2sml, src, "--language=C"], stdout=open(srcml, 'w+'))  # + " -o " + srcml)
-    # FIXME incorporate "|| rm ${f}.xml" from bash
+    try:
+        with open(srcml, 'w+') as fdout:
+            runBashCommand([__s2sml, src, "--language=C"], stdout=fdout)  # + " -o " + srcml)
+    except:
+        silentlyRemoveFile(srcml)  # do not leave a broken srcML file
+        raise
 
 
 def srcml2src(srcml, src):
     __sml2s = "srcml"
-    runBashCommand([__sml2s, srcml], stdout=open(src, 'w+'))  # + " -o " + src)
+    with open(src, 'w+') as fdout:
+        runBashCommand([__sml2s, srcml], stdout=fdout)  # + " -o " + src)
+
+
+def src2srcmlString(source, filename):
+    '''transforms the given source code to srcML via pipes, without temporary files'''
+    __s2sml = "srcml"
+    return pipeBashCommand([__s2sml, "--language=C", "--filename=" + filename], source)
+
+
+def srcml2srcString(srcml):
+    '''transforms the given srcML document back to source code via pipes, without temporary files'''
+    __sml2s = "srcml"
+    return pipeBashCommand([__sml2s, "--output-src"], srcml)
+
+
+def _writeSrcmlUnits(archive, files, pending):
+    '''writes each unit of the given srcML archive stream to <file>.xml and removes the file from pending'''
+    index = 0
+    for _, unit in etree.iterparse(archive, events=("end",), tag="{" + _srcmlns + "}unit", huge_tree=True):
+        root = unit.getparent()
+        if (root is None):  # the archive itself
+            break
+
+        # units are matched by file name, or by position as a fallback
+        filename = unit.get("filename")
+        if (filename not in pending):
+            filename = files[index]
+        index += 1
+
+        with open(filename + ".xml", 'w') as fd:
+            fd.write(etree.tostring(unit, encoding="UTF-8", xml_declaration=True, standalone=True, with_tail=False))
+            fd.write("\n")
+        pending.discard(filename)
+
+        # free the memory of units that are already written
+        unit.clear()
+        while (unit.getprevious() is not None):
+            del root[0]
+
+
+def src2srcmlBatch(files):
+    '''transforms all given source files to srcML with a single srcml process (archive mode)
+    and writes each unit of the archive to <file>.xml, exactly as src2srcml would.
+    If the srcml process exceeds its timeout (the timeout for srcml times the number of files),
+    the remaining files are transformed one by one, so that only the culprits fail.
+    Returns the list of failures (file, error, timed out) for all files that could not be transformed.'''
+    __s2sml = "srcml"
+    pending = set(files)
+
+    timeout = getToolTimeout([__s2sml])
+    if (timeout):
+        timeout *= len(files)
+
+    # stderr goes to a temporary file, so that srcml cannot block on it while stdout is parsed
+    with _toolSlot(), tempfile.TemporaryFile() as errors:
+        process = _startProcess([__s2sml, "--archive", "--language=C"] + files,
+                                stdout=subprocess.PIPE, stderr=errors)
+        parseError = None
+        with _timeout(process, timeout) as killed:
+            try:
+                _writeSrcmlUnits(process.stdout, files, pending)
+            except etree.XMLSyntaxError as e:
+                parseError = e
+            process.stdout.close()
+            process.wait()
+        timedOut = _timedOut(process, killed)
+
+        if (parseError and not timedOut):
+            print "ERROR: cannot parse srcML archive ({})".format(parseError)
+        errors.seek(0)
+        err = errors.read()
+
+    if (timedOut):
+        failures = []
+        for f in files:
+            if (f in pending):
+                try:
+                    src2srcml(f, f + ".xml")
+                except ExternalToolError as e:
+                    failures.append((f, formatError(e), isinstance(e, ExternalToolTimeout)))
+        return failures
+
+    error = "no srcML unit created"
+    if (process.returncode != 0):
+        error = formatError(ExternalToolError([__s2sml, "--archive"], process.returncode, err))
+    return [(f, error, False) for f in files if f in pending]
+
+
+__xslTransformations = {}
+
+def applyXslTransformation(script, xml):
+    '''applies the given XSL script to the given XML document in-process;
+    each script is parsed and compiled only once per process'''
+    if script not in __xslTransformations:
+        __xslTransformations[script] = etree.XSLT(etree.parse(getPreparationScript(script)))
+    transform = __xslTransformations[script]
+
+    return str(transform(etree.fromstring(xml)))
+
+
+def _map(function, items, jobs):
+    '''applies function to all items, using a pool of worker processes if more than one job is requested'''
+    jobs = min(jobs, len(items))
+
+    if (jobs > 1):
+        pool = multiprocessing.Pool(jobs, _initWorker, (_getToolSettings(),))
+        try:
+            return pool.map(function, items, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        return map(function, items)
+
+
+def _imap(function, items, jobs):
+    '''applies function to all items (e.g., generated while the files of an archive are read) and
+    yields the results in order, using a pool of worker processes if more than one job is requested;
+    the pool takes the next item only when a worker is free, so that the items are never all in memory'''
+    items = iter(items)
+    try:
+        first = next(items)
+    except StopIteration:  # no pool for nothing to do
+        return
+    items = itertools.chain([first], items)
+
+    if (jobs <= 1):
+        for item in items:
+            yield function(item)
+        return
+
+    # the pool reads the items in a thread of its own, which would die silently on an error
+    errors = []
+
+    def _items():
+        try:
+            for item in items:
+                yield item
+        except Exception:
+            errors.append(sys.exc_info())
+
+    pool = multiprocessing.Pool(jobs, _initWorker, (_getToolSettings(),))
+    try:
+        for result in pool.imap(function, _items(), chunksize=1):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+    if (errors):
+        raise errors[0][0], errors[0][1], errors[0][2]
+
+
+def _transformBatchInPool(batch):
+    '''Entry point for the worker processes of AbstractPreparationThread.transformFilesToSrcml.
+    Returns the failures of the batch and the time it took.'''
+    start = time.time()
+    failures = src2srcmlBatch(batch)
+    return (failures, time.time() - start)
+
+
+def _prepareFileInPool(job):
+    '''Entry point for the worker processes of AbstractPreparationThread.prepareFiles.'''
+    thread, file, source = job
+    return thread.prepareSingleFile(file, source)
 
 
 # #################################################
@@ -150,12 +543,47 @@ class AbstractPreparationThread(object):
     '''This class prepares a single folder according to the given kind of preparations in an independent thread.'''
     __metaclass__ = ABCMeta
     sourcefolder = "source"
+    manifestfile = "manifest.json"
+    timeoutsfile = "timeouts.txt"
+    timingsfile = "timings.json"
 
     def __init__(self, options, inputfolder=None, inputfile=None):
         self.options = options
         self.notrunnable = False
+        self.batchSrcml = False
+        self.stageMemo = None  # results of stages shared with other preparation kinds, see PreparationDAG
+        self.cacheKeys = {}  # file to prepare -> its key in the cache
+        self.timings = StageTimings()  # time per stage and file, see --timings
+
+        # limits for external tool processes (shared by all worker processes, see main)
+        configureTools(self.options)
+
+        # cache for prepared files
+        self.cache = None
+        if (self.options.cachedir):
+            self.cache = PreparationCache(os.path.abspath(self.options.cachedir), self.options.cachesize * 1024 * 1024)
+        elif (inputfolder and isRevision(inputfolder)):  # all revisions of a repository share their prepared files
+            self.cache = PreparationCache(getCacheFolder(inputfolder), self.options.cachesize * 1024 * 1024)
+
+        if (inputfolder and isRevision(inputfolder)):
+            # the sources are read from the git repository directly, the results go to the revision folder
+            self.file = None
+            self.folder = getRevisionFolder(inputfolder)
+            self.source = inputfolder
+
+            self.project = os.path.basename(self.folder)
+            self.subfolder = os.path.join(self.folder, self.getSubfolder())
+
+        elif (inputfolder and isArchive(inputfolder)):
+            # the sources are read from the archive directly, the results go to the project folder
+            self.file = None
+            self.folder = getProjectFolder(inputfolder)
+            self.source = inputfolder
 
-        if (inputfolder):
+            self.project = os.path.basename(self.folder)
+            self.subfolder = os.path.join(self.folder, self.getSubfolder())
+
+        elif (inputfolder):
             self.file = None
             self.folder = inputfolder
             self.source = os.path.join(self.folder, self.sourcefolder)
@@ -173,7 +601,6 @@ class AbstractPreparationThread(object):
             self.project = os.path.basename(self.file)
 
             # get full path of temp folder for
-            import tempfile
             self.subfolder = tempfile.mkdtemp(suffix=self.getSubfolder())
 
 
@@ -206,46 +633,338 @@ class AbstractPreparationThread(object):
         if (self.file):
 
             self.currentFile = os.path.join(self.subfolder, self.project)
-            shutil.copyfile(self.file, self.currentFile)
 
-            self.backupCounter = 0
-            self.prepareFile()
+            failures = self.prepareFiles([(self.currentFile, self.file)])
+            self.reportFailures(failures)
+            if (failures or not os.path.isfile(self.currentFile + ".xml")):
+                print "ERROR: input file '{}' cannot be prepared!".format(self.file)
+                self.teardown()
+                sys.exit(1)
 
             shutil.copyfile(self.currentFile + ".xml", self.outfile)
         else:
-            # copy C and H files to self.subfolder
-            self.copyToSubfolder()
-            # preparation for all files in the self.subfolder (only C and H files)
-            for root, subFolders, files in os.walk(self.subfolder):
-                for file in files:
-                    f = os.path.join(root, file)
-                    self.currentFile = f
+            # transform the files to srcML in batches after all other stages
+            self.batchSrcml = (self.options.srcmlbatch > 1)
 
-                    self.backupCounter = 0
-                    self.prepareFile()
+            # preparation for all new and changed files (only C and H files) into self.subfolder,
+            # as they are read from self.source
+            failures = self.prepareFiles(self.syncToSubfolder())
+            self.reportFailures(failures)
+            self.updateManifest(failures)
+            self.writeTimings()
 
         self.teardown()
 
-    def copyToSubfolder(self):
-
-        # TODO debug
-        # echo '### preparing sources ...'
-        # echo '### copying all-files to one folder ...'
+    def prepareFiles(self, files):
+        '''Prepares the given files, given as (file, original file) tuples, in parallel if more
+        than one job is requested. The tuples may be generated while the original files are read
+        (see syncToSubfolder), so that each original file (e.g., the content of an archive member)
+        is prepared as soon as it is read and dropped afterwards.
+        Returns the list of failures (file, error, timed out) for all files that failed.'''
+
+        # restore unchanged files from the cache and prepare only the remaining ones
+        jobs = ((self, f, source) for (f, source) in files if not self.restoreFromCache(f, source))
+
+        prepared = []
+        failures = []
+        for (f, error, timedOut, timings) in _imap(_prepareFileInPool, jobs, self.options.jobs):
+            prepared.append(f)
+            if (error):
+                failures.append((f, error, timedOut))
+            self.timings.add(f, timings)
+
+        return failures + self.finishFiles(prepared, failures)
+
+    def restoreFromCache(self, file, source):
+        '''restores the given file (read from the original file source) from the cache, if possible,
+        and returns True if the file does not need to be prepared anymore'''
+        if (not self.cache):
+            return False
+
+        self.cacheKeys[file] = self.getCacheKey(file, source)
+        return self.cache.restore(self.cacheKeys[file], self.getArtifacts(file))
+
+    def finishFiles(self, files, failures):
+        '''Finishes the preparation of the given files after all per-file stages have run
+        (batched srcML transformation, filling the cache).
+        Returns the list of failures (file, error, timed out) for all files that failed additionally.'''
+        failed = set(f for (f, _, _) in failures)
+        newfailures = []
+
+        if (self.batchSrcml and "transformFileToSrcml" in self.getStages()):
+            newfailures += self.transformFilesToSrcml([f for f in files if f not in failed])
+            failed.update(f for (f, _, _) in newfailures)
+
+        if (self.cache):
+            for f in files:
+                if (f not in failed):
+                    self.cache.store(self.cacheKeys[f], self.getArtifacts(f))
+            self.cache.evict()
+
+        return newfailures
+
+    def transformFilesToSrcml(self, files):
+        '''Transforms the given (prepared) files to srcML with one srcml process per batch.
+        Returns the list of failures (file, error, timed out) for all files that failed.'''
+        size = self.options.srcmlbatch
+        batches = [files[i:i + size] for i in range(0, len(files), size)]
+
+        results = _map(_transformBatchInPool, batches, self.options.jobs)
+
+        # the time of a batch is attributed to its files in equal shares
+        for (batch, (_, seconds)) in zip(batches, results):
+            for f in batch:
+                self.timings.add(f, [("transformFilesToSrcml", seconds / len(batch))])
+
+        return [failure for (failures, _) in results for failure in failures]
+
+    def prepareSource(self, source, filename):
+        '''Prepares the given source of a (virtual) file with the given name in memory and
+        returns the result (the srcML document, if the preparation includes the srcML
+        transformation). No files are written.'''
+        self.currentFile = filename
+        self.currentSource = source
+        self.currentSourceOnDisk = True  # there is no file to write
+        self.stageHistory = StageHistory(filename)  # never written
+        self.backupCounter = 0
+
+        for stage in self.getCheckedStages():
+            if (stage == "transformFileToSrcml"):
+                return src2srcmlString(self.currentSource, filename)
+
+            self.currentStage = stage
+            getattr(self, stage)()
+
+        return self.currentSource
+
+    def prepareSingleFile(self, file, source=None):
+        '''Prepares the given file (reading it from source, if given) and returns a tuple
+        (file, error, timed out, timings), where error is None if the preparation succeeded,
+        timed out tells whether it failed because an external tool exceeded its timeout, and
+        timings is the list of (stage, seconds) tuples for the applied stages.'''
+        self.currentFile = file
+        self.currentSourceFile = source or file
+        self.currentStage = None
+        self.stageTimings = []
+        self.backupCounter = 0
+
+        try:
+            self.prepareFile()
+        except Exception as e:
+            error = formatError(e)
+            if (self.currentStage):
+                error = "stage '{}': {}".format(self.currentStage, error)
+            return (file, error, isinstance(e, ExternalToolTimeout), self.stageTimings)
+
+        return (file, None, False, self.stageTimings)
+
+    def getArtifacts(self, file):
+        '''returns the paths of all files that result from preparing the given file'''
+        artifacts = [file]
+        if ("transformFileToSrcml" in self.getStages()):
+            artifacts.append(file + ".xml")
+        return artifacts
+
+    def getSignature(self):
+        '''returns everything besides the source file itself that determines the preparation result'''
+        tools = ["srcml"]
+        if ("formatCode" in self.getStages()):
+            tools.append("astyle")
+
+        return [self.getPreparationName(), ",".join(self.getStages()), str(self.options.srcmlcomments),
+                self.options.unbalanced] + map(getToolVersion, tools)
+
+    def getCacheKey(self, file, source):
+        '''returns the cache key of the given (not yet prepared) file, read from the original file source'''
+        _, extension = os.path.splitext(file)  # e.g., include guards are removed from H files only
+
+        return self.cache.getContentKey(getSourceDigest(source), extension, *self.getSignature())
+
+    def reportFailures(self, failures):
+        for (file, error, _) in failures:
+            print "ERROR: preparation of file '{}' failed ({})".format(file, error)
+
+        # summary of the files that were skipped because an external tool timed out
+        timeoutsfile = os.path.join(self.subfolder, self.timeoutsfile)
+        timeouts = [(file, error) for (file, error, timedOut) in failures if timedOut]
+        if (not timeouts):
+            silentlyRemoveFile(timeoutsfile)
+            return
 
-        # delete folder if already existing
-        if os.path.isdir(self.subfolder):
+        with open(timeoutsfile, 'w') as fd:
+            for (file, error) in timeouts:
+                fd.write("{}\t{}\n".format(os.path.relpath(file, self.subfolder), error))
+        print "WARNING: {} file(s) skipped due to timeouts, see '{}'".format(len(timeouts), timeoutsfile)
+
+    def syncToSubfolder(self):
+        '''Updates self.subfolder incrementally according to the manifest of the last run:
+        new and changed C and H files of self.source are registered for preparation (they are
+        read from self.source directly, not copied), the outputs of deleted files are removed.
+        Yields (file in self.subfolder, original file) for each file that needs to be prepared,
+        as soon as it is read from self.source.'''
+        self.startSync()
+        for (relative, mtime, size, source) in self.iterateSourceFiles():
+            target = self.syncSourceFile(relative, mtime, size, source)
+            if (target):
+                yield (target, source)
+        self.finishSync()
+
+    def startSync(self):
+        '''starts the update of self.subfolder (see syncToSubfolder)'''
+
+        # read the manifest of the last run; start from scratch if the preparation itself has changed
+        self.previousManifest = self.readManifest()
+        if (not self.previousManifest and os.path.isdir(self.subfolder)):
             shutil.rmtree(self.subfolder)
+        self.manifest = {}
+
+    def syncSourceFile(self, relative, mtime, size, source):
+        '''registers the given original file of self.source (see iterateSourceFiles) in the manifest
+        and returns the file in self.subfolder to prepare, or None if it is unchanged and prepared'''
+        target = os.path.join(self.subfolder, relative)
+
+        # skip files that are unchanged and completely prepared
+        entry = self.previousManifest.get(relative)
+        prepared = entry and all(os.path.isfile(os.path.join(self.subfolder, output))
+                                 for output in entry["outputs"])
+        if (prepared and (entry["mtime"], entry["size"]) == (mtime, size)):
+            self.manifest[relative] = entry
+            return None
+
+        digest = getSourceDigest(source)
+
+        if (prepared and entry["sha1"] == digest):  # only touched
+            entry.update(mtime=mtime, size=size)
+            self.manifest[relative] = entry
+            return None
+
+        # register new or changed file
+        if (not os.path.isdir(os.path.dirname(target))):
+            os.makedirs(os.path.dirname(target))
+
+        self.manifest[relative] = {
+            "mtime": mtime,
+            "size": size,
+            "sha1": digest,
+            "outputs": [os.path.relpath(output, self.subfolder) for output in self.getArtifacts(target)]
+        }
+        return target
+
+    def finishSync(self):
+        '''finishes the update of self.subfolder (see syncToSubfolder) after all original files have been read'''
+
+        # delete the outputs (and backups and conditional blocks of the analyses) of deleted files
+        previous = self.previousManifest
+        for relative in set(previous) - set(self.manifest):
+            for output in previous[relative]["outputs"]:
+                silentlyRemoveFile(os.path.join(self.subfolder, output))
+                silentlyRemoveFile(getBlocksFile(os.path.join(self.subfolder, output)))
+            for backup in glob.glob(os.path.join(self.subfolder, relative) + ".bak*"):
+                silentlyRemoveFile(backup)
+
+    def iterateSourceFiles(self):
+        '''yields (relative path, mtime, size, original file) for all C and H files of self.source;
+        for archives, the original file is an ArchiveMember that holds the content of the file
+        (the archive is read in a single pass, one member after the other);
+        for git revisions, it is a GitBlob and its blob hash takes the place of the mtime'''
+        if (isRevision(self.source)):
+            for blob in readRevision(self.source, isSourceFile):
+                yield (os.path.normpath(blob.name), blob.sha, blob.size, blob)
+            return
 
-        # copy all C and H files recursively to the subfolder
-        shutil.copytree(self.source, self.subfolder, ignore=filterForFiles)
+        if (isArchive(self.source)):
+            for member in readArchive(self.source, isSourceFile):
+                relative = os.path.normpath(member.name)
+                if (os.path.isabs(relative) or relative.startswith(os.pardir)):  # never write outside of self.subfolder
+                    print "WARNING: skipping archive member '{}'".format(member.name)
+                    continue
+                yield (relative, member.mtime, member.size, member)
+            return
+
+        for root, subFolders, filenames in os.walk(self.source, followlinks=True):
+            ignore = filterForFiles(root, subFolders + filenames)
+            subFolders[:] = [folder for folder in subFolders if folder not in ignore]
+
+            for filename in filenames:
+                if (filename in ignore):
+                    continue
+
+                source = os.path.join(root, filename)
+                stat = os.stat(source)
+                yield (os.path.relpath(source, self.source), stat.st_mtime, stat.st_size, source)
+
+    def __getstate__(self):
+        # worker processes prepare single files and need no bookkeeping of the whole folder
+        state = self.__dict__.copy()
+        for attribute in ("manifest", "previousManifest", "cacheKeys", "timings"):
+            state.pop(attribute, None)
+        return state
+
+    def writeTimings(self):
+        '''writes the timings report of the prepared files, if requested with --timings'''
+        if (self.options.timings):
+            self.timings.write(os.path.join(self.subfolder, self.timingsfile), self.options.timings)
+
+    def readManifest(self):
+        '''returns the file entries of the manifest in self.subfolder,
+        or an empty dictionary if there is no manifest for the current preparation'''
+        manifestfile = os.path.join(self.subfolder, self.manifestfile)
+        if (not os.path.isfile(manifestfile)):
+            return {}
+
+        try:
+            with open(manifestfile, 'r') as fd:
+                manifest = json.load(fd)
+        except ValueError:  # broken manifest
+            return {}
+
+        if (manifest.get("signature") != self.getSignature()):
+            return {}
+        return manifest["files"]
+
+    def updateManifest(self, failures):
+        # failed files are prepared again in the next run; their (partial or outdated) outputs are
+        # removed, so that the analyses do not pick them up
+        for (file, _, _) in failures:
+            self.manifest.pop(os.path.relpath(file, self.subfolder), None)
+            for output in self.getArtifacts(file):
+                silentlyRemoveFile(output)
+        self.writeManifest()
+
+    def writeManifest(self):
+        manifestfile = os.path.join(self.subfolder, self.manifestfile)
+        if (not os.path.isdir(self.subfolder)):
+            os.makedirs(self.subfolder)
+
+        with open(manifestfile + ".tmp", 'w') as fd:
+            json.dump({"signature": self.getSignature(), "files": self.manifest}, fd, indent=1, sort_keys=True)
+        os.rename(manifestfile + ".tmp", manifestfile)
 
     def backupCurrentFile(self):
-        '''# backup file'''
+        '''# backup file (as a snapshot in the stage history, see StageHistory)'''
         if (not self.options.nobak):
-            bak = self.currentFile + ".bak" + str(self.backupCounter)
-            shutil.copyfile(self.currentFile, bak)
+            self.stageHistory.add(self.currentStage, self.currentSource)
             self.backupCounter += 1
 
+    def readCurrentFile(self):
+        '''reads the current file (from its original location) into memory, so that the preparation stages can work on it'''
+        self.currentSource = readSource(self.currentSourceFile)
+        self.currentSourceOnDisk = (self.currentSourceFile == self.currentFile)
+
+    def writeCurrentFile(self):
+        '''writes the in-memory state of the current file back to disk, if it has changed'''
+        if (not self.currentSourceOnDisk):
+            with open(self.currentFile, 'wb') as fd:
+                fd.write(self.currentSource)
+            self.currentSourceOnDisk = True
+
+    def setCurrentSource(self, source):
+        self.currentSource = source
+        self.currentSourceOnDisk = False
+
+    def getCurrentLines(self):
+        return splitLines(self.currentSource)
+
     @classmethod
     @abstractmethod
     def getPreparationName(cls):
@@ -255,57 +974,120 @@ class AbstractPreparationThread(object):
     def getSubfolder(self):
         pass
 
+    @classmethod
     @abstractmethod
-    def prepareFile(self):
+    def getStages(cls):
+        '''returns the names of the preparation stages (methods) to apply to each file, in order'''
         pass
 
-    # TODO refactor such that file has not be opened several times! (__currentfile)
-    def rewriteMultilineMacros(self):
-        tmp = self.currentFile + "tmp.txt"
+    # stages that only transform the in-memory source and, thus, can be shared between preparation kinds
+    pureStages = frozenset(["checkConditionals", "rewriteMultilineMacros", "formatCode", "deleteComments", "deleteWhitespace",
+                            "rewriteIfdefsAndIfndefs", "removeIncludeGuards", "removeOtherPreprocessor",
+                            "deleteEmptyLines"])
+
+    def getCheckedStages(self):
+        '''returns the stages to apply to each file including the pre-flight check of the conditionals,
+        which runs right after deleteComments, so that it reuses the source without comments, or
+        before all other stages, if the comments are not deleted or deleted by srcML'''
+        stages = self.getStages()
+        if (not self.checksSourceWithoutComments()):
+            return ["checkConditionals"] + stages
+
+        index = stages.index("deleteComments") + 1
+        return stages[:index] + ["checkConditionals"] + stages[index:]
+
+    def checksSourceWithoutComments(self):
+        return ("deleteComments" in self.getStages() and not self.options.srcmlcomments)
+
+    def prepareFile(self):
+        # read the file once, apply all stages in memory, and write the result once
+        self.readCurrentFile()
+        self.stageHistory = StageHistory(self.currentFile)
+
+        try:
+            prefix = ()
+            for stage in self.getCheckedStages():
+                prefix += (stage,)
+                self.currentStage = stage
+                start = time.time()
+                self.applyStage(stage, prefix)
+                self.stageTimings.append((stage, time.time() - start))
+
+            self.writeCurrentFile()
+        finally:
+            # keep the history of failed files as well, for debugging
+            self.stageHistory.write()
+
+    def applyStage(self, stage, prefix):
+        '''applies the given stage to the current file; if the result for the same stage prefix
+        is already known from another preparation kind, it is reused instead'''
+        if (self.stageMemo is None or stage not in self.pureStages):
+            getattr(self, stage)()
+            return
+
+        if (prefix in self.stageMemo):
+            source, backup = self.stageMemo[prefix]
+            if (backup):
+                self.backupCurrentFile()
+            self.setCurrentSource(source)
+            return
 
+        counter = self.backupCounter
+        getattr(self, stage)()
+        self.stageMemo[prefix] = (self.currentSource, self.backupCounter != counter)
+
+    def checkConditionals(self):
+        '''checks whether the conditionals of the current file are balanced before the
+        (expensive) preparation; unbalanced files are flagged or skipped (see --unbalanced)'''
+        if (self.options.unbalanced == "prepare"):
+            return
+
+        check = checkConditionals.checkConditionals
+        if (self.checksSourceWithoutComments()):  # see getCheckedStages
+            check = checkConditionals.checkDirectives
+
+        try:
+            check(self.currentSource)
+        except checkConditionals.UnbalancedConditionalsError as e:
+            if (self.options.unbalanced == "skip"):
+                raise
+            print "WARNING: unbalanced conditionals in file '{}' ({})".format(self.currentFile, e)
+
+    def rewriteMultilineMacros(self):
         self.backupCurrentFile()  # backup file
 
         # turn multiline macros to oneliners
-        shutil.move(self.currentFile, tmp)  # move for script
-        rewriteMultilineMacros.translate(tmp, self.currentFile)  # call function
-
-        os.remove(tmp)  # remove temp file
+        self.setCurrentSource(''.join(rewriteMultilineMacros.translateLines(self.getCurrentLines())))
 
     def formatCode(self):
-        tmp = self.currentFile + "tmp.txt"
-
         self.backupCurrentFile()  # backup file
 
         # call astyle to format file in Java-style
-        shutil.move(self.currentFile, tmp)  # move for script
-        runBashCommand(["astyle", "--style=java"], stdin=open(tmp, 'r'), stdout=open(self.currentFile, 'w+'))
-
-        os.remove(tmp)  # remove temp file
+        self.setCurrentSource(pipeBashCommand(["astyle", "--style=java"], self.currentSource))
 
     def deleteComments(self):
-        tmp = self.currentFile + "tmp.xml"
-        tmp_out = self.currentFile + "tmp_out.xml"
+        # use the srcML-based transformation if requested
+        if (self.options.srcmlcomments):
+            self.deleteCommentsWithSrcml()
+            return
 
         self.backupCurrentFile()  # backup file
 
-        # call src2srcml to transform code to xml
-        src2srcml(self.currentFile, tmp)
-
-        # delete all comments in the xml and write to another file
-        runBashCommand(["xsltproc", getPreparationScript("deleteComments.xsl"), tmp], stdout=open(tmp_out, 'w+'))
+        # replace all comments with empty lines
+        self.setCurrentSource(deleteComments.deleteComments(self.currentSource))
 
-        # re-transform the xml to a normal source file
-        srcml2src(tmp_out, self.currentFile)
+    def deleteCommentsWithSrcml(self):
+        self.backupCurrentFile()  # backup file
 
-        # delete temp files
-        silentlyRemoveFile(tmp)
-        silentlyRemoveFile(tmp_out)
+        # transform code to xml, delete all comments in the xml,
+        # and re-transform the xml to a normal source file
+        srcml = src2srcmlString(self.currentSource, self.currentFile)
+        srcml = applyXslTransformation("deleteComments.xsl", srcml)
+        self.setCurrentSource(srcml2srcString(srcml))
 
     def deleteWhitespace(self):
         """deletes leading, trailing and inter (# ... if) whitespaces,
         replaces multiple whitespace with a single space"""
-        tmp = self.currentFile + "tmp.txt"
-
         self.backupCurrentFile()  # backup file
 
         # replace patterns with replacements
@@ -317,21 +1099,13 @@ class AbstractPreparationThread(object):
             '[ \t]{2,}': ' '  # multiple whitespace to one space
 
         }
-        replaceMultiplePatterns(replacements, self.currentFile, tmp)
-
-        # move temp file to output file
-        shutil.move(tmp, self.currentFile)
+        self.setCurrentSource(replaceMultiplePatterns(replacements, self.currentSource))
 
     def rewriteIfdefsAndIfndefs(self):
-        tmp = self.currentFile + "tmp.txt"
-
         self.backupCurrentFile()  # backup file
 
         # rewrite #if(n)def ... to #if (!)defined(...)
-        d = rewriteIfdefs.rewriteFile(self.currentFile, open(tmp, 'w'))
-
-        # move temp file to output file
-        shutil.move(tmp, self.currentFile)
+        self.setCurrentSource(''.join(rewriteIfdefs.rewriteLines(self.getCurrentLines())))
 
     def removeIncludeGuards(self):
         # include guards only exist in H files, otherwise return
@@ -339,44 +1113,31 @@ class AbstractPreparationThread(object):
         if (extension not in _filepattern_h):
             return
 
-        tmp = self.currentFile + "tmp.txt"
-
         self.backupCurrentFile()  # backup file
 
         # delete include guards
-        deleteIncludeGuards.apply(self.currentFile, open(tmp, 'w'))
-
-        # move temp file to output file
-        shutil.move(tmp, self.currentFile)
+        self.setCurrentSource(''.join(deleteIncludeGuards.applyLines(self.getCurrentLines())))
 
     def removeOtherPreprocessor(self):
-        tmp = self.currentFile + "tmp.txt"
-
         self.backupCurrentFile()  # backup file
 
         # delete other preprocessor statements than #ifdefs
-        cpplib._filterAnnotatedIfdefs(self.currentFile, tmp)
-
-        # move temp file to output file
-        shutil.copyfile(tmp, self.currentFile)
+        self.setCurrentSource(''.join(cpplib._filterAnnotatedIfdefLines(self.getCurrentLines())))
 
     def deleteEmptyLines(self):
-        tmp = self.currentFile + "tmp.txt"
-
         self.backupCurrentFile()  # backup file
 
         # remove empty lines
-        stripEmptyLinesFromFile(self.currentFile, tmp)
-
-        # move temp file to output file
-        shutil.move(tmp, self.currentFile)
+        self.setCurrentSource(''.join(stripEmptyLines(self.getCurrentLines())))
 
     def transformFileToSrcml(self):
         source = self.currentFile
         dest = self.currentFile + ".xml"
 
-        # transform to srcml
-        src2srcml(source, dest)
+        # transform to srcml (deferred to transformFilesToSrcml in batch mode)
+        self.writeCurrentFile()
+        if (not self.batchSrcml):
+            src2srcml(source, dest)
 
 
 # #################################################
@@ -390,27 +1151,30 @@ class GeneralPreparationThread(AbstractPreparationThread):
     def getSubfolder(self):
         return "_cppstats"
 
-    def prepareFile(self):
-        # multiline macros
-        self.rewriteMultilineMacros()
+    @classmethod
+    def getStages(cls):
+        return [
+            # multiline macros
+            "rewriteMultilineMacros",
 
-        # delete comments
-        self.deleteComments()
+            # delete comments
+            "deleteComments",
 
-        # delete leading, trailing and inter (# ... if) whitespaces
-        self.deleteWhitespace()
+            # delete leading, trailing and inter (# ... if) whitespaces
+            "deleteWhitespace",
 
-        # rewrite #if(n)def ... to #if (!)defined(...)
-        self.rewriteIfdefsAndIfndefs()
+            # rewrite #if(n)def ... to #if (!)defined(...)
+            "rewriteIfdefsAndIfndefs",
 
-        # removes include guards from H files
-        self.removeIncludeGuards()
+            # removes include guards from H files
+            "removeIncludeGuards",
 
-        # delete empty lines
-        self.deleteEmptyLines()
+            # delete empty lines
+            "deleteEmptyLines",
 
-        # transform file to srcml
-        self.transformFileToSrcml()
+            # transform file to srcml
+            "transformFileToSrcml",
+        ]
 
 
 class DisciplinePreparationThread(AbstractPreparationThread):
@@ -421,30 +1185,33 @@ class DisciplinePreparationThread(AbstractPreparationThread):
     def getSubfolder(self):
         return "_cppstats_discipline"
 
-    def prepareFile(self):
-        # multiline macros
-        self.rewriteMultilineMacros()
+    @classmethod
+    def getStages(cls):
+        return [
+            # multiline macros
+            "rewriteMultilineMacros",
 
-        # delete comments
-        self.deleteComments()
+            # delete comments
+            "deleteComments",
 
-        # delete leading, trailing and inter (# ... if) whitespaces
-        self.deleteWhitespace()
+            # delete leading, trailing and inter (# ... if) whitespaces
+            "deleteWhitespace",
 
-        # rewrite #if(n)def ... to #if (!)defined(...)
-        self.rewriteIfdefsAndIfndefs()
+            # rewrite #if(n)def ... to #if (!)defined(...)
+            "rewriteIfdefsAndIfndefs",
 
-        # removes include guards from H files
-        self.removeIncludeGuards()
+            # removes include guards from H files
+            "removeIncludeGuards",
 
-        # removes other preprocessor than #ifdefs
-        self.removeOtherPreprocessor()
+            # removes other preprocessor than #ifdefs
+            "removeOtherPreprocessor",
 
-        # delete empty lines
-        self.deleteEmptyLines()
+            # delete empty lines
+            "deleteEmptyLines",
 
-        # transform file to srcml
-        self.transformFileToSrcml()
+            # transform file to srcml
+            "transformFileToSrcml",
+        ]
 
 
 class FeatureLocationsPreparationThread(AbstractPreparationThread):
@@ -455,23 +1222,26 @@ class FeatureLocationsPreparationThread(AbstractPreparationThread):
     def getSubfolder(self):
         return "_cppstats_featurelocations"
 
-    def prepareFile(self):
-        # multiline macros
-        self.rewriteMultilineMacros()
+    @classmethod
+    def getStages(cls):
+        return [
+            # multiline macros
+            "rewriteMultilineMacros",
 
-        # delete comments
-        self.deleteComments()
+            # delete comments
+            "deleteComments",
 
-        # delete leading, trailing and inter (# ... if) whitespaces
-        self.deleteWhitespace()
+            # delete leading, trailing and inter (# ... if) whitespaces
+            "deleteWhitespace",
 
-        # FIXME remove include guards?!
+            # FIXME remove include guards?!
 
-        # rewrite #if(n)def ... to #if (!)defined(...)
-        self.rewriteIfdefsAndIfndefs()
+            # rewrite #if(n)def ... to #if (!)defined(...)
+            "rewriteIfdefsAndIfndefs",
 
-        # transform file to srcml
-        self.transformFileToSrcml()
+            # transform file to srcml
+            "transformFileToSrcml",
+        ]
 
 
 class PrettyPreparationThread(AbstractPreparationThread):
@@ -482,18 +1252,114 @@ class PrettyPreparationThread(AbstractPreparationThread):
     def getSubfolder(self):
         return "_cppstats_pretty"
 
-    def prepareFile(self):
-        # multiline macros
-        self.rewriteMultilineMacros()
+    @classmethod
+    def getStages(cls):
+        return [
+            # multiline macros
+            "rewriteMultilineMacros",
+
+            # format the code
+            "formatCode",
+
+            # # delete comments
+            # "deleteComments",
+            #
+            # # delete empty lines
+            # "deleteEmptyLines",
+        ]
 
-        # format the code
-        self.formatCode()
 
-        # # delete comments
-        # self.deleteComments()
-        #
-        # # delete empty lines
-        # self.deleteEmptyLines()
+# #################################################
+# combined preparation of several kinds
+
+def _prepareFileForKindsInPool(job):
+    '''Entry point for the worker processes of PreparationDAG.run.
+    Prepares one original file for several preparation kinds and returns the files to prepare
+    (one per kind or None) together with (error or None, timed out, timings) per kind.'''
+    threads, files, source = job
+    memo = {}  # stage prefix -> (source, backup taken); the nodes of the DAG for this file
+
+    results = []
+    for (thread, file) in zip(threads, files):
+        if (file is None):  # no need to prepare the file for this kind
+            results.append((None, False, []))
+            continue
+
+        thread.stageMemo = memo
+        try:
+            results.append(thread.prepareSingleFile(file, source)[1:])
+        finally:
+            thread.stageMemo = None
+    return (files, results)
+
+
+class PreparationDAG(object):
+    '''This class prepares a single folder for several kinds of preparations at once.
+    The stage lists of all kinds form a DAG (a prefix tree) whose nodes are identified by
+    their stage prefix: e.g., general, discipline, and featurelocations share the prefix
+    (rewriteMultilineMacros, deleteComments, deleteWhitespace, rewriteIfdefsAndIfndefs).
+    Each file runs through each node only once and forks at the point of divergence.
+    The original files are read only once for all kinds, too (e.g., in a single pass over an archive).'''
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.options = threads[0].options
+
+    def run(self):
+        for thread in self.threads:
+            if (thread.notrunnable):
+                print "ERROR: No single file or input list of projects given!"
+                return
+
+        for thread in self.threads:
+            thread.startup()
+            thread.batchSrcml = (self.options.srcmlbatch > 1)
+
+        # prepare the files as they are read; files holds the prepared file per kind (or None)
+        files = []
+        results = []
+        for (paths, kinds) in _imap(_prepareFileForKindsInPool, self.iterateJobs(), self.options.jobs):
+            files.append(paths)
+            results.append(kinds)
+
+        # finish each kind separately
+        for (i, thread) in enumerate(self.threads):
+            threadfiles = [paths[i] for paths in files if paths[i]]
+            failures = []
+            for (paths, kinds) in zip(files, results):
+                error, timedOut, timings = kinds[i]
+                if (error):
+                    failures.append((paths[i], error, timedOut))
+                if (paths[i]):
+                    thread.timings.add(paths[i], timings)
+            failures += thread.finishFiles(threadfiles, failures)
+
+            thread.reportFailures(failures)
+            thread.updateManifest(failures)
+            thread.writeTimings()
+            thread.teardown()
+
+    def iterateJobs(self):
+        '''updates the preparation folders of all kinds (see AbstractPreparationThread.syncToSubfolder)
+        in a single pass over the original files and yields a job for each file that needs to be
+        prepared for any kind: (threads, file to prepare per kind or None, original file)'''
+        for thread in self.threads:
+            thread.startSync()
+
+        # all kinds read the same input
+        for (relative, mtime, size, source) in self.threads[0].iterateSourceFiles():
+            paths = []
+            for thread in self.threads:
+                path = thread.syncSourceFile(relative, mtime, size, source)
+                if (path and thread.restoreFromCache(path, source)):  # restored unchanged file
+                    path = None
+                paths.append(path)
+
+            if (any(paths)):
+                yield (self.threads, paths, source)
+
+        for thread in self.threads:
+            thread.finishSync()
 
 
 # #################################################
@@ -530,6 +1396,26 @@ def applyFile(kind, inputfile, options):
     thread.run()
 
 
+def applyStream(kind, instream, outstream, options):
+    '''Prepares the source read from instream in memory and writes the result to outstream.
+    All log output is redirected to stderr, so that outstream can be stdout.'''
+    source = instream.read()
+    filename = cli.getStreamFileName(instream, options)
+
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    try:
+        thread = getKinds()[kind](options)
+        result = thread.prepareSource(source, filename)
+    except checkConditionals.UnbalancedConditionalsError as e:  # --unbalanced skip
+        print "ERROR: file '{}' skipped due to unbalanced conditionals ({})".format(filename, e)
+        sys.exit(1)
+    finally:
+        sys.stdout = stdout
+
+    outstream.write(result)
+
+
 def getFoldersFromInputListFile(inputlist):
     ''' This method reads the given inputfile line-wise and returns the read lines without line breaks.'''
 
@@ -538,7 +1424,8 @@ def getFoldersFromInputListFile(inputlist):
     file.close()  # close file
 
     folders = filter(lambda f: not f.startswith("#"), folders)  # remove commented lines
-    folders = filter(os.path.isdir, folders)  # remove all non-directories
+    folders = filter(lambda f: os.path.isdir(f) or (isArchive(f) and os.path.isfile(f)) or isRevision(f),
+                     folders)  # remove all non-directories (except for archives and git revisions)
     folders = map(os.path.normpath, folders)  # normalize paths for easier transformations
 
     # TODO log removed folders
@@ -546,26 +1433,46 @@ def getFoldersFromInputListFile(inputlist):
     return folders
 
 
-def applyFolders(kind, inputlist, options):
+def applyFolder(kind, folder, options):
     kinds = getKinds()
 
+    # get proper preparation thread and call it
+    threadClass = kinds[kind]
+    thread = threadClass(options, inputfolder=folder)
+    thread.run()
+
+
+def applyFolderAll(folder, options, kinds=None):
+    '''Applies the given preparation kinds (default: all) to the folder; the stages that
+    the kinds have in common are applied only once per file (see PreparationDAG).'''
+    allkinds = getKinds()
+    if (kinds is None):
+        kinds = allkinds.keys()
+
+    threads = [allkinds[kind](options, inputfolder=folder) for kind in kinds]
+    PreparationDAG(threads).run()
+
+
+def applyFolders(kind, inputlist, options):
+    '''Applies the preparation kind to all folders of the input list.
+    Returns the number of folders that failed.'''
+
     # get the list of projects/folders to process
     folders = getFoldersFromInputListFile(inputlist)
 
-    # for each folder:
-    for folder in folders:
-        # start preparations for this single folder
+    # start preparations for each single folder
+    return applyToFolders(lambda folder: applyFolder(kind, folder, options), folders, options.projectjobs)
 
-        # get proper preparation thread and call it
-        threadClass = kinds[kind]
-        thread = threadClass(options, inputfolder=folder)
-        thread.run()
 
+def applyFoldersAll(inputlist, options, kinds=None):
+    '''Applies the given preparation kinds (default: all) to all folders of the input list.
+    Returns the number of folders that failed.'''
 
-def applyFoldersAll(inputlist, options):
-    kinds = getKinds()
-    for kind in kinds.keys():
-        applyFolders(kind, inputlist, options)
+    # get the list of projects/folders to process
+    folders = getFoldersFromInputListFile(inputlist)
+
+    # start preparations for each single folder
+    return applyToFolders(lambda folder: applyFolderAll(folder, options, kinds), folders, options.projectjobs)
 
 
 def main():
@@ -576,10 +1483,19 @@ def main():
 
     options = cli.getOptions(kinds, step=cli.steps.PREPARATION)
 
+    # limit the external tool processes of all projects together
+    configureTools(options)
+
     # #################################################
     # main
 
-    if (options.inputfile):
+    if (options.inputfile and "-" in options.inputfile):
+
+        # --file with stdin and/or stdout
+        with cli.openStreams(options.inputfile) as (instream, outstream):
+            applyStream(options.kind, instream, outstream, options)
+
+    elif (options.inputfile):
 
         # split --file argument
         options.infile = os.path.normpath(os.path.abspath(options.inputfile[0]))  # IN
@@ -601,10 +1517,14 @@ def main():
             print "ERROR: input file '{}' cannot be found!".format(options.inputlist)
             sys.exit(1)
 
-        if (options.allkinds):
-            applyFoldersAll(options.inputlist, options)
+        if (len(options.kinds) > 1):
+            failed = applyFoldersAll(options.inputlist, options, options.kinds)
         else:
-            applyFolders(options.kind, options.inputlist, options)
+            failed = applyFolders(options.kind, options.inputlist, options)
+
+        if (failed):
+            print "ERROR: {} project(s) failed!".format(failed)
+            sys.exit(1)
 
     else:
         print "This should not happen! No input file or list of projects given!"
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import subprocess  # for calling git
+import threading  # for sharing the reader of blob contents
+
+
+# #################################################
+# projects in revisions of git repositories
+
+def _isRepository(folder):
+    return os.path.isdir(os.path.join(folder, ".git")) or \
+           (os.path.isfile(os.path.join(folder, "HEAD")) and os.path.isdir(os.path.join(folder, "objects")))
+
+
+def splitRevision(path):
+    '''splits the given input "REPOSITORY@REVISION" into repository and revision'''
+    repository, _, revision = path.rpartition("@")
+    return (repository, revision)
+
+
+def isRevision(path):
+    '''returns True if the given input denotes a revision of a local git repository ("REPOSITORY@REVISION")'''
+    repository, revision = splitRevision(path)
+    return bool(repository and revision) and _isRepository(repository)
+
+
+def getRevisionFolder(path):
+    '''returns the project folder for the given revision, i.e., "REPOSITORY@REVISION" next to the
+    repository (with slashes in the revision name replaced); the preparation and analysis results are stored there'''
+    repository, revision = splitRevision(path)
+    return os.path.normpath(repository) + "@" + revision.replace("/", "_")
+
+
+def getCacheFolder(path):
+    '''returns the default preparation cache for the repository of the given revision, i.e.,
+    "REPOSITORY.cppstats-cache" next to the revision folders, which is shared by all revisions of the repository'''
+    repository, _ = splitRevision(path)
+    return os.path.normpath(repository) + ".cppstats-cache"
+
+
+class _BlobReader(object):
+    '''This class reads the contents of blobs of a repository with a single "git cat-file --batch"
+    process, which is started on the first read.'''
+
+    def __init__(self, repository):
+        self.repository = repository
+        self.process = None
+        self.lock = threading.Lock()  # blobs are read by the thread that hands them to the worker processes
+
+    def read(self, sha):
+        with self.lock:
+            if (self.process is None):
+                self.process = subprocess.Popen(["git", "-C", self.repository, "cat-file", "--batch"],
+                                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self.process.stdin.write(sha + "\n")
+            self.process.stdin.flush()
+
+            # "<sha> <type> <size>\n<content>\n" or "<sha> missing\n"
+            header = self.process.stdout.readline().split()
+            if (len(header) != 3):
+                raise IOError("blob {} cannot be read from '{}'".format(sha, self.repository))
+            content = self.process.stdout.read(int(header[2]))
+            self.process.stdout.read(1)
+            return content
+
+    def close(self):
+        with self.lock:
+            if (self.process is not None):
+                self.process.stdin.close()
+                self.process.stdout.close()
+                self.process.wait()
+                self.process = None
+
+
+class GitBlob(object):
+    '''This class denotes a file in a revision of a git repository. It stands in for the path of an
+    original file during the preparation, so that the revision never needs to be checked out.
+    The content is read (via git plumbing, see _BlobReader) only when needed.'''
+
+    def __init__(self, repository, revision, name, sha, size, reader):
+        self.repository = repository
+        self.revision = revision
+        self.name = name
+        self.sha = sha
+        self.size = size
+        self.reader = reader
+        self.data = None  # the content, if read before (see __getstate__)
+
+    @property
+    def content(self):
+        if (self.data is not None):
+            return self.data
+        return self.reader.read(self.sha)
+
+    def __getstate__(self):
+        # a worker process gets the content along with the blob, as it cannot use the reader
+        state = self.__dict__.copy()
+        state["data"] = self.content
+        state["reader"] = None
+        return state
+
+    def __str__(self):
+        return "{}@{}:{}".format(self.repository, self.revision, self.name)
+
+
+def readRevision(path, accept):
+    '''yields a GitBlob for each regular file in the given revision ("REPOSITORY@REVISION") whose name
+    is accepted by the function accept; no content is read (the contents of all blobs are read by
+    a single git process, which ends with the iteration)'''
+    repository, revision = splitRevision(path)
+    listing = subprocess.check_output(["git", "-C", repository, "ls-tree", "-r", "-l", "-z", revision])
+
+    reader = _BlobReader(repository)
+    try:
+        for entry in listing.split("\0"):
+            if (not entry):
+                continue
+
+            # "<mode> <type> <sha> <size>\t<name>"
+            info, name = entry.split("\t", 1)
+            mode, kind, sha, size = info.split()
+            if (kind == "blob" and mode != "120000" and accept(name)):  # no symbolic links
+                yield GitBlob(repository, revision, name, sha, int(size), reader)
+    finally:
+        reader.close()
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import sys
+import errno  # for error/exception handling
+import json  # for requests and responses
+import hashlib  # for content hashes
+import signal  # for stopping the server
+import threading  # for serializing the requests of several connections
+import socket  # for checking for stale Unix sockets
+import SocketServer  # for serving requests on a Unix socket
+import BaseHTTPServer  # for serving requests via HTTP
+from collections import OrderedDict  # for ordered dictionaries
+
+# #################################################
+# imports from subfolders
+
+import cppstats as cstats  # import cppstats.py and avoid confusion with module
+import analysis
+from preparation import formatError
+from archives import isArchive
+from revisions import isRevision
+
+
+# #################################################
+# analysis requests
+
+class RequestError(Exception):
+    pass
+
+
+class AnalysisServer(object):
+    '''This class answers analysis requests in a long-running process, so that the modules
+    (including the grammars of the analyses) are loaded only once and the results of
+    single files are kept in memory for unchanged contents.
+
+    A request is a JSON object with the kind of analysis (or a comma-separated list of kinds;
+    default: the kinds given with --kind or --all) and either a source file (optionally with its current content) or a
+    project folder (or archive, or git revision as REPOSITORY@REVISION), e.g.:
+        {"kind": "general", "file": "/local/repos/mpsolve/source/mpsolve.c"}
+        {"kind": "general", "file": "mpsolve.c", "source": "#ifdef A\n...\n#endif\n"}
+        {"kind": "general,discipline", "folder": "/local/repos/mpsolve"}
+    The response is a JSON object with the contents of the main results file of each kind,
+    e.g., {"results": {"general": "..."}}, or {"error": "..."}, if the request failed.'''
+
+    # number of analysis results of single files that are kept in memory
+    resultcachesize = 256
+
+    def __init__(self, options):
+        self.options = options
+        self.resultcache = OrderedDict()  # least recently used results of single files
+        self.lock = threading.Lock()  # the analyses keep module state, so requests are answered one at a time
+
+    def getInfo(self):
+        return {"version": cstats.version(), "kinds": cstats.getKinds().keys()}
+
+    def handleRequest(self, data):
+        '''returns the HTTP status (200, 400 for invalid requests, or 500 for failed requests) and
+        the response to the given request (a JSON document) as dictionary;
+        requests from several connections are answered one after the other'''
+        with self.lock:
+            return self._handleRequest(data)
+
+    def _handleRequest(self, data):
+        try:
+            request = json.loads(data)
+            if (not isinstance(request, dict)):
+                raise RequestError("the request is not a JSON object")
+
+            kinds = request["kind"].split(",") if ("kind" in request) else self.options.kinds
+            for kind in kinds:
+                if (kind not in cstats.getKinds()):
+                    raise RequestError("unknown kind '{}' (choose from {})".format(
+                        kind, ", ".join(cstats.getKinds().keys())))
+
+            if ("file" in request):
+                results = self.analyzeFile(kinds, request["file"], request.get("source"))
+            elif ("folder" in request):
+                results = self.analyzeFolder(kinds, request["folder"])
+            else:
+                raise RequestError("the request has neither a file nor a folder")
+
+        except RequestError as e:
+            return (400, {"error": e.args[0]})
+        except SystemExit as e:  # the preparations and analyses exit on fatal errors (see the log)
+            return (500, {"error": "the request failed with exit status {}".format(e.code)})
+        except Exception as e:
+            return (500, {"error": formatError(e)})
+
+        return (200, {"results": dict((kind, result.decode("utf-8", "replace"))
+                                      for (kind, result) in results.iteritems())})
+
+    def analyzeFile(self, kinds, file, source=None):
+        '''prepares and analyzes the source file (or the given source of the file) in memory'''
+        file = file.encode("utf-8")
+        if (source is None):
+            if (not os.path.isfile(file)):
+                raise RequestError("input file '{}' cannot be found!".format(file))
+            with open(file, 'rb') as fd:
+                source = fd.read()
+        else:
+            source = source.encode("utf-8")
+
+        results = {}
+        for kind in kinds:
+            key = hashlib.sha1("\0".join((kind, file, source))).hexdigest()
+            if (key in self.resultcache):
+                results[kind] = self.resultcache.pop(key)
+            else:
+                results[kind] = cstats.applySource(kind, source, file, self.options)
+
+            # keep the result as most recently used one
+            self.resultcache[key] = results[kind]
+            while (len(self.resultcache) > AnalysisServer.resultcachesize):
+                self.resultcache.popitem(last=False)
+
+        return results
+
+    def analyzeFolder(self, kinds, folder):
+        '''prepares and analyzes the project folder; the results are written to the folder, too'''
+        folder = os.path.normpath(os.path.abspath(folder.encode("utf-8")))
+        if (not os.path.isdir(folder) and not isArchive(folder) and not isRevision(folder)):
+            raise RequestError("input folder '{}' cannot be found!".format(folder))
+
+        if (len(kinds) > 1):
+            cstats.applyFolderAll(folder, self.options, kinds)
+        else:
+            cstats.applyFolder(kinds[0], folder, self.options)
+
+        results = {}
+        for kind in kinds:
+            thread = analysis.getKinds()[cstats.getKinds()[kind][1]](self.options, inputfolder=folder)
+            resultsfile = os.path.join(os.path.dirname(thread.folder), thread.getResultsFile())
+            if (not os.path.isfile(resultsfile)):
+                raise RequestError("the analysis '{}' did not write its results file '{}'!".format(kind, resultsfile))
+            with open(resultsfile, 'rb') as fd:
+                results[kind] = fd.read()
+        return results
+
+
+# #################################################
+# transports
+
+class _UnixStreamServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    '''serves each connection in a thread of its own, so that an open connection
+    (e.g., of an editor) does not block the other clients'''
+    daemon_threads = True
+
+
+class _HTTPServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''serves each connection in a thread of its own (see _UnixStreamServer)'''
+    daemon_threads = True
+
+
+class _SocketRequestHandler(SocketServer.StreamRequestHandler):
+    '''reads requests from the connection line by line and answers each with a line'''
+
+    def handle(self):
+        for line in iter(self.rfile.readline, ''):
+            if (not line.strip()):
+                continue
+            (_, response) = self.server.analysisserver.handleRequest(line)
+            self.wfile.write(json.dumps(response) + "\n")
+            self.wfile.flush()
+
+
+class _HTTPRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''answers POST requests with the analysis results and GET requests with server information
+
+    As the daemon prepares and analyzes arbitrary folders, it must not be usable by web pages
+    opened in a browser on the same machine: a POST request must have the Content-Type
+    application/json (which browsers send cross-origin only after a CORS preflight, which is
+    not answered), the Host header must name the server itself (against DNS rebinding), and
+    an Origin header, if any, must be the server itself.'''
+
+    def getHosts(self):
+        port = self.server.server_address[1]
+        return ["127.0.0.1:{}".format(port), "localhost:{}".format(port)]
+
+    def checkHeaders(self):
+        '''returns an error response, if the request may come from a web page, else None'''
+        hosts = self.getHosts()
+        if (self.headers.getheader('host') not in hosts):
+            return (403, {"error": "the Host header must be one of {}".format(", ".join(hosts))})
+
+        origin = self.headers.getheader('origin')
+        if (origin is not None and origin not in ["http://" + host for host in hosts]):
+            return (403, {"error": "requests from the origin '{}' are not allowed".format(origin)})
+
+        return None
+
+    def do_GET(self):
+        error = self.checkHeaders()
+        if (error is not None):
+            self.respond(*error)
+            return
+
+        self.respond(200, self.server.analysisserver.getInfo())
+
+    def do_POST(self):
+        error = self.checkHeaders()
+        if (error is None and self.headers.gettype() != "application/json"):
+            error = (415, {"error": "the Content-Type of a request must be application/json"})
+        if (error is not None):
+            self.respond(*error)
+            return
+
+        length = int(self.headers.getheader('content-length', 0))
+        self.respond(*self.server.analysisserver.handleRequest(self.rfile.read(length)))
+
+    def respond(self, status, response):
+        body = json.dumps(response)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _removeStaleSocket(path):
+    '''removes the Unix socket at path, if no server listens on it anymore'''
+    if (not os.path.exists(path)):
+        return
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except socket.error as e:
+        if (e.errno != errno.ECONNREFUSED):
+            raise
+        os.remove(path)
+        return
+    finally:
+        probe.close()
+
+    print "ERROR: another server is listening on '{}'!".format(path)
+    sys.exit(1)
+
+
+# #################################################
+# main method
+
+def serve(options):
+    '''serves analysis requests on the Unix socket or HTTP port given in the options
+    until the process is interrupted; the connections are served concurrently, but
+    the requests are answered one after the other (see AnalysisServer.handleRequest)'''
+    if (options.socket):
+        options.socket = os.path.abspath(options.socket)
+        _removeStaleSocket(options.socket)
+        server = _UnixStreamServer(options.socket, _SocketRequestHandler)
+        address = options.socket
+    else:
+        server = _HTTPServer(("127.0.0.1", options.port), _HTTPRequestHandler)
+        address = "http://127.0.0.1:{}/".format(server.server_address[1])
+    server.analysisserver = AnalysisServer(options)
+
+    # stop serving on SIGTERM as on SIGINT (the socket file is removed then)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    print "# serving analysis requests on " + address
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        server.server_close()
+        if (options.socket):
+            os.remove(options.socket)
+    print "# stopped serving analysis requests"
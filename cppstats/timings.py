@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+
+# #################################################
+# imports from the std-library
+
+import json  # for the timings report
+import math  # for percentiles
+from collections import OrderedDict
+
+
+# #################################################
+# timings of preparation stages
+
+def percentile(values, p):
+    '''returns the p-th percentile (nearest rank) of the given sorted values'''
+    if (not values):
+        return None
+    rank = int(math.ceil(p / 100.0 * len(values)))
+    return values[max(rank, 1) - 1]
+
+
+class StageTimings(object):
+    '''This class collects the time that each preparation stage takes for each file
+    and writes a JSON report with the totals, percentiles, and slowest files per stage.'''
+
+    def __init__(self):
+        self.timings = OrderedDict()  # stage -> [(seconds, file)]
+
+    def add(self, file, timings):
+        '''adds the given list of (stage, seconds) tuples for the given file'''
+        for (stage, seconds) in timings:
+            self.timings.setdefault(stage, []).append((seconds, file))
+
+    def getReport(self, slowest):
+        '''returns the report as a dictionary, including the given number of slowest files per stage'''
+        stages = OrderedDict()
+        for (stage, timings) in self.timings.iteritems():
+            seconds = sorted(s for (s, _) in timings)
+            stages[stage] = OrderedDict([
+                ("files", len(seconds)),
+                ("total", sum(seconds)),
+                ("mean", sum(seconds) / len(seconds)),
+                ("p50", percentile(seconds, 50)),
+                ("p90", percentile(seconds, 90)),
+                ("p99", percentile(seconds, 99)),
+                ("max", seconds[-1]),
+                ("slowest", [OrderedDict([("file", f), ("seconds", s)])
+                             for (s, f) in sorted(timings, reverse=True)[:slowest]])
+            ])
+
+        return OrderedDict([
+            ("total", sum(stage["total"] for stage in stages.values())),
+            ("stages", stages)
+        ])
+
+    def write(self, filename, slowest):
+        with open(filename, 'w') as fd:
+            json.dump(self.getReport(slowest), fd, indent=1)
@@ -132,36 +132,43 @@ def _collectIfdefExpressions(fname):
                 pass
     return __ifdefexplist
 
-def _filterAnnotatedIfdefs(fnamein, fnameout):
+def _filterAnnotatedIfdefLines(lines):
     '''
-    This method removes all preprocessor annotated lines from the input.
+    This method removes all preprocessor annotated lines from the given lines.
     '''
     inifdef = 0
 
+    for line in lines:
+        # line is a preprocessor directive; determine weather its a conditional inclusion
+        # directive or something else
+        if line.startswith('#'):
+            parseddirective = line.split(' ', 1)
+            directive = parseddirective[0].strip()
+            if directive in ['#if', '#ifdef', '#ifndef']:
+                inifdef += 1
+            elif directive in ['#else', '#elif']:
+                pass
+            elif directive == '#endif':
+                inifdef -= 1
+            elif directive in ['#line', '#error', '#pragma', '#define', '#undef', '#include', '#ident', '#warning', '#include_next']:
+                if inifdef:
+                    yield '\n'
+                    continue
+            else:
+                print("ERROR: directive (%s) not processed!" % parseddirective)
+            yield line
+        # found regular C code
+        else:
+            yield line
+
+def _filterAnnotatedIfdefs(fnamein, fnameout):
+    '''
+    This method removes all preprocessor annotated lines from the input.
+    '''
     with open(fnameout, 'w') as fdout:
         with open(fnamein, 'r') as fdin:
-            for line in fdin.readlines():
-                # line is a preprocessor directive; determine weather its a conditional inclusion
-                # directive or something else
-                if line.startswith('#'):
-                    parseddirective = line.split(' ', 1)
-                    directive = parseddirective[0].strip()
-                    if directive in ['#if', '#ifdef', '#ifndef']:
-                        inifdef += 1
-                    elif directive in ['#else', '#elif']:
-                        pass
-                    elif directive == '#endif':
-                        inifdef -= 1
-                    elif directive in ['#line', '#error', '#pragma', '#define', '#undef', '#include', '#ident', '#warning', '#include_next']:
-                        if inifdef:
-                            fdout.write('\n')
-                            continue
-                    else:
-                        print("ERROR: directive (%s) not processed!" % parseddirective)
-                    fdout.write(line)
-                # found regular C code
-                else:
-                    fdout.write(line)
+            for line in _filterAnnotatedIfdefLines(fdin.readlines()):
+                fdout.write(line)
 
 
 ##################################################
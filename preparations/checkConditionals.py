@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+
+# this script checks on text level, whether the conditionals
+# (#if, #ifdef, #ifndef, #elif, #else, #endif) of C source code are
+# balanced; it is meant to run before the expensive preparation, as the
+# analyses discard files with unbalanced conditionals anyway
+# (cf. IfdefEndifMismatchError and scripts/ifdefendifratio.py)
+# - comments are ignored (see deleteComments.py)
+# - a directive is only recognized at the beginning of a logical line,
+#   i.e., lines ending in a backslash are continued
+# e.g.:
+# #ifdef A       ->    OK
+# #endif
+# #endif         ->    line 3: #endif without #if
+
+import re, sys
+
+from deleteComments import deleteComments
+
+
+__directive = re.compile(r'^[ \t]*#[ \t]*(if|ifdef|ifndef|elif|else|endif)\b')
+__directives = re.compile(__directive.pattern, re.MULTILINE)
+# a backslash at the end of a line (maybe followed by blanks) continues the line;
+# this is the only rule for continued lines (see _logicalLines and _directives)
+__continuation = re.compile(r'\\[ \t]*\r?\n')
+
+
+class UnbalancedConditionalsError(Exception):
+    def __init__(self, line, message):
+        self.line = line
+        self.message = message
+        Exception.__init__(self, "line {}: {}".format(line, message))
+
+
+def _logicalLines(source):
+    '''yields the line number and text of each logical line (continued lines are joined)'''
+    lines = source.split('\n')
+    first = 1  # number of the first physical line of the logical line
+    logical = []
+    for (number, line) in enumerate(lines, 1):
+        continued = __continuation.search(line + '\n') if number < len(lines) else None
+        if continued:
+            logical.append(line[:continued.start()] + ' ')
+        else:
+            yield (first, ''.join(logical) + line + '\n')
+            first = number + 1
+            logical = []
+
+
+def _directives(source):
+    '''yields the line number and name of each conditional directive in source'''
+    if (__continuation.search(source)):
+        for (number, line) in _logicalLines(source):
+            match = __directive.match(line)
+            if match:
+                yield (number, match.group(1))
+        return
+
+    # without continued lines, all directives are found by a single search
+    number = 1
+    position = 0
+    for match in __directives.finditer(source):
+        number += source.count('\n', position, match.start())
+        position = match.start()
+        yield (number, match.group(1))
+
+
+def checkConditionals(source):
+    '''raises an UnbalancedConditionalsError for the first unbalanced conditional in source'''
+    checkDirectives(deleteComments(source))
+
+
+def checkDirectives(source):
+    '''checkConditionals for a source without comments (e.g., after the preparation stage
+    deleteComments), which is not lexed again'''
+    opened = []  # line numbers of the open #if's
+
+    for (number, directive) in _directives(source):
+        if directive in ('if', 'ifdef', 'ifndef'):
+            opened.append(number)
+        elif not opened:
+            raise UnbalancedConditionalsError(number, '#' + directive + ' without #if')
+        elif directive == 'endif':
+            opened.pop()
+
+    if opened:
+        raise UnbalancedConditionalsError(opened[-1], '#if without #endif')
+
+
+def apply(fname):
+    with open(fname, 'r') as fd:
+        source = fd.read()
+
+    try:
+        checkConditionals(source)
+    except UnbalancedConditionalsError as e:
+        print('%s: %s' % (fname, e))
+        return False
+    return True
+
+
+def usage():
+    print(sys.argv[0] + ' filename...')
+    print('programm prints the first unbalanced conditional of each file')
+
+
+##################################################
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        usage()
+    else:
+        results = [apply(fname) for fname in sys.argv[1:]]
+        sys.exit(0 if all(results) else 1)
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+# this script deletes all comments from C source code without
+# changing the number of lines; it is equivalent to the
+# srcML-based transformation with deleteComments.xsl:
+# - each comment is replaced by as many line breaks as it contains,
+#   the rest of the line is kept
+# - string and character literals are left untouched, even if
+#   they contain comment delimiters
+# - line comments ending in a backslash continue on the next line
+# e.g.:
+# int a; /* foo    ->    int a;
+#    bar */ int b;  ->    int b;
+
+import re, sys
+
+# literals and comments in order of precedence; unterminated literals
+# end at the line break, unterminated block comments at the end of file
+__lexer = re.compile(r'''
+      (?P<linecomment> //(?:[^\\\n]|\\(?:\r\n|[\s\S]))* )
+    | (?P<blockcomment> /\*[\s\S]*?(?:\*/|\Z) )
+    | "(?:[^"\\\n]|\\(?:\r\n|[\s\S]))*"?
+    | '(?:[^'\\\n]|\\(?:\r\n|[\s\S]))*'?
+    ''', re.VERBOSE)
+
+
+def _replaceComment(match):
+    if match.lastgroup:
+        # comment: keep only the line breaks
+        return '\n' * match.group(0).count('\n')
+    # string or character literal
+    return match.group(0)
+
+
+def deleteComments(source):
+    return __lexer.sub(_replaceComment, source)
+
+
+def apply(fname, out=sys.stdout):
+    with open(fname, 'r') as fd:
+        out.write(deleteComments(fd.read()))
+
+
+def usage():
+    print(sys.argv[0] + ' filename')
+    print('programm writes results to stdout')
+
+
+##################################################
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        usage()
+    else:
+        apply(sys.argv[1])
@@ -46,17 +46,11 @@ import os, re, sys
 __debug = False
 
 
-def apply(fname, out=sys.stdout):
-    fname = os.path.abspath(fname)
-
+def applyLines(lines):
     # check for include-guard
     rg = re.compile('#if\s+!defined\((\S+)\)')
     rd = re.compile('#define\s+(\S+)')
-    sourcecode = list()
-
-    with open(fname, 'r') as fd:
-        for line in fd.readlines():
-            sourcecode.append(line)
+    sourcecode = list(lines)
 
     def _findCorrespondingItems(sourcecode):
         '''This method returns a tuple with the include guard elements to cut of the source.
@@ -139,7 +133,15 @@ def apply(fname, out=sys.stdout):
                      sourcecode[endif + 1:]
 
     for item in sourcecode:
-        out.write(item.rstrip('\n') + '\n')
+        yield item.rstrip('\n') + '\n'
+
+
+def apply(fname, out=sys.stdout):
+    fname = os.path.abspath(fname)
+
+    with open(fname, 'r') as fd:
+        for line in applyLines(fd.readlines()):
+            out.write(line)
 
 
 def usage():
@@ -30,23 +30,27 @@ class WrongIfdefError(Exception):
 	def __str__(self):
 		return ("Didn't find \"ifdef\" or \"ifndef\" as macro")
 
-def rewriteFile(fname, out = sys.stdout):
-	fd = open(fname, 'r')
-
-	for line in fd:
+def rewriteLines(lines):
+	for line in lines:
 		if line.startswith('#ifdef') or line.startswith('#ifndef'):
 			ifdef, identifier = line.split(None, 1) # FIXME if there is a comment after the constant, it is incorporated into the brackets! this may lead to errors.
 			identifier = identifier.strip()
 
 			if ifdef == '#ifdef':
-				out.write('#if defined(' + identifier + ')' + '\n')
+				yield '#if defined(' + identifier + ')' + '\n'
 				continue
 			if ifdef == '#ifndef':
-				out.write('#if !defined(' + identifier + ')' + '\n')
+				yield '#if !defined(' + identifier + ')' + '\n'
 				continue
 			raise WrongIfdefError()
 		else:
-			out.write(line)
+			yield line
+
+def rewriteFile(fname, out = sys.stdout):
+	fd = open(fname, 'r')
+
+	for line in rewriteLines(fd):
+		out.write(line)
 
 	fd.close()
 
@@ -34,14 +34,12 @@
 
 import os, sys
 
-# translates macros (s.o. or usage)
-def translate(infile, outfile):
-	fdin    = open(infile)
-	fdout   = open(outfile, 'w')
+# translates macros (s.o. or usage) of the given lines
+def translateLines(lines):
 	curline = ''
 	numlines = 0
 
-	for line in fdin:
+	for line in lines:
 		sline = line.strip()
 
 		# macro found
@@ -53,8 +51,9 @@ def translate(infile, outfile):
 			else:
 				curline += sline
                 #TODO fix line endings
-				fdout.write(curline+'\n')
-				fdout.write('\n' * numlines)
+				yield curline+'\n'
+				for _ in range(numlines):
+					yield '\n'
 				curline = ''
 				numlines = 0
 
@@ -67,7 +66,16 @@ def translate(infile, outfile):
 			continue
 
 		# normal line
-		fdout.write(line)
+		yield line
+
+
+# translates macros (s.o. or usage)
+def translate(infile, outfile):
+	fdin    = open(infile)
+	fdout   = open(outfile, 'w')
+
+	for chunk in translateLines(fdin):
+		fdout.write(chunk)
 
 	# closeup
 	fdin.close()
@@ -27,7 +27,7 @@ from setuptools import setup, find_packages
 setup(
     name='cppstats',
     version="0.9.4",
-    packages=find_packages(exclude=['scripts']),
+    packages=find_packages(exclude=['scripts', 'tests']),
     url='http://www.fosd.net/cppstats',
     license='LGPLv3',
     author='Claus Hunsen',
@@ -53,6 +53,7 @@ setup(
     entry_points={'console_scripts': [
         'cppstats = cppstats.cppstats:main',
         'cppstats.analysis = cppstats.analysis:main',
-        'cppstats.preparation = cppstats.preparation:main'
+        'cppstats.preparation = cppstats.preparation:main',
+        'cppstats.history = cppstats.history:main'
     ]}
 )
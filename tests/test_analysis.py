@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+'''Tests of the analyses of cppstats that share a preparation folder (cppstats/analysis.py).
+Run all tests from the root folder of cppstats with: python -m unittest discover tests'''
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import sys
+import json  # for the manifest of the preparation
+import hashlib  # for the content hashes in the manifest
+import shutil  # for copying the test project
+import tempfile  # for temporary folders
+import unittest
+
+
+# #################################################
+# imports from subfolders
+
+from cppstats import analysis, cli
+from cppstats.preparation import AbstractPreparationThread
+from analyses import featurelocations
+from analyses.discipline import DisciplinedAnnotations
+
+
+# #################################################
+# partial results of single files
+
+class ReplaceFileTest(unittest.TestCase):
+    '''The partial results of a file are taken from the cache for the same file in another
+    folder (e.g., of another revision) and must name the file in the current folder.'''
+
+    old = "/a/r1/_cppstats/x.c.xml"
+    new = "/a/r2/_cppstats/x.c.xml"
+
+    def testStrings(self):
+        self.assertEqual(analysis._replaceFile(self.old, self.old, self.new), self.new)
+        self.assertEqual(analysis._replaceFile("other", self.old, self.new), "other")
+
+    def testContainers(self):
+        result = ([self.old, 1], (self.old,), set([self.old]), frozenset([self.old]), {self.old: [self.old]})
+        replaced = analysis._replaceFile(result, self.old, self.new)
+
+        self.assertEqual(replaced, ([self.new, 1], (self.new,), set([self.new]), frozenset([self.new]),
+                                    {self.new: [self.new]}))
+        self.assertEqual(result[0], [self.old, 1])  # the cached result itself is not changed
+
+    def testFeatureLocations(self):
+        # FeatureLocation is an old-style class (type 'instance')
+        location = featurelocations.FeatureLocation(self.old, 1, 3, "if", "A")
+        result = (([location], None), {})
+
+        replaced = analysis._replaceFile(result, self.old, self.new)
+        self.assertEqual(replaced[0][0][0].filename, self.new)
+        self.assertEqual(replaced[0][0][0].startline, 1)
+        self.assertEqual(location.filename, self.old)
+
+    def testObjectsOfAnalyses(self):
+        annotations = DisciplinedAnnotations(None, None, check=False)
+        annotations.file = self.old
+
+        replaced = analysis._replaceFile(annotations, self.old, self.new)
+        self.assertIsInstance(replaced, DisciplinedAnnotations)
+        self.assertEqual(replaced.file, self.new)
+        self.assertEqual(annotations.file, self.old)
+
+
+# #################################################
+# results of whole projects
+
+class GoldenOutputTest(unittest.TestCase):
+    '''The analyses must write the same results (and log) for the test project in
+    tests/data/golden as the sequential analyses of cppstats 0.9.4, in which the path of the project
+    is replaced by @PROJECT@. The test project has files that cannot be parsed, files with an
+    ifdef-endif mismatch, files without conditionals, and many features in several files.'''
+
+    data = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "golden")
+    placeholder = "@PROJECT@"
+
+    # results files of each kind of analysis
+    results = {
+        "general": ["cppstats.csv"],
+        "generalvalues": ["merged_scattering_degrees.csv", "merged_tangling_degrees.csv",
+                          "metric_values.csv", "nesting_degrees_toplevel_branches.csv"],
+        "discipline": ["cppstats_discipline.csv"],
+        "featurelocations": ["cppstats_featurelocations.csv", "listoffeatures.csv"],
+        "derivative": ["cppstats_derivative.csv"],
+        "interaction": ["cppstats_interaction.csv"],
+    }
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.project = self.createProject(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def createProject(self, folder):
+        '''creates a project with the srcML files of the test project in all preparation folders;
+        the project is named p like the one of the expected results'''
+        project = os.path.join(folder, "p")
+        for kind in analysis.getKinds().values():
+            preparation = os.path.join(project, kind.getPreparationFolder())
+            if (not os.path.isdir(preparation)):
+                shutil.copytree(os.path.join(self.data, "srcml"), preparation)
+        return project
+
+    def writeManifests(self, project):
+        '''writes the manifest of a preparation for each preparation folder, so that the results of the
+        files are cached by their content (see AbstractAnalysisThread.getCacheKeys)'''
+        for kind in analysis.getKinds().values():
+            preparation = os.path.join(project, kind.getPreparationFolder())
+            files = {}
+            for (root, _, filenames) in os.walk(preparation):
+                for filename in filenames:
+                    output = os.path.relpath(os.path.join(root, filename), preparation)
+                    with open(os.path.join(root, filename), 'rb') as fd:
+                        sha1 = hashlib.sha1(fd.read()).hexdigest()
+                    files[output[:-len(".xml")]] = {"sha1": sha1, "outputs": [output]}
+            with open(os.path.join(preparation, AbstractPreparationThread.manifestfile), 'w') as fd:
+                json.dump({"signature": [kind.getPreparationFolder()], "files": files}, fd)
+
+    def getOptions(self, *arguments):
+        argv = sys.argv
+        sys.argv = ["cppstats", "--list", os.path.join(self.folder, "list.txt")] + list(arguments)
+        try:
+            return cli.getOptions(analysis.getKinds(), step=cli.steps.ANALYSIS)
+        finally:
+            sys.argv = argv
+
+    def assertResults(self, project, kinds, log=None):
+        for kind in kinds:
+            for filename in self.results[kind]:
+                with open(os.path.join(self.data, "expected", filename), 'rb') as fd:
+                    expected = fd.read()
+                with open(os.path.join(project, filename), 'rb') as fd:
+                    result = fd.read().replace(project, self.placeholder)
+                self.assertEqual(result, expected, "{} of {}".format(filename, kind))
+
+        if (log is not None):
+            with open(os.path.join(self.data, "expected", "analysis.log"), 'rb') as fd:
+                self.assertEqual(log.replace(project, self.placeholder), fd.read())
+
+    def testEachKind(self):
+        for kind in analysis.getKinds():
+            options = self.getOptions("--kind", kind)
+            analysis._captureOutput(analysis.applyFolder, kind, self.project, options)
+            self.assertResults(self.project, [kind])
+
+    def testAllKinds(self):
+        options = self.getOptions("--all")
+        (log, _) = analysis._captureOutput(analysis.applyFolderAll, self.project, options, options.kinds)
+        self.assertResults(self.project, options.kinds, log)
+
+    def testAllKindsInParallel(self):
+        options = self.getOptions("--all", "--jobs", "3")
+        (log, _) = analysis._captureOutput(analysis.applyFolderAll, self.project, options, options.kinds)
+        self.assertResults(self.project, options.kinds, log)
+
+    def testCachedResults(self):
+        options = self.getOptions("--all", "--jobs", "2")
+        options.cachedir = os.path.join(self.folder, "cache")
+        options.cachesize = 2048
+
+        # the second run takes all results from the cache, the third one for files in another
+        # folder (e.g., of another revision)
+        other = self.createProject(os.path.join(self.folder, "other"))
+        for project in (self.project, self.project, other):
+            self.writeManifests(project)
+            (log, _) = analysis._captureOutput(analysis.applyFolderAll, project, options, options.kinds)
+            self.assertResults(project, options.kinds, log)
+            self.assertTrue(os.listdir(options.cachedir))
+
+
+if __name__ == '__main__':
+    unittest.main()
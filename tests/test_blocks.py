@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+'''Tests of the conditional blocks of srcML files and of the skeletons of files without
+conditionals (analyses/blocks.py).
+Run all tests from the root folder of cppstats with: python -m unittest discover tests'''
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import shutil  # for copying files and removing temporary folders
+import tempfile  # for temporary folders
+import unittest
+from argparse import ArgumentParser  # for the default options of the analyses
+
+
+# #################################################
+# external modules
+
+# python-lxml module
+from lxml import etree
+
+
+# #################################################
+# imports from subfolders
+
+from cppstats import analysis
+from analyses import blocks
+
+
+# #################################################
+# srcML documents
+
+_declaration = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+_unit = ('<unit xmlns="http://www.srcML.org/srcML/src" xmlns:cpp="http://www.srcML.org/srcML/cpp" '
+         'revision="1.0" language="C" filename="x.c">')
+_defines = ('<cpp:define>#<cpp:directive>define</cpp:directive> <cpp:macro><name>A</name></cpp:macro> '
+            '<cpp:value>1</cpp:value></cpp:define>\n'
+            '<cpp:define>#<cpp:directive>define</cpp:directive> <cpp:macro><name>MIN</name><parameter_list>'
+            '(<parameter><type><name>x</name></type></parameter>, <parameter><type><name>y</name></type>'
+            '</parameter>)</parameter_list></cpp:macro> <cpp:value>((x) &lt; (y) ? (x) : (y))</cpp:value>'
+            '</cpp:define>\n')
+_code = ('<function><type><name>int</name></type> <name>f</name><parameter_list>()</parameter_list>\n'
+         '<block>{\n'
+         '    <return>return <expr><call><name>MIN</name><argument_list>(<argument><expr><name>A</name>'
+         '</expr></argument>, <argument><expr><literal type="string">"&lt;&amp;&gt;&quot;"</literal></expr>'
+         '</argument>)</argument_list></call></expr>;</return>\n'
+         '}</block></function>\n')
+_conditional = ('<cpp:if>#<cpp:directive>if</cpp:directive> <expr><name>A</name></expr></cpp:if>\n'
+                '<decl_stmt><decl><type><name>int</name></type> <name>a</name></decl>;</decl_stmt>\n'
+                '<cpp:endif>#<cpp:directive>endif</cpp:directive></cpp:endif>\n')
+_nested = ('<cpp:ifdef>#<cpp:directive>ifdef</cpp:directive> <name>A</name></cpp:ifdef>\n'
+           '<function><type><name>int</name></type> <name>f</name><parameter_list>()</parameter_list>\n'
+           '<block>{\n'
+           '<cpp:if>#<cpp:directive>if</cpp:directive> <expr><name>B</name> <operator>&amp;&amp;</operator> '
+           '<name>C</name></expr></cpp:if>\n'
+           '    <return>return <expr><literal type="number">1</literal></expr>;</return>\n'
+           '<cpp:elif>#<cpp:directive>elif</cpp:directive> <expr><name>B</name></expr></cpp:elif>\n'
+           '    <return>return <expr><literal type="number">2</literal></expr>;</return>\n'
+           '<cpp:else>#<cpp:directive>else</cpp:directive></cpp:else>\n'
+           '    <return>return <expr><literal type="number">3</literal></expr>;</return>\n'
+           '<cpp:endif>#<cpp:directive>endif</cpp:directive></cpp:endif>\n'
+           '}</block></function>\n'
+           '<cpp:else>#<cpp:directive>else</cpp:directive></cpp:else>\n'
+           '<cpp:ifndef>#<cpp:directive>ifndef</cpp:directive> <name>B</name></cpp:ifndef>\n'
+           '<cpp:endif>#<cpp:directive>endif</cpp:directive></cpp:endif>\n')
+_endif = '<cpp:endif>#<cpp:directive>endif</cpp:directive></cpp:endif>\n'
+
+# the srcML files of the test project of the analyses
+_golden = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "golden", "srcml")
+
+
+def getOptions(kind):
+    '''returns the default options of the given kind of analysis'''
+    parser = ArgumentParser()
+    analysis.getKinds()[kind].addCommandLineOptions(parser)
+    return parser.parse_args([])
+
+
+def comparable(result):
+    '''returns the given partial result of a file in a comparable form'''
+    if (hasattr(result, "__dict__")):
+        return vars(result)
+    return result
+
+
+def columns(blocks):
+    '''returns the conditional blocks in a comparable form'''
+    result = dict((column, list(getattr(blocks, column))) for column in blocks.columns)
+    result.update(signatures=blocks.signatures, paths=blocks.paths, balanced=blocks.balanced)
+    return result
+
+
+# #################################################
+# conditional blocks
+
+class BlocksTest(unittest.TestCase):
+    '''The blocks of a srcML file must be the same whether they are extracted from its tree, with
+    iterparse, or read back from the blocks file.'''
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def writeFile(self, content, name="x.c.xml"):
+        file = os.path.join(self.folder, name)
+        with open(file, 'wb') as fd:
+            fd.write(content)
+        return file
+
+    def getFiles(self):
+        '''returns the well-formed srcML files of the test project and some more'''
+        files = []
+        for (root, _, filenames) in os.walk(_golden):
+            for filename in filenames:
+                if (filename != "bad.c.xml"):
+                    shutil.copy(os.path.join(root, filename), self.folder)
+                    files.append(os.path.join(self.folder, filename))
+        for (index, content) in enumerate([_nested + _endif + _code, _conditional * 3, _defines + _code,
+                                           _conditional + _nested, _endif + _conditional]):
+            files.append(self.writeFile(_declaration + _unit + content + '</unit>\n', "x{}.c.xml".format(index)))
+        return files
+
+    def testNesting(self):
+        file = self.writeFile(_declaration + _unit + _nested + _endif + '</unit>\n')
+        result = blocks.extractBlocks(etree.parse(file).getroot())
+        self.assertEqual([result.getKind(block) for block in range(len(result))],
+                         ['ifdef', 'if', 'elif', 'else', 'else', 'ifndef'])
+        self.assertEqual([result.getSignature(block) for block in range(len(result))],
+                         ['A', 'B && C', 'B', '', '', 'B'])
+        self.assertEqual(columns(result), {
+            'kind': [1, 0, 3, 4, 4, 2],
+            'start': [2, 5, 7, 9, 13, 14],
+            'end': [13, 7, 9, 11, 16, 15],
+            'depth': [1, 2, 2, 2, 1, 2],
+            'parent': [-1, 0, 0, 0, -1, 4],
+            'group': [0, 1, 1, 1, 0, 5],
+            'signature': [0, 1, 2, 3, 3, 2],
+            'path': [0, 1, 1, 1, 0, 0],
+            'lines': [10, 1, 1, 1, 2, 0],
+            'signatures': ['A', 'B && C', 'B', ''],
+            'paths': ['unit', 'unit/function/block'],
+            'balanced': True,
+        })
+
+    def testUnbalanced(self):
+        # the blocks up to the mismatch are kept
+        file = self.writeFile(_declaration + _unit + _conditional + _endif + _conditional + '</unit>\n')
+        result = blocks.extractBlocks(etree.parse(file).getroot())
+        self.assertEqual((len(result), result.end[0], result.balanced), (1, 4, False))
+
+        file = self.writeFile(_declaration + _unit + _nested + '</unit>\n')
+        result = blocks.extractBlocks(etree.parse(file).getroot())
+        self.assertEqual((len(result), result.end[4], result.balanced), (6, -1, False))
+
+    def testIterparse(self):
+        for file in self.getFiles():
+            expected = blocks.extractBlocks(etree.parse(file).getroot())
+            self.assertEqual(columns(blocks.extractBlocksFromFile(file)), columns(expected), file)
+
+    def testMalformed(self):
+        self.assertIsNone(blocks.extractBlocksFromFile(self.writeFile(_declaration + _unit + _nested + _endif)))
+
+    def testRoundTrip(self):
+        for file in self.getFiles():
+            self.assertIsNone(blocks.readBlocks(file))
+            expected = blocks.extractBlocksFromFile(file)
+            blocks.writeBlocks(file, expected)
+            self.assertEqual(columns(blocks.readBlocks(file)), columns(expected), file)
+
+    def testChangedFile(self):
+        file = self.writeFile(_declaration + _unit + _nested + _endif + '</unit>\n')
+        blocks.writeBlocks(file, blocks.extractBlocksFromFile(file))
+        self.assertIsNotNone(blocks.readBlocks(file))
+
+        # another modification time or size
+        stat = os.stat(file)
+        os.utime(file, (stat.st_atime, stat.st_mtime - 10))
+        self.assertIsNone(blocks.readBlocks(file))
+        blocks.writeBlocks(file, blocks.extractBlocksFromFile(file))
+        with open(file, 'ab') as fd:
+            fd.write('\n')
+        os.utime(file, (stat.st_atime, stat.st_mtime - 10))
+        self.assertIsNone(blocks.readBlocks(file))
+
+        # a broken blocks file
+        with open(blocks.getBlocksFile(file), 'wb') as fd:
+            fd.write('broken')
+        self.assertIsNone(blocks.readBlocks(file))
+
+
+# #################################################
+# skeletons of files without conditionals
+
+class SkeletonTest(unittest.TestCase):
+    '''The analyses must give the same results for the skeleton of a file without conditionals
+    as for its whole tree; files that cannot be scanned safely are parsed as a whole.'''
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def writeFile(self, content):
+        file = os.path.join(self.folder, "x.c.xml")
+        with open(file, 'wb') as fd:
+            fd.write(content)
+        return file
+
+    def assertSameResults(self, content):
+        file = self.writeFile(content)
+        skeleton = blocks.readSkeleton(file)
+        self.assertIsNotNone(skeleton)
+        root = etree.parse(file).getroot()
+
+        for kind in analysis.getKinds():
+            module = analysis.getKinds()[kind].getModule()
+            options = getOptions(kind)
+            (_, expected) = analysis._captureOutput(module.analyzeFile, file, root, options)
+            (_, result) = analysis._captureOutput(module.analyzeFile, file, skeleton, options)
+            self.assertEqual(comparable(result), comparable(expected), kind)
+
+    def assertNoSkeleton(self, content):
+        self.assertIsNone(blocks.readSkeleton(self.writeFile(content)))
+
+    def testSrcML(self):
+        self.assertSameResults(_declaration + _unit + _defines + _code + '</unit>\n')
+        self.assertSameResults(_declaration + _unit + _code + _defines + '</unit>\n')
+        self.assertSameResults(_declaration + _unit + _defines + '</unit>\n')
+        self.assertSameResults(_declaration + _unit + '</unit>\n')
+
+    def testEscapedText(self):
+        # entities and character references (also line breaks) in the text of defines and code
+        self.assertSameResults(_declaration + _unit +
+                               _defines.replace('1</cpp:value>', '&#49;&#x20;&amp;&#10;2</cpp:value>') +
+                               _code.replace('"&lt;', '"&#10;&#x3c;') + '</unit>\n')
+
+    def testReformatted(self):
+        # other attribute order, line breaks and whitespace in tags, Windows line breaks
+        unit = ('<unit filename="x.c" language="C"\n  xmlns:cpp="http://www.srcML.org/srcML/cpp"\n'
+                '  xmlns="http://www.srcML.org/srcML/src">')
+        code = _code.replace('<block>', '<block\n>').replace('<name>f</name>', '<name\n\n>f</name >')
+        self.assertSameResults(_declaration + unit + _defines + code + '</unit>\n')
+        self.assertSameResults(unit + _defines + code + '</unit>')
+        self.assertSameResults((_declaration + _unit + _defines + _code + '</unit>\n').replace('\n', '\r\n'))
+
+    def testConditionals(self):
+        self.assertNoSkeleton(_declaration + _unit + _defines + _conditional + _code + '</unit>\n')
+        self.assertNoSkeleton(_declaration + _unit + _conditional.replace('<cpp:if>', '<cpp:if\n>') + '</unit>\n')
+
+    def testHiddenTags(self):
+        # comments, CDATA sections, and document types may hide tags from the scan or fake them
+        self.assertNoSkeleton(_declaration + _unit + '<!-- ' + _defines + ' -->' + _code + '</unit>\n')
+        self.assertNoSkeleton(_declaration + _unit + _code.replace('"&lt;&amp;&gt;&quot;"',
+                                                                 '<![CDATA[' + _defines + ']]>') + '</unit>\n')
+        self.assertNoSkeleton(_declaration + '<!DOCTYPE unit>\n' + _unit + _code + '</unit>\n')
+        self.assertNoSkeleton(_declaration + _unit + '<?cpp ' + _defines + '?>' + _code + '</unit>\n')
+
+    def testOtherNamespacePrefix(self):
+        unit = _unit.replace('xmlns:cpp=', 'xmlns:pre=')
+        self.assertNoSkeleton(_declaration + unit + _defines.replace('cpp:', 'pre:') +
+                              _conditional.replace('cpp:', 'pre:') + '</unit>\n')
+        unit = _unit.replace('"http://www.srcML.org/srcML/cpp"', "'http://www.srcML.org/srcML/cpp'")
+        self.assertNoSkeleton(_declaration + unit + _defines + '</unit>\n')
+
+    def testMalformed(self):
+        self.assertNoSkeleton(_declaration + _unit + _code)
+        self.assertNoSkeleton(_declaration + _unit + '</unit>\n' + _unit + '</unit>\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+'''Tests of the cache of prepared files and analysis results (cppstats/cache.py).
+Run all tests from the root folder of cppstats with: python -m unittest discover tests'''
+
+
+# #################################################
+# imports from the std-library
+
+import os
+import shutil  # for removing the cache
+import tempfile  # for temporary folders
+import unittest
+
+
+# #################################################
+# imports from subfolders
+
+from cppstats.cache import PreparationCache
+
+
+# #################################################
+# least recently used entries
+
+class EvictionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = PreparationCache(self.folder, 250)
+        self.keys = [self.cache.getContentKey(str(i)) for i in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def setLastUse(self, key, time):
+        for name in os.listdir(os.path.join(self.folder, key[:2])):
+            if name.startswith(key):
+                os.utime(os.path.join(self.folder, key[:2], name), (time, time))
+
+    def testLeastRecentlyUsed(self):
+        for (time, key) in enumerate(self.keys, 1000):
+            self.cache.put(key, "x" * 100)
+            self.setLastUse(key, time)
+
+        # the oldest entry is used again, so that the second one is the least recently used
+        self.assertEqual(self.cache.get(self.keys[0]), "x" * 100)
+        self.cache.evict()
+
+        self.assertEqual(self.cache.get(self.keys[0]), "x" * 100)
+        self.assertIsNone(self.cache.get(self.keys[1]))
+        self.assertEqual(self.cache.get(self.keys[2]), "x" * 100)
+
+    def testArtifactsAreEvictedTogether(self):
+        artifacts = [os.path.join(self.folder, name) for name in ("a.c", "a.c.xml")]
+        for artifact in artifacts:
+            with open(artifact, 'wb') as fd:
+                fd.write("y" * 100)
+        self.cache.store(self.keys[0], artifacts)
+        self.setLastUse(self.keys[0], 1000)
+        self.cache.put(self.keys[1], "x" * 100)
+
+        self.cache.evict()
+        self.assertFalse(self.cache.restore(self.keys[0], artifacts))
+        self.assertEqual(os.listdir(os.path.join(self.folder, self.keys[0][:2])), [])
+        self.assertEqual(self.cache.get(self.keys[1]), "x" * 100)
+
+    def testTemporaryFilesAreKept(self):
+        # an entry that is being written by another process is neither counted nor removed
+        fd, tmp = tempfile.mkstemp(dir=self.cache.tmpfolder)
+        with os.fdopen(fd, 'wb') as tmpfd:
+            tmpfd.write("z" * 1000)
+        self.cache.put(self.keys[0], "x" * 100)
+
+        self.cache.evict()
+        self.assertTrue(os.path.isfile(tmp))
+        self.assertEqual(self.cache.get(self.keys[0]), "x" * 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
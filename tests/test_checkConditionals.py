@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+'''Tests of the check for unbalanced conditionals (preparations/checkConditionals.py).
+Run all tests from the root folder of cppstats with: python -m unittest discover tests'''
+
+
+# #################################################
+# imports from the std-library
+
+import unittest
+
+
+# #################################################
+# imports from subfolders
+
+from preparations.checkConditionals import checkConditionals, checkDirectives, UnbalancedConditionalsError
+from preparations.deleteComments import deleteComments
+
+
+# #################################################
+# balance of conditionals
+
+class CheckConditionalsTest(unittest.TestCase):
+
+    def assertBalanced(self, source):
+        checkConditionals(source)
+        checkDirectives(deleteComments(source))
+
+    def assertUnbalanced(self, source, line, message):
+        for check in (checkConditionals, lambda source: checkDirectives(deleteComments(source))):
+            with self.assertRaises(UnbalancedConditionalsError) as context:
+                check(source)
+            self.assertEqual((context.exception.line, context.exception.message), (line, message))
+
+    def testBalanced(self):
+        self.assertBalanced("")
+        self.assertBalanced("int a;\n")
+        self.assertBalanced("#if A\n#ifdef B\n#elif C\n#else\n#endif\n#endif\n")
+        self.assertBalanced("  #  ifndef A\n\t#\tendif")
+        self.assertBalanced("#if A\r\n#endif\r\n")
+
+    def testUnbalanced(self):
+        self.assertUnbalanced("#endif\n", 1, "#endif without #if")
+        self.assertUnbalanced("#if A\n#endif\n#else\n", 3, "#else without #if")
+        self.assertUnbalanced("#if A\n#elif B\n#endif\n#elif C\n", 4, "#elif without #if")
+        self.assertUnbalanced("#if A\nint a;\n#if B\n#endif\n", 1, "#if without #endif")
+        self.assertUnbalanced("#if A\n#endif\n#ifdef B\nint b;\n", 3, "#if without #endif")
+
+    def testOtherDirectives(self):
+        self.assertBalanced("#include <a.h>\n#define endif\n#ifx\n#pragma if\n#endiff\n")
+        self.assertUnbalanced("#ifdef A\n#define B\n#endiff\n", 1, "#if without #endif")
+
+    def testComments(self):
+        # directives in comments do not count, but the lines of the comments do
+        self.assertBalanced("/* #if A */\n// #endif\n")
+        self.assertBalanced("#if A /* #endif */\n#endif // #if B\n")
+        self.assertUnbalanced("/*\n#if A\n*/\n#endif\n", 4, "#endif without #if")
+        self.assertUnbalanced("// comment \\\n#endif\n#endif\n", 3, "#endif without #if")
+
+    def testLiterals(self):
+        # comment delimiters in literals do not start comments
+        self.assertUnbalanced('char *s = "/*";\n#endif\nchar *t = "*/";\n', 2, "#endif without #if")
+        self.assertUnbalanced("char c = '\"';\n#endif\n", 2, "#endif without #if")
+
+    def testContinuedLines(self):
+        # a continued line is no directive of its own (also with blanks after the backslash),
+        # and the lines of a continued directive are counted
+        self.assertBalanced("#if A \\\n  && B\n#endif\n")
+        self.assertBalanced("int a = 1 + \\\n#endif\n2;\n")
+        self.assertBalanced("int a = 1 + \\ \t\n#endif\n2;\n")
+        self.assertBalanced("int a = 1 + \\\r\n#endif\r\n2;\r\n")
+        self.assertUnbalanced("#if A \\\n  && B \\ \n  && C\n#endif\n#endif\n", 5, "#endif without #if")
+        self.assertUnbalanced("int a = \\\n\\\n1;\n#if A\n", 4, "#if without #endif")
+        self.assertUnbalanced("#endif \\", 1, "#endif without #if")
+
+
+if __name__ == '__main__':
+    unittest.main()
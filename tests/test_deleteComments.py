@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# cppstats is a suite of analyses for measuring C preprocessor-based
+# variability in software product lines.
+# Copyright (C) 2015 University of Passau, Germany
+#
+# This program is free software: you can redistribute it and/or modify it
+# under the terms of the GNU Lesser General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program.  If not, see
+# <http://www.gnu.org/licenses/>.
+
+
+
+'''Tests of the comment stripper (preparations/deleteComments.py).
+Run all tests from the root folder of cppstats with: python -m unittest discover tests'''
+
+
+# #################################################
+# imports from the std-library
+
+import unittest
+
+
+# #################################################
+# imports from subfolders
+
+from preparations.deleteComments import deleteComments
+
+
+# #################################################
+# deletion of comments
+
+class DeleteCommentsTest(unittest.TestCase):
+
+    def testNoComments(self):
+        for source in ("", "int a;\n", "#if A\nint a = 1 / 2 * 3;\n#endif", "a\r\nb\r\n"):
+            self.assertEqual(deleteComments(source), source)
+
+    def testBlockComments(self):
+        # a comment is replaced by its line breaks, the rest of the lines is kept
+        self.assertEqual(deleteComments("int a; /* foo */\n"), "int a; \n")
+        self.assertEqual(deleteComments("a/**/b"), "ab")
+        self.assertEqual(deleteComments("int a; /* foo\n   bar */ int b;\n"), "int a; \n int b;\n")
+        self.assertEqual(deleteComments("/* a /* b */ c */"), " c */")
+        self.assertEqual(deleteComments("/* // */ a"), " a")
+
+    def testLineComments(self):
+        self.assertEqual(deleteComments("int a; // foo\nint b;\n"), "int a; \nint b;\n")
+        self.assertEqual(deleteComments("// /* foo\nint b; // */\n"), "\nint b; \n")
+        self.assertEqual(deleteComments("a // foo"), "a ")
+        self.assertEqual(deleteComments("a // foo\r\nb"), "a \nb")
+
+    def testContinuedLineComments(self):
+        # a line comment ending in a backslash continues on the next line
+        self.assertEqual(deleteComments("// foo \\\n#endif\nint a;\n"), "\n\nint a;\n")
+        self.assertEqual(deleteComments("// foo \\\n\\\n#endif\nint a;\n"), "\n\n\nint a;\n")
+        self.assertEqual(deleteComments("// foo \\\r\n#endif\r\nint a;\r\n"), "\n\nint a;\r\n")
+
+    def testLiterals(self):
+        # comment delimiters in string and character literals do not start comments
+        for source in ('char *s = "/* foo */";\n', 'char *s = "// foo";\n', "char c = '/';\n",
+                       'char *s = "\\"/*";\n', 'char *s = "a\\\n/* b */";\n', "char c = '\\'';\n"):
+            self.assertEqual(deleteComments(source), source)
+        self.assertEqual(deleteComments('"/*" /* "*/" */'), '"/*" " */')
+        self.assertEqual(deleteComments("'\"' /* \" */ '\"'"), "'\"'  '\"'")
+
+    def testUnterminated(self):
+        # an unterminated block comment ends at the end of the file,
+        # an unterminated literal at the line break
+        self.assertEqual(deleteComments("int a; /* foo\nbar\n"), "int a; \n\n")
+        self.assertEqual(deleteComments('char *s = "foo;\n/* bar */\n'), 'char *s = "foo;\n\n')
+        self.assertEqual(deleteComments("char c = ';\n/* bar */\n"), "char c = ';\n\n")
+
+
+if __name__ == '__main__':
+    unittest.main()